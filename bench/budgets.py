@@ -0,0 +1,379 @@
+"""
+Check that every endpoint stays within a fixed budget of database queries and
+upstream (Rehive and Stripe) requests, however much data there is.
+
+Creates a throwaway test database and starts the fake upstreams
+(`bench.upstream`), then requests each endpoint with datasets of increasing
+size (`SIZES` sessions, payments, users, currencies and profiles, all on one
+page). Exits with a non-zero status if any endpoint goes over its budget, so
+that N+1 queries fail the build before they are deployed. Endpoints without a
+budget (that are not in `EXCLUDED`) fail the check too.
+
+Usage (from the repository root): python -m bench.budgets
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+from bench.run import ROOT, SRC, start, wait_until_up, webhook_request
+
+
+SIZES = (1, 25, 100)
+BATCH_SIZE = 5
+
+# Maximum (database queries, Rehive requests, Stripe requests) per request.
+# The cache (eg. circuit breakers) is in memory, as it is with memcached, so
+# its calls are not counted.
+BUDGETS = {
+    'user-view': (3, 1, 0),
+    'user-company-view': (3, 1, 0),
+    'user-sessions-list': (4, 1, 0),
+    'user-sessions-create': (3, 1, 1),
+    'user-sessions-view': (3, 1, 0),
+    'user-payments-list': (4, 1, 0),
+    'user-payments-create': (5, 1, 2),
+    'user-payments-view': (3, 1, 0),
+    'user-payments-wait': (4, 1, 0),
+    'user-payment-methods-list': (2, 1, 1),
+    'user-payment-methods-view': (2, 1, 1),
+    'admin-company-view': (3, 1, 0),
+    'admin-users-list': (4, 1, 0),
+    'admin-users-view': (4, 1, 0),
+    'admin-user-payment-methods-list': (4, 1, 1),
+    'admin-user-payment-method-view': (4, 1, 1),
+    'admin-currencies-list': (4, 1, 0),
+    'admin-currencies-view': (3, 1, 0),
+    'admin-payments-list': (4, 1, 0),
+    'admin-payments-view': (3, 1, 0),
+    'admin-payments-changes': (3, 1, 0),
+    # All of the company's payments (and sessions) by id.
+    'user-sessions-batch': (3, 1, 0),
+    'user-payments-batch': (3, 1, 0),
+    'admin-payments-batch': (3, 1, 0),
+    # A batch of `BATCH_SIZE` payments.
+    'admin-payments-batch-create': (7, 1, 5),
+    'admin-profiles-list': (2, 1, 0),
+    'admin-profiles-view': (2, 1, 0),
+    'webhook': (9, 1, 0),
+}
+
+# Endpoints (URL names) that are not checked, with the reason why. Every
+# other endpoint must have a budget.
+EXCLUDED = {
+    'activate': 'One-off company setup, which syncs all Rehive currencies.',
+    'deactivate': 'Deactivates the benchmark company.',
+}
+
+
+class Dataset:
+    """
+    The benchmark company with `size` sessions and payments for its user, and
+    `size` users and currencies. Grows in place as the size increases.
+    """
+
+    def __init__(self):
+        from bench import factories, upstream
+
+        self.company = factories.company_factory(
+            upstream.COMPANY, upstream.ADMIN
+        )
+        self.currency = factories.currency_factory(self.company, 'USD')
+        self.user = factories.user_factory(
+            self.company,
+            identifier=upstream.USER,
+            stripe_customer_id=upstream.CUSTOMER
+        )
+        self.sessions = []
+        self.payments = []
+        self.users = [self.user]
+        self.currencies = [self.currency]
+        self.profiles = []
+
+    def grow(self, size):
+        from bench import factories
+
+        while len(self.sessions) < size:
+            self.sessions.append(factories.session_factory(self.user))
+        while len(self.payments) < size:
+            self.payments.append(
+                factories.payment_factory(self.user, self.currency)
+            )
+        while len(self.users) < size:
+            self.users.append(factories.user_factory(self.company))
+        while len(self.currencies) < size:
+            self.currencies.append(factories.currency_factory(
+                self.company, 'C{}'.format(len(self.currencies))
+            ))
+        while len(self.profiles) < size:
+            self.profiles.append(factories.profile_factory(self.company))
+
+
+def get_request(data, name):
+    """
+    Get the request to make for a budget as a tuple of the method, path, body
+    and headers.
+    """
+
+    from bench import factories, upstream
+
+    if name == 'webhook':
+        # An event for a payment that is still processing.
+        body, headers = webhook_request(
+            factories.payment_factory(data.user, data.currency).identifier
+        )
+        return 'post', '/api/webhook/{}/'.format(upstream.COMPANY), body, {
+            'HTTP_STRIPE_SIGNATURE': headers['Stripe-Signature'],
+            'content_type': headers['Content-Type'],
+        }
+
+    user = {'HTTP_AUTHORIZATION': 'Token bench'}
+    admin = {'HTTP_AUTHORIZATION': 'Token {}'.format(upstream.ADMIN_TOKEN)}
+    page = '?page_size={}'.format(max(SIZES))
+    payment = data.payments[0].identifier
+    payments = ','.join(p.identifier for p in data.payments)
+    sessions = ','.join(s.identifier for s in data.sessions)
+
+    return {
+        'user-view': ('get', '/api/user/', None, user),
+        'user-company-view': ('get', '/api/user/company/', None, user),
+        'user-sessions-list': ('get', '/api/user/sessions/' + page, None, user),
+        'user-sessions-create': ('post', '/api/user/sessions/', {
+            'mode': 'setup',
+            'success_url': 'https://example.com',
+            'cancel_url': 'https://example.com',
+        }, user),
+        'user-sessions-view': (
+            'get', '/api/user/sessions/{}/'.format(
+                data.sessions[0].identifier
+            ), None, user
+        ),
+        'user-payments-list': ('get', '/api/user/payments/' + page, None, user),
+        'user-payments-create': ('post', '/api/user/payments/', {
+            'currency': 'USD',
+            'amount': 1000,
+            'payment_method': 'pm_bench',
+            'return_url': 'https://example.com',
+        }, user),
+        'user-payments-view': (
+            'get', '/api/user/payments/{}/'.format(payment), None, user
+        ),
+        'user-payments-wait': (
+            'get', '/api/user/payments/{}/wait/?timeout=0'.format(payment),
+            None, user
+        ),
+        'user-payment-methods-list': (
+            'get', '/api/user/payment-methods/', None, user
+        ),
+        'user-payment-methods-view': (
+            'get', '/api/user/payment-methods/pm_bench/', None, user
+        ),
+        'admin-company-view': ('get', '/api/admin/company/', None, admin),
+        'admin-users-list': ('get', '/api/admin/users/' + page, None, admin),
+        'admin-users-view': (
+            'get', '/api/admin/users/{}/'.format(upstream.USER), None, admin
+        ),
+        'admin-user-payment-methods-list': (
+            'get', '/api/admin/users/{}/payment-methods/'.format(
+                upstream.USER
+            ), None, admin
+        ),
+        'admin-user-payment-method-view': (
+            'get', '/api/admin/users/{}/payment-methods/pm_bench/'.format(
+                upstream.USER
+            ), None, admin
+        ),
+        'admin-currencies-list': (
+            'get', '/api/admin/currencies/' + page, None, admin
+        ),
+        'admin-currencies-view': (
+            'get', '/api/admin/currencies/USD/', None, admin
+        ),
+        'admin-payments-list': (
+            'get', '/api/admin/payments/' + page, None, admin
+        ),
+        'admin-payments-view': (
+            'get', '/api/admin/payments/{}/'.format(payment), None, admin
+        ),
+        'admin-payments-changes': (
+            'get', '/api/admin/payments/changes/' + page, None, admin
+        ),
+        'user-sessions-batch': (
+            'get', '/api/user/sessions/batch/?ids=' + sessions, None, user
+        ),
+        'user-payments-batch': (
+            'get', '/api/user/payments/batch/?ids=' + payments, None, user
+        ),
+        'admin-payments-batch': (
+            'get', '/api/admin/payments/batch/?ids=' + payments, None, admin
+        ),
+        'admin-profiles-list': ('get', '/api/admin/profiles/', None, admin),
+        'admin-profiles-view': (
+            'get', '/api/admin/profiles/{}/'.format(data.profiles[0]), None,
+            admin
+        ),
+        'admin-payments-batch-create': ('post', '/api/admin/payments/batch/', {
+            'payments': [{
+                'user': upstream.USER,
+                'currency': 'USD',
+                'amount': 1000,
+                'payment_method': 'pm_bench',
+                'return_url': 'https://example.com',
+                'idempotency_key': 'bench-{}'.format(i),
+            } for i in range(BATCH_SIZE)],
+        }, admin),
+    }[name]
+
+
+def measure(client, method, path, body, headers):
+    """
+    Make a request and get the number of database queries, Rehive requests
+    and Stripe requests it made.
+    """
+
+    kwargs = dict(headers)
+    if body is not None and 'content_type' not in kwargs:
+        kwargs['content_type'] = 'application/json'
+
+    response = getattr(client, method)(path, body, **kwargs)
+    if response.status_code >= 400:
+        raise RuntimeError('{} {} failed ({}): {}'.format(
+            method.upper(), path, response.status_code, response.content
+        ))
+
+    timings = response.wsgi_request.timings
+    return tuple(
+        timings.get(name, (0, 0))[0] for name in ('db', 'rehive', 'stripe')
+    )
+
+
+def unbudgeted():
+    """
+    Get the names of the endpoints that have no budget and are not excluded.
+    Budgets for other methods of an endpoint are named after it with a
+    suffix (eg. `admin-payments-batch-create`).
+    """
+
+    from service_stripe.urls import urlpatterns
+
+    return sorted({
+        p.name for p in urlpatterns
+        if p.name not in BUDGETS and p.name not in EXCLUDED
+    })
+
+
+def check(names):
+    from django.test import Client
+
+    client = Client()
+    data = Dataset()
+    counts = {name: [] for name in names}
+
+    for size in SIZES:
+        data.grow(size)
+        for name in names:
+            # Make the request twice so that one-off work (eg. filling
+            # caches) is not counted.
+            measure(client, *get_request(data, name))
+            counts[name].append(measure(client, *get_request(data, name)))
+
+    failed = False
+    row = '{:<34}{:>12}  {:<36}{}'
+    print(row.format('endpoint', 'budget', 'db/rehive/stripe by size', ''))
+    for name in names:
+        budget = BUDGETS[name]
+        over = [
+            c for c in counts[name]
+            if any(n > b for n, b in zip(c, budget))
+        ]
+        failed = failed or bool(over)
+        print(row.format(
+            name,
+            '/'.join(str(b) for b in budget),
+            '  '.join('/'.join(str(n) for n in c) for c in counts[name]),
+            'OVER BUDGET' if over else 'ok'
+        ))
+
+    return not failed
+
+
+def close_connections():
+    """
+    Close the other connections to the test database (eg. the payment
+    listener's) so that it can be dropped.
+    """
+
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT pg_terminate_backend(pid) FROM pg_stat_activity '
+            'WHERE datname = current_database() AND pid <> pg_backend_pid()'
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    # Only check some of the endpoints.
+    parser.add_argument('names', nargs='*')
+    parser.add_argument('--upstream-port', type=int, default=8100)
+    args = parser.parse_args()
+
+    unknown = set(args.names) - set(BUDGETS)
+    if unknown:
+        parser.error('Unknown endpoints: {}'.format(', '.join(sorted(unknown))))
+
+    upstream_url = 'http://127.0.0.1:{}'.format(args.upstream_port)
+    profiles_dir = tempfile.mkdtemp(prefix='bench-profiles-')
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join([SRC, ROOT]),
+        DJANGO_SETTINGS_MODULE='bench.settings',
+        BENCH_LATENCY='0',
+        # Include the payments that were just created in the change feed.
+        PAYMENT_CHANGES_DELAY='0',
+        PROFILING_DIR=profiles_dir,
+        BENCH_UPSTREAM_URL=upstream_url,
+        REHIVE_API_URL=upstream_url + '/3/',
+    )
+    os.environ.update(env)
+    sys.path[:0] = [SRC, ROOT]
+
+    import django
+    from django.test.utils import (
+        setup_databases, setup_test_environment, teardown_databases
+    )
+    django.setup()
+
+    missing = unbudgeted()
+    if missing:
+        shutil.rmtree(profiles_dir, ignore_errors=True)
+        parser.error(
+            'Endpoints without a budget (add them to BUDGETS or EXCLUDED): '
+            '{}'.format(', '.join(missing))
+        )
+
+    upstream = start([
+        sys.executable, '-m', 'uvicorn', 'bench.upstream:app',
+        '--port', str(args.upstream_port), '--log-level', 'warning'
+    ], env)
+
+    setup_test_environment()
+    databases = setup_databases(verbosity=0, interactive=False)
+    try:
+        wait_until_up(upstream_url)
+        passed = check(args.names or list(BUDGETS))
+    finally:
+        close_connections()
+        teardown_databases(databases, verbosity=0)
+        upstream.terminate()
+        upstream.wait()
+        shutil.rmtree(profiles_dir, ignore_errors=True)
+
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Factories for the models, used to create datasets of a given size.
+"""
+
+import cProfile
+import uuid
+
+from service_stripe.enums import PaymentStatus, SessionMode
+from service_stripe.models import Company, Currency, Payment, Session, User
+from service_stripe.utils import profiling
+
+
+def company_factory(identifier, admin_identifier, **kwargs):
+    admin = User.objects.create(identifier=admin_identifier)
+    company = Company.objects.create(
+        identifier=identifier,
+        admin=admin,
+        active=True,
+        stripe_api_key='sk_bench',
+        stripe_secret='whsec_bench',
+        stripe_publishable_api_key='pk_bench',
+        **kwargs
+    )
+    admin.company = company
+    admin.save()
+    return company
+
+
+def user_factory(company, **kwargs):
+    kwargs.setdefault('identifier', uuid.uuid4())
+    kwargs.setdefault('stripe_customer_id', 'cus_{}'.format(uuid.uuid4().hex))
+    return User.objects.create(company=company, **kwargs)
+
+
+def currency_factory(company, code, **kwargs):
+    kwargs.setdefault('divisibility', 2)
+    currency = Currency.objects.create(company=company, code=code, **kwargs)
+    company.stripe_currencies.add(currency)
+    return currency
+
+
+def session_factory(user, **kwargs):
+    kwargs.setdefault('identifier', 'cs_{}'.format(uuid.uuid4().hex))
+    kwargs.setdefault('mode', SessionMode.SETUP)
+    return Session.objects.create(
+        user=user,
+        success_url='https://example.com',
+        cancel_url='https://example.com',
+        **kwargs
+    )
+
+
+def payment_factory(user, currency, **kwargs):
+    kwargs.setdefault('identifier', 'pi_{}'.format(uuid.uuid4().hex))
+    kwargs.setdefault('status', PaymentStatus.PROCESSING)
+    return Payment.objects.create(
+        user=user,
+        currency=currency,
+        amount=10,
+        payment_method='pm_bench',
+        return_url='https://example.com',
+        **kwargs
+    )
+
+
+def profile_factory(company, **kwargs):
+    """
+    Store an (empty) request profile for the company, returns its id.
+    """
+
+    metadata = {
+        'company': company.identifier,
+        'method': 'GET',
+        'path': '/api/admin/company/',
+        'endpoint': 'admin-company-view',
+        'status': 200,
+        'duration': 0.01,
+        'reason': 'requested',
+        'timings': {},
+    }
+    metadata.update(kwargs)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    profiler.disable()
+    return profiling.save_profile(profiler, metadata)
@@ -0,0 +1,416 @@
+"""
+Benchmark the service in its WSGI and ASGI deployment modes against fake
+upstreams, fully offline.
+
+Starts the fake upstreams (`bench.upstream`), creates the benchmark company,
+user and a pool of processing payments, then serves the service with
+gunicorn in each mode and loads it with a fixed number of concurrent
+clients. Clients request a single endpoint or a weighted mix of endpoints
+(`MIXES`), optionally alongside bursts of signed webhook events. Throughput
+and p50/p95/p99 latency are reported per endpoint.
+
+Usage (from the repository root, with a migrated database):
+
+    python -m bench.run --endpoint payment-methods --latency 0.2 \\
+        --concurrency 100 --duration 20 --workers 2
+
+    python -m bench.run --endpoint mixed --latency 0.1 --jitter 0.05 \\
+        --error-rate 0.01 --webhook-burst 50 --webhook-interval 2
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+
+import httpx
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+
+# Signing secret of the benchmark company's webhook endpoint.
+WEBHOOK_SECRET = 'whsec_bench'
+
+ENDPOINTS = {
+    'payment-methods': ('GET', '/api/user/payment-methods/', None),
+    'payments-list': ('GET', '/api/user/payments/', None),
+    'payment': ('GET', '/api/user/payments/{payment}/', None),
+    'user': ('GET', '/api/user/', None),
+    'payments': ('POST', '/api/user/payments/', {
+        'currency': 'USD',
+        'amount': 1000,
+        'payment_method': 'pm_bench',
+        'return_url': 'https://example.com',
+    }),
+    'sessions': ('POST', '/api/user/sessions/', {
+        'mode': 'setup',
+        'success_url': 'https://example.com',
+        'cancel_url': 'https://example.com',
+    }),
+    # Signed Stripe event for a random payment (see `webhook_request`).
+    'webhook': ('POST', '/api/webhook/{company}/', None),
+}
+
+# Weighted mixes of endpoints. All user endpoints authenticate with Rehive.
+MIXES = {
+    'reads': {'payments-list': 3, 'payment': 3, 'payment-methods': 2, 'user': 2},
+    'writes': {'payments': 3, 'sessions': 1},
+    'mixed': {
+        'payments-list': 3, 'payment': 3, 'payment-methods': 2, 'user': 1,
+        'payments': 2, 'sessions': 1,
+    },
+}
+
+# Processing payments that webhook events and payment lookups are made for.
+PAYMENT_POOL = 1000
+
+MODES = {
+    'wsgi': ['config.wsgi:application'],
+    'asgi': [
+        'config.asgi:application',
+        '--worker-class', 'uvicorn.workers.UvicornWorker'
+    ],
+}
+
+
+def setup_data():
+    import django
+    django.setup()
+
+    from service_stripe.models import Company, Currency, User
+    from bench import upstream
+
+    admin, _ = User.objects.get_or_create(identifier=upstream.ADMIN)
+    company, _ = Company.objects.update_or_create(
+        identifier=upstream.COMPANY,
+        defaults={
+            'admin': admin,
+            'active': True,
+            'stripe_api_key': 'sk_bench',
+            'stripe_secret': WEBHOOK_SECRET,
+            'stripe_publishable_api_key': 'pk_bench',
+        }
+    )
+    admin.company = company
+    admin.save()
+    currency, _ = Currency.objects.get_or_create(company=company, code='USD')
+    company.stripe_currencies.add(currency)
+    user, _ = User.objects.update_or_create(
+        identifier=upstream.USER,
+        defaults={'company': company, 'stripe_customer_id': upstream.CUSTOMER}
+    )
+    setup_payments(user, currency)
+
+
+def pool_identifier(i):
+    return 'pi_bench_{:05d}'.format(i)
+
+
+def setup_payments(user, currency):
+    """
+    Create the payments in the pool that do not exist yet.
+    """
+
+    from service_stripe.models import Payment
+
+    existing = set(Payment.objects.filter(
+        identifier__startswith='pi_bench_'
+    ).values_list('identifier', flat=True))
+    Payment.objects.bulk_create([
+        Payment(
+            identifier=pool_identifier(i),
+            company_id=user.company_id,
+            user=user,
+            currency=currency,
+            amount=10,
+            payment_method='pm_bench',
+            return_url='https://example.com',
+        )
+        for i in range(PAYMENT_POOL) if pool_identifier(i) not in existing
+    ])
+
+
+def reset_payments():
+    """
+    Put the payments in the pool back in processing, so that webhook events
+    for them do the same work on every run.
+    """
+
+    from service_stripe.enums import PaymentStatus
+    from service_stripe.models import Payment
+
+    Payment.objects.filter(identifier__startswith='pi_bench_').update(
+        status=PaymentStatus.PROCESSING, collection=None, txns=[], error=None
+    )
+
+
+def webhook_request(identifier):
+    """
+    Build a signed `payment_intent.succeeded` event for the payment with the
+    `identifier`. Returns the body and headers.
+    """
+
+    from bench import upstream
+
+    now = int(time.time())
+    body = json.dumps({
+        'id': 'evt_{}'.format(uuid.uuid4().hex),
+        'object': 'event',
+        'type': 'payment_intent.succeeded',
+        'created': now,
+        'data': {'object': {
+            'id': identifier,
+            'object': 'payment_intent',
+            'status': 'succeeded',
+            'customer': upstream.CUSTOMER,
+            'latest_charge': 'ch_{}'.format(uuid.uuid4().hex),
+        }},
+    })
+    signature = hmac.new(
+        WEBHOOK_SECRET.encode(),
+        '{}.{}'.format(now, body).encode(),
+        hashlib.sha256
+    ).hexdigest()
+
+    return body, {
+        'Content-Type': 'application/json',
+        'Stripe-Signature': 't={},v1={}'.format(now, signature),
+    }
+
+
+def start(args, env):
+    return subprocess.Popen(args, cwd=SRC, env=env)
+
+
+def wait_until_up(url, timeout=30):
+    until = time.time() + timeout
+    while time.time() < until:
+        try:
+            httpx.get(url + '/healthz', timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError('{} did not start.'.format(url))
+
+
+class Stats:
+    """
+    Latencies of successful requests and counts of errors per endpoint.
+    """
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, endpoint, status, latency):
+        if status in (200, 201):
+            self.latencies.setdefault(endpoint, []).append(latency)
+        else:
+            errors = self.errors.setdefault(endpoint, {})
+            errors[status] = errors.get(status, 0) + 1
+
+    @property
+    def endpoints(self):
+        return sorted(set(self.latencies) | set(self.errors))
+
+
+async def send(http, url, endpoint, stats):
+    from bench import upstream
+
+    method, path, data = ENDPOINTS[endpoint]
+    path = path.format(
+        payment=pool_identifier(random.randrange(PAYMENT_POOL)),
+        company=upstream.COMPANY
+    )
+
+    if endpoint == 'webhook':
+        body, headers = webhook_request(
+            pool_identifier(random.randrange(PAYMENT_POOL))
+        )
+        kwargs = {'content': body, 'headers': headers}
+    else:
+        kwargs = {'json': data, 'headers': {'Authorization': 'Token bench'}}
+
+    start = time.monotonic()
+    try:
+        response = await http.request(method, url + path, **kwargs)
+        status = response.status_code
+    except httpx.HTTPError as exc:
+        status = type(exc).__name__
+    stats.record(endpoint, status, time.monotonic() - start)
+
+
+async def load(url, weights, concurrency, duration, burst, burst_interval):
+    """
+    Send requests for random endpoints (by weight) from `concurrency`
+    clients, plus `burst` concurrent webhook events every `burst_interval`
+    seconds.
+    """
+
+    stats = Stats()
+    endpoints, weights = zip(*weights.items()) if weights else ((), ())
+    until = time.monotonic() + duration
+
+    async def client(http):
+        while time.monotonic() < until:
+            endpoint = random.choices(endpoints, weights)[0]
+            await send(http, url, endpoint, stats)
+
+    async def bursts(http):
+        while time.monotonic() < until:
+            await asyncio.gather(*(
+                send(http, url, 'webhook', stats) for _ in range(burst)
+            ))
+            await asyncio.sleep(burst_interval)
+
+    tasks = []
+    limits = httpx.Limits(max_connections=concurrency + burst)
+    async with httpx.AsyncClient(limits=limits, timeout=60) as http:
+        if endpoints:
+            tasks.extend(client(http) for _ in range(concurrency))
+        if burst:
+            tasks.append(bursts(http))
+        await asyncio.gather(*tasks)
+
+    return stats
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0
+
+
+def report(args, results):
+    print('\n{} at {:.0f}ms upstream latency (+/- {:.0f}ms, {:.0%} errors), '
+          '{} clients, {} workers ({} threads per WSGI worker)'.format(
+              args.endpoint, args.latency * 1000, args.jitter * 1000,
+              args.error_rate, args.concurrency, args.workers,
+              args.wsgi_threads
+          ))
+    if args.webhook_burst:
+        print('Webhook bursts of {} every {}s'.format(
+            args.webhook_burst, args.webhook_interval
+        ))
+
+    header = '{:<6}{:<18}{:>10}{:>10}{:>10}{:>10}  {}'
+    row = '{:<6}{:<18}{:>10.1f}{:>10.0f}{:>10.0f}{:>10.0f}  {}'
+    print(header.format(
+        'mode', 'endpoint', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'
+    ))
+    for mode, stats in results:
+        for endpoint in stats.endpoints + ['total']:
+            if endpoint == 'total':
+                latencies = sum(stats.latencies.values(), [])
+                errors = sum(sum(e.values()) for e in stats.errors.values())
+            else:
+                latencies = stats.latencies.get(endpoint, [])
+                errors = stats.errors.get(endpoint)
+            latencies.sort()
+
+            print(row.format(
+                mode,
+                endpoint,
+                len(latencies) / args.duration,
+                percentile(latencies, 0.5) * 1000,
+                percentile(latencies, 0.95) * 1000,
+                percentile(latencies, 0.99) * 1000,
+                errors or '-'
+            ))
+            # Only name the mode on its first row.
+            mode = ''
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    # An endpoint, or a mix of endpoints.
+    parser.add_argument(
+        '--endpoint', choices=list(ENDPOINTS) + list(MIXES),
+        default='payment-methods'
+    )
+    parser.add_argument('--mode', choices=list(MODES) + ['both'], default='both')
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--jitter', type=float, default=0)
+    # Fraction of upstream requests that fail.
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--workers', type=int, default=2)
+    # Threads per WSGI worker, 1 serves one request at a time per worker.
+    parser.add_argument('--wsgi-threads', type=int, default=20)
+    # Concurrent webhook events sent every interval (0 sends none).
+    parser.add_argument('--webhook-burst', type=int, default=0)
+    parser.add_argument('--webhook-interval', type=float, default=1)
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--upstream-port', type=int, default=8100)
+    args = parser.parse_args()
+
+    weights = MIXES.get(args.endpoint, {args.endpoint: 1})
+    if args.endpoint == 'webhook':
+        weights, args.concurrency = {}, 0
+        args.webhook_burst = args.webhook_burst or 50
+
+    upstream_url = 'http://127.0.0.1:{}'.format(args.upstream_port)
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join([SRC, ROOT]),
+        DJANGO_SETTINGS_MODULE='bench.settings',
+        BENCH_LATENCY=str(args.latency),
+        BENCH_JITTER=str(args.jitter),
+        BENCH_ERROR_RATE=str(args.error_rate),
+        BENCH_UPSTREAM_URL=upstream_url,
+        REHIVE_API_URL=upstream_url + '/3/',
+        BULKHEAD_SLOTS=str(args.concurrency + args.webhook_burst),
+        GUNICORN_WORKERS=str(args.workers),
+        GUNICORN_THREADS=str(args.wsgi_threads),
+    )
+    os.environ.update(env)
+    sys.path[:0] = [SRC, ROOT]
+    setup_data()
+
+    upstream = start([
+        sys.executable, '-m', 'uvicorn', 'bench.upstream:app',
+        '--port', str(args.upstream_port), '--log-level', 'warning'
+    ], env)
+
+    modes = list(MODES) if args.mode == 'both' else [args.mode]
+    url = 'http://127.0.0.1:{}'.format(args.port)
+    results = []
+
+    try:
+        wait_until_up(upstream_url)
+        for mode in modes:
+            reset_payments()
+            server = start([
+                'gunicorn', *MODES[mode],
+                '--config', 'file:config/gunicorn.py',
+                '--bind', '127.0.0.1:{}'.format(args.port),
+                '--log-level', 'warning'
+            ], env)
+            try:
+                wait_until_up(url)
+                loop = asyncio.get_event_loop()
+                stats = loop.run_until_complete(load(
+                    url, weights, args.concurrency, args.duration,
+                    args.webhook_burst, args.webhook_interval
+                ))
+            finally:
+                server.terminate()
+                server.wait()
+
+            results.append((mode, stats))
+    finally:
+        upstream.terminate()
+        upstream.wait()
+
+    report(args, results)
+
+
+if __name__ == '__main__':
+    main()
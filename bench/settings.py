@@ -0,0 +1,33 @@
+"""
+Settings used to benchmark the service against the fake upstreams in
+`bench.upstream`.
+"""
+
+import os
+
+import stripe
+
+from config.settings import *
+
+
+stripe.api_base = os.environ['BENCH_UPSTREAM_URL']
+
+# The service's own rate and concurrency limits would cap the throughput
+# being measured (the bulkhead size is set by `bench.run`).
+REST_FRAMEWORK = dict(
+    REST_FRAMEWORK,
+    DEFAULT_THROTTLE_CLASSES=(),
+    DEFAULT_THROTTLE_RATES=dict(
+        REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], default_token=None
+    )
+)
+LOAD_SHEDDING_MAX_IN_FLIGHT = 0
+
+# Stands in for the shared cache (the state is not shared between workers,
+# which the disabled limits above do not need).
+if not (os.environ.get('CACHE_BACKEND') or os.environ.get('CACHE_LOCATION')):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
@@ -0,0 +1,148 @@
+"""
+Fake Rehive and Stripe APIs that respond after a configurable latency and
+fail a configurable fraction of requests.
+
+Run with: BENCH_LATENCY=0.2 uvicorn bench.upstream:app --port 8100
+
+* BENCH_LATENCY: seconds to wait before responding.
+* BENCH_REHIVE_LATENCY, BENCH_STRIPE_LATENCY: override the latency of one of
+  the APIs.
+* BENCH_JITTER: the latency varies randomly by up to this many seconds.
+* BENCH_ERROR_RATE: fraction of requests that fail with a 500 error.
+"""
+
+import asyncio
+import json
+import os
+import random
+import re
+import time
+import uuid
+
+
+LATENCY = float(os.environ.get('BENCH_LATENCY', 0.2))
+REHIVE_LATENCY = float(os.environ.get('BENCH_REHIVE_LATENCY', LATENCY))
+STRIPE_LATENCY = float(os.environ.get('BENCH_STRIPE_LATENCY', LATENCY))
+JITTER = float(os.environ.get('BENCH_JITTER', 0))
+ERROR_RATE = float(os.environ.get('BENCH_ERROR_RATE', 0))
+
+COMPANY = 'bench_company'
+ADMIN = '00000000-0000-0000-0000-000000000000'
+USER = '00000000-0000-0000-0000-000000000001'
+# Token that authenticates as the company admin, any other token
+# authenticates as the user.
+ADMIN_TOKEN = 'bench_admin'
+CUSTOMER = 'cus_bench'
+
+PAYMENT_METHOD = {
+    'id': 'pm_bench',
+    'object': 'payment_method',
+    'type': 'card',
+    'customer': CUSTOMER,
+    'card': {
+        'brand': 'visa',
+        'country': 'US',
+        'last4': '4242',
+        'exp_month': 12,
+        'exp_year': 2030,
+    },
+}
+
+
+def collection(identifier, status):
+    return {
+        'status': 'success',
+        'data': {
+            'id': identifier,
+            'status': status,
+            'transactions': [{'id': str(uuid.uuid4()), 'status': status}],
+        },
+    }
+
+
+def route(method, path, token=None):
+    if path == '/3/auth/':
+        admin = token == ADMIN_TOKEN
+        return {
+            'status': 'success',
+            'data': {
+                'id': ADMIN if admin else USER,
+                'company': COMPANY,
+                'groups': [{'name': 'admin' if admin else 'user'}],
+            },
+        }
+
+    if method == 'POST' and path == '/3/admin/transaction-collections/':
+        return collection(str(uuid.uuid4()), 'complete')
+
+    match = re.match(r'^/3/admin/transaction-collections/([\w-]+)/$', path)
+    if method == 'PATCH' and match:
+        return collection(match.group(1), 'complete')
+
+    if path == '/v1/payment_methods':
+        return {
+            'object': 'list',
+            'url': path,
+            'has_more': False,
+            'data': [PAYMENT_METHOD],
+        }
+
+    if path == '/v1/payment_methods/{}'.format(PAYMENT_METHOD['id']):
+        return PAYMENT_METHOD
+
+    if method == 'POST' and path == '/v1/customers':
+        return {'id': CUSTOMER, 'object': 'customer'}
+
+    if method == 'POST' and path == '/v1/checkout/sessions':
+        return {'id': 'cs_{}'.format(uuid.uuid4().hex), 'object': 'checkout.session'}
+
+    if method == 'POST' and path == '/v1/payment_intents':
+        return {
+            'id': 'pi_{}'.format(uuid.uuid4().hex),
+            'object': 'payment_intent',
+            'created': int(time.time()),
+            'status': 'processing',
+            'next_action': None,
+        }
+
+    return None
+
+
+async def app(scope, receive, send):
+    if scope['type'] != 'http':
+        return
+
+    # Drain the request body.
+    more_body = True
+    while more_body:
+        message = await receive()
+        more_body = message.get('more_body', False)
+
+    path = scope['path']
+    authorization = dict(scope['headers']).get(b'authorization', b'').split()
+    token = authorization[1].decode() if len(authorization) == 2 else None
+    body = route(scope['method'], path, token)
+    status = 200 if body is not None else 404
+
+    # Health checks are answered right away.
+    if body is not None:
+        rehive = path.startswith('/3/')
+        latency = REHIVE_LATENCY if rehive else STRIPE_LATENCY
+        await asyncio.sleep(max(latency + random.uniform(-JITTER, JITTER), 0))
+
+        if random.random() < ERROR_RATE:
+            status = 500
+            if rehive:
+                body = {'status': 'error', 'message': 'Injected error.'}
+            else:
+                body = {'error': {'type': 'api_error', 'message': 'Injected error.'}}
+
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json')],
+    })
+    await send({
+        'type': 'http.response.body',
+        'body': json.dumps(body or {'status': 'error'}).encode(),
+    })
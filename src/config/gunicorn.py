@@ -4,8 +4,29 @@ import os
 bind = '0.0.0.0:8000'
 # bind = "127.0.0.1:8000"
 workers = os.environ.get('GUNICORN_WORKERS', 5)
+# Threaded workers so that long-polling clients do not tie up a whole worker.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = os.environ.get('GUNICORN_THREADS', 20)
 name = os.environ.get('PROJECT_NAME')
 log_level = 'info'
 log_file = '-'
 pythonpath = '/app/'
 forwarded_allow_ips = '*'
+
+
+def on_starting(server):
+    """
+    Clear metrics left behind by a previous run.
+    """
+
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            os.remove(os.path.join(path, name))
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,42 @@
+import os
+
+
+# Cache
+# ---------------------------------------------------------------------------------------------------------------------
+# Shared across all workers so that circuit breakers, throttles and cached
+# authentication behave consistently. Uses memcached if CACHE_LOCATION is set
+# (comma separated servers), otherwise the database cache (which needs no
+# other server, but adds several queries to every request).
+
+CACHE_LOCATION = os.environ.get('CACHE_LOCATION')
+CACHE_BACKEND = os.environ.get(
+    'CACHE_BACKEND',
+    'django.core.cache.backends.memcached.PyMemcacheCache' if CACHE_LOCATION
+    else 'django.core.cache.backends.db.DatabaseCache'
+)
+
+if 'memcached' in CACHE_BACKEND:
+    # Seconds to wait on memcached, so that an unavailable server does not
+    # hold up requests. Errors are ignored (reads find nothing and writes are
+    # dropped) so that throttles, breakers and bulkheads fail open.
+    cache_timeout = float(os.environ.get('CACHE_SOCKET_TIMEOUT', 0.5))
+    cache_options = {
+        'connect_timeout': cache_timeout,
+        'timeout': cache_timeout,
+        'ignore_exc': True,
+    }
+else:
+    cache_options = {
+        'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 100000)),
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': CACHE_LOCATION or (
+            '127.0.0.1:11211' if 'memcached' in CACHE_BACKEND
+            else 'service_stripe_cache'
+        ),
+        'OPTIONS': cache_options,
+    }
+}
@@ -1,22 +1,66 @@
 import os
 
 options = {
-        'connect_timeout': 25,
-    }
+    'connect_timeout': int(os.environ.get('POSTGRES_CONNECT_TIMEOUT', 25)),
+}
 
 if not os.environ.get('POSTGRES_SSL_DISABLE'):
     options['sslmode'] = 'require'
 
+# Whether connections go through PgBouncer in transaction pooling mode.
+POSTGRES_PGBOUNCER = os.environ.get('POSTGRES_PGBOUNCER') == 'True'
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # Postgres with health checks for persistent connections.
+        'ENGINE': 'service_stripe.backends.postgresql',
         'NAME': os.environ.get('POSTGRES_DB', 'postgres'),
         'USER': os.environ.get('POSTGRES_USER', 'postgres'),
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD', 'postgres'),
         'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
         'PORT': os.environ.get('POSTGRES_PORT', '5432'),
-        'OPTIONS': {
-            'connect_timeout': 25,
-        }
+        'OPTIONS': options,
+        # Seconds to keep a connection open for reuse by later requests (0
+        # closes it at the end of each request). Every worker thread keeps a
+        # connection of its own, so connections are only kept by default
+        # behind PgBouncer.
+        'CONN_MAX_AGE': int(os.environ.get(
+            'POSTGRES_CONN_MAX_AGE', 300 if POSTGRES_PGBOUNCER else 0
+        )),
+        # Server side cursors (used by `QuerySet.iterator()`) cannot be used
+        # across transactions with transaction pooling.
+        'DISABLE_SERVER_SIDE_CURSORS': POSTGRES_PGBOUNCER,
     }
 }
+
+# Seconds a persistent connection can be idle before it is checked with a
+# query before its next use.
+POSTGRES_HEALTH_CHECK_IDLE = int(os.environ.get('POSTGRES_HEALTH_CHECK_IDLE', 10))
+
+# LISTEN (used to wake long-polled payments) needs a session of its own, which
+# PgBouncer does not provide in transaction pooling mode, so the listener
+# connects to Postgres directly.
+PAYMENT_LISTENER_DATABASE = 'default'
+if POSTGRES_PGBOUNCER:
+    DATABASES['direct'] = dict(
+        DATABASES['default'],
+        HOST=os.environ.get('POSTGRES_DIRECT_HOST', DATABASES['default']['HOST']),
+        PORT=os.environ.get('POSTGRES_DIRECT_PORT', '5432'),
+        CONN_MAX_AGE=0,
+        TEST={'MIRROR': 'default'}
+    )
+    PAYMENT_LISTENER_DATABASE = 'direct'
+
+# Read replicas (comma separated hosts) used for listing and detail endpoints.
+# They use the same database name and credentials as the primary.
+DATABASE_REPLICAS = []
+for i, host in enumerate(filter(None, os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(','))):
+    alias = 'replica_{}'.format(i)
+    DATABASES[alias] = dict(DATABASES['default'], HOST=host.strip(), TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['service_stripe.routers.ReplicaRouter']
+
+# Seconds a user's reads stay on the primary after they write, so that they
+# see their own writes despite replication lag.
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
@@ -0,0 +1,32 @@
+import os
+import tempfile
+
+
+# Profiling
+# ---------------------------------------------------------------------------------------------------------------------
+
+# Fraction of requests that are profiled. Admins can also profile a request by
+# sending an `X-Profile: <PROFILING_TOKEN>` header (only if PROFILING_TOKEN is
+# set, since the profiler slows a request down several times).
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')
+
+# Directory the profiles are stored in. Only the latest PROFILING_MAX_PROFILES
+# are kept.
+PROFILING_DIR = os.environ.get(
+    'PROFILING_DIR',
+    os.path.join(tempfile.gettempdir(), 'service_stripe_profiles')
+)
+PROFILING_MAX_PROFILES = int(os.environ.get('PROFILING_MAX_PROFILES', 200))
+
+# Report the time spent on the database and upstreams in a `Server-Timing`
+# header on every response. Profiled requests always get it.
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'False') == 'True'
+
+
+# Metrics
+# ---------------------------------------------------------------------------------------------------------------------
+
+# Token required (in a `Token <METRICS_TOKEN>` authorization header) to read
+# the Prometheus metrics at `/metrics`. Unauthenticated if not set.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
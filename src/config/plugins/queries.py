@@ -0,0 +1,15 @@
+import os
+
+
+# Slow queries
+# ---------------------------------------------------------------------------------------------------------------------
+
+# Queries made by a request that take longer than this (in seconds) are
+# recorded per fingerprint and view (see `manage.py slow_queries`).
+SLOW_QUERY_THRESHOLD = float(os.environ.get('SLOW_QUERY_THRESHOLD', 0.2))
+
+# Fraction of slow queries whose plan is captured with
+# `EXPLAIN (ANALYZE, BUFFERS)`. Analyzing a query runs it again.
+SLOW_QUERY_EXPLAIN_RATE = float(
+    os.environ.get('SLOW_QUERY_EXPLAIN_RATE', 0.05)
+)
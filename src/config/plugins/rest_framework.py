@@ -1,3 +1,5 @@
+import os
+
 from rest_framework.settings import reload_api_settings
 
 ANONYMOUS_USER_ID = -1
@@ -14,6 +16,28 @@ REST_FRAMEWORK = {
         'service_stripe.permissions.IsAuthenticated',
     ),
     'EXCEPTION_HANDLER': 'config.exceptions.custom_exception_handler',
+    'DEFAULT_THROTTLE_CLASSES': (
+        'service_stripe.throttling.UserRateThrottle',
+        'service_stripe.throttling.CompanyRateThrottle',
+    ),
+    # Rates are looked up by the view's `throttle_scope` and then the
+    # throttle's ident scope (user or company, or token before the request is
+    # authenticated).
+    'DEFAULT_THROTTLE_RATES': {
+        'default_token': os.environ.get('THROTTLE_DEFAULT_TOKEN', '300/min'),
+        'default_user': os.environ.get('THROTTLE_DEFAULT_USER', '120/min'),
+        'default_company': os.environ.get('THROTTLE_DEFAULT_COMPANY', '3000/min'),
+        'admin_user': os.environ.get('THROTTLE_ADMIN_USER', '300/min'),
+        'admin_company': os.environ.get('THROTTLE_ADMIN_COMPANY', '600/min'),
+        'sessions_user': os.environ.get('THROTTLE_SESSIONS_USER', '30/min'),
+        'sessions_company': os.environ.get('THROTTLE_SESSIONS_COMPANY', '600/min'),
+        'payments_user': os.environ.get('THROTTLE_PAYMENTS_USER', '60/min'),
+        'payments_company': os.environ.get('THROTTLE_PAYMENTS_COMPANY', '1200/min'),
+        'payment_batches_user': os.environ.get('THROTTLE_PAYMENT_BATCHES_USER', '10/min'),
+        'payment_batches_company': os.environ.get('THROTTLE_PAYMENT_BATCHES_COMPANY', '30/min'),
+        'payment_methods_user': os.environ.get('THROTTLE_PAYMENT_METHODS_USER', '60/min'),
+        'payment_methods_company': os.environ.get('THROTTLE_PAYMENT_METHODS_COMPANY', '1200/min'),
+    },
 }
 
 reload_api_settings(setting='REST_FRAMEWORK', value=REST_FRAMEWORK)
@@ -0,0 +1,16 @@
+import os
+
+
+# Tracing
+# ---------------------------------------------------------------------------------------------------------------------
+
+# Fraction of traces that are recorded (0 disables tracing). Traces continue
+# the sampling decision of an incoming `traceparent` header.
+TRACING_SAMPLE_RATE = float(os.environ.get('TRACING_SAMPLE_RATE', 0))
+
+# OTLP/HTTP endpoint of the collector that spans are exported to.
+TRACING_EXPORT_ENDPOINT = os.environ.get(
+    'TRACING_EXPORT_ENDPOINT', 'http://localhost:4318/v1/traces'
+)
+
+TRACING_SERVICE_NAME = os.environ.get('TRACING_SERVICE_NAME', 'service-stripe')
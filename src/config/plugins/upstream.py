@@ -0,0 +1,69 @@
+import os
+
+
+# Timeouts
+# ---------------------------------------------------------------------------------------------------------------------
+
+# Default time budget (in seconds) for a request's upstream calls.
+REQUEST_TIMEOUT_BUDGET = float(os.environ.get('REQUEST_TIMEOUT_BUDGET', 20))
+# Time budget (in seconds) for activating a company, which makes several
+# sequential calls to Rehive.
+ACTIVATE_TIMEOUT_BUDGET = float(os.environ.get('ACTIVATE_TIMEOUT_BUDGET', 30))
+
+# Maximum timeout (in seconds) for a single upstream call.
+STRIPE_TIMEOUT = float(os.environ.get('STRIPE_TIMEOUT', 15))
+REHIVE_TIMEOUT = float(os.environ.get('REHIVE_TIMEOUT', 10))
+
+# Threads per process used to make independent upstream calls concurrently.
+UPSTREAM_FAN_OUT_WORKERS = int(os.environ.get('UPSTREAM_FAN_OUT_WORKERS', 10))
+
+
+# Circuit breakers
+# ---------------------------------------------------------------------------------------------------------------------
+
+# Failures within the window that open a company's breaker.
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(
+    os.environ.get('CIRCUIT_BREAKER_FAILURE_THRESHOLD', 5)
+)
+# Failures within the window (across all companies) that open a dependency's
+# breaker.
+CIRCUIT_BREAKER_DEPENDENCY_FAILURE_THRESHOLD = int(
+    os.environ.get('CIRCUIT_BREAKER_DEPENDENCY_FAILURE_THRESHOLD', 20)
+)
+CIRCUIT_BREAKER_FAILURE_WINDOW = int(
+    os.environ.get('CIRCUIT_BREAKER_FAILURE_WINDOW', 60)
+)
+# Time (in seconds) an open breaker waits before letting a trial call through.
+CIRCUIT_BREAKER_RECOVERY_TIMEOUT = int(
+    os.environ.get('CIRCUIT_BREAKER_RECOVERY_TIMEOUT', 30)
+)
+
+# Time (in seconds) a cached Rehive user can be used to authenticate requests
+# while Rehive is unavailable.
+AUTH_GRACE_PERIOD = int(os.environ.get('AUTH_GRACE_PERIOD', 300))
+
+
+# Bulkheads
+# ---------------------------------------------------------------------------------------------------------------------
+
+# Concurrent Stripe calls allowed per company (across all workers).
+BULKHEAD_SLOTS = int(os.environ.get('BULKHEAD_SLOTS', 4))
+# Time (in seconds) a call can wait for a free slot.
+BULKHEAD_QUEUE_TIMEOUT = float(os.environ.get('BULKHEAD_QUEUE_TIMEOUT', 5))
+BULKHEAD_POLL_INTERVAL = float(os.environ.get('BULKHEAD_POLL_INTERVAL', 0.1))
+# Slots are released automatically after the lease in case a worker dies.
+BULKHEAD_SLOT_LEASE = int(STRIPE_TIMEOUT) + 5
+# Backoff (in seconds) after being rate limited without a Retry-After.
+BULKHEAD_BACKOFF_BASE = float(os.environ.get('BULKHEAD_BACKOFF_BASE', 1))
+BULKHEAD_BACKOFF_MAX = float(os.environ.get('BULKHEAD_BACKOFF_MAX', 30))
+
+
+# Async (ASGI) mode
+# ---------------------------------------------------------------------------------------------------------------------
+
+# Serve the async versions of endpoints that wait on upstreams (enabled by
+# default in `config.asgi`).
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'False') == 'True'
+
+# Max connections kept open to upstreams per worker process by async views.
+ASYNC_MAX_CONNECTIONS = int(os.environ.get('ASYNC_MAX_CONNECTIONS', 100))
@@ -18,9 +18,14 @@ from .plugins.secrets import *
 from .plugins.rest_framework import *
 from .plugins.yasg import *
 from .plugins.database import *
+from .plugins.cache import *
 from .plugins.sentry import *
 from .plugins.urls import *
 from .plugins.healthz import *
+from .plugins.upstream import *
+from .plugins.tracing import *
+from .plugins.profiling import *
+from .plugins.queries import *
 
 
 # LOGGING
@@ -64,6 +69,11 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'healthz.middleware.HealthCheckMiddleware',
+    'service_stripe.middleware.SlowQueryMiddleware',
+    'service_stripe.middleware.MetricsMiddleware',
+    'service_stripe.middleware.TracingMiddleware',
+    'service_stripe.middleware.ProfilingMiddleware',
+    'service_stripe.middleware.LoadSheddingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -73,8 +83,18 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.locale.LocaleMiddleware',
+    'service_stripe.middleware.DeadlineMiddleware',
+    'service_stripe.middleware.ReplicaStickinessMiddleware',
 ]
 
+# Maximum requests in flight per worker process before new requests are
+# rejected (0 disables load shedding). Keep this below the number of worker
+# threads so that there is always capacity left to reject requests quickly.
+LOAD_SHEDDING_MAX_IN_FLIGHT = int(
+    os.environ.get('LOAD_SHEDDING_MAX_IN_FLIGHT', 16)
+)
+LOAD_SHEDDING_EXEMPT_PATHS = ('/metrics', '/metrics/',)
+
 INTERNAL_IPS = ['127.0.0.1']
 
 ROOT_URLCONF = 'config.urls'
@@ -165,6 +185,65 @@ FIXTURE_DIRS = ['config/fixtures']
 CACHE_DIR = os.path.join(PROJECT_DIR, 'var/cache')
 
 
+# Payments
+# ---------------------------------------------------------------------------------------------------------------------
+
+# Default and maximum time (in seconds) a client can long-poll a payment.
+PAYMENT_WAIT_TIMEOUT = int(os.environ.get('PAYMENT_WAIT_TIMEOUT', 20))
+PAYMENT_WAIT_MAX_TIMEOUT = int(os.environ.get('PAYMENT_WAIT_MAX_TIMEOUT', 25))
+# Maximum clients long-polling per worker process, any further clients get an
+# immediate response so that waiters cannot starve other requests.
+PAYMENT_WAIT_MAX_WAITERS = int(os.environ.get('PAYMENT_WAIT_MAX_WAITERS', 8))
+# Number of months ahead to create monthly payment partitions for (see
+# `create_payment_partitions`).
+PAYMENT_PARTITIONS_AHEAD = int(os.environ.get('PAYMENT_PARTITIONS_AHEAD', 3))
+# Payments updated in the last PAYMENT_CHANGES_DELAY seconds are left out of the
+# change feed (`admin/payments/changes/`) until the transactions that updated
+# other payments just before them have committed. `updated` is set from the
+# database's clock when a payment is written, so the delay must be longer than
+# the time between writing a payment and committing it (app server clocks do
+# not matter).
+PAYMENT_CHANGES_DELAY = float(os.environ.get('PAYMENT_CHANGES_DELAY', 5))
+# Maximum objects that can be retrieved at once (eg. `user/payments/batch/`).
+BATCH_RETRIEVE_MAX_SIZE = int(os.environ.get('BATCH_RETRIEVE_MAX_SIZE', 100))
+# Maximum payments created per batch (`admin/payments/batch/`), the number of their
+# payment intents that are created at once and the time budget (in seconds)
+# for the whole batch.
+PAYMENT_BATCH_MAX_SIZE = int(os.environ.get('PAYMENT_BATCH_MAX_SIZE', 50))
+PAYMENT_BATCH_CONCURRENCY = int(
+    os.environ.get('PAYMENT_BATCH_CONCURRENCY', BULKHEAD_SLOTS)
+)
+PAYMENT_BATCH_TIMEOUT_BUDGET = float(
+    os.environ.get('PAYMENT_BATCH_TIMEOUT_BUDGET', 60)
+)
+
+
+# Purging
+# ---------------------------------------------------------------------------------------------------------------------
+
+# Rows deleted per batch when purging a deactivated company, and the pause (in
+# seconds) between batches so that purging does not starve other queries.
+PURGE_BATCH_SIZE = int(os.environ.get('PURGE_BATCH_SIZE', 1000))
+PURGE_BATCH_PAUSE = float(os.environ.get('PURGE_BATCH_PAUSE', 0.5))
+
+
+# Retention
+# ---------------------------------------------------------------------------------------------------------------------
+
+# Default number of days after which sessions and settled payments are moved
+# out of the live tables (0 keeps them forever). Companies can override these.
+RETENTION_SESSION_DAYS = int(os.environ.get('RETENTION_SESSION_DAYS', 0))
+RETENTION_PAYMENT_DAYS = int(os.environ.get('RETENTION_PAYMENT_DAYS', 0))
+# Default action for old rows, either moving them to the archive tables
+# ("archive") or writing them to compressed files and deleting them ("export").
+RETENTION_ACTION = os.environ.get('RETENTION_ACTION', 'archive')
+RETENTION_EXPORT_DIR = os.environ.get(
+    'RETENTION_EXPORT_DIR', os.path.join(PROJECT_DIR, 'var/retention')
+)
+RETENTION_BATCH_SIZE = int(os.environ.get('RETENTION_BATCH_SIZE', 1000))
+RETENTION_BATCH_PAUSE = float(os.environ.get('RETENTION_BATCH_PAUSE', 0.5))
+
+
 # Logging
 # ---------------------------------------------------------------------------------------------------------------------
 
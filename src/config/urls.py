@@ -6,6 +6,8 @@ from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rest_framework import permissions
 
+from service_stripe.metrics import metrics_view
+
 
 admin.autodiscover()
 
@@ -32,6 +34,9 @@ urlpatterns = [
     re_path(r'^swagger/$', schema_view.with_ui('swagger', cache_timeout=None), name='schema-swagger-ui'),
     re_path(r'^$', schema_view.with_ui('redoc', cache_timeout=None), name='schema-redoc'),
 
+    # Metrics
+    re_path(r'^metrics/?$', metrics_view, name='metrics'),
+
     # API
     re_path(r'^api/', include(('service_stripe.urls', 'service_stripe'), namespace='service_stripe')),
 ]
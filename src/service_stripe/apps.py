@@ -1,5 +1,23 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def create_payment_partitions(sender, using, **kwargs):
+    from django.core.management import call_command
+
+    call_command('create_payment_partitions', verbosity=0)
 
 
 class ServiceStripe(AppConfig):
     name = 'service_stripe'
+
+    def ready(self):
+        from service_stripe.tracing import configure_tracing
+        from service_stripe.utils.clients import configure_stripe
+
+        configure_stripe()
+        configure_tracing()
+
+        # Keep the payment partitions for the coming months around on every
+        # deploy, in addition to running `create_payment_partitions` daily.
+        post_migrate.connect(create_payment_partitions, sender=self)
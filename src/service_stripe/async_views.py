@@ -0,0 +1,281 @@
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings as django_settings
+from django.db import close_old_connections
+from django.urls import URLPattern
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from service_stripe import views
+from service_stripe.authentication import UserAuthentication
+from service_stripe.enums import PaymentStatus
+from service_stripe.serializers import (
+    AsyncCreatePaymentSerializer, AsyncSessionSerializer,
+    PaymentMethodSerializer, PaymentSerializer, SessionSerializer
+)
+from service_stripe.utils.listeners import payment_listener
+
+
+"""
+Helpers
+"""
+
+
+def threaded(view):
+    """
+    Serve a sync view from a thread pool.
+
+    Under ASGI Django runs all sync views in a single thread, so one slow
+    upstream call would hold up every other sync view in the process.
+    Database connections are closed the same way Django does at the start
+    and end of each request.
+    """
+
+    def handle(request, *args, **kwargs):
+        close_old_connections()
+        try:
+            response = view(request, *args, **kwargs)
+            if callable(getattr(response, 'render', None)):
+                response = response.render()
+            return response
+        finally:
+            close_old_connections()
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await sync_to_async(handle, thread_sensitive=False)(
+            request, *args, **kwargs
+        )
+
+    return wrapper
+
+
+def async_patterns(urlpatterns):
+    """
+    Replace views that have an async version with the async version and
+    serve the rest from a thread pool.
+    """
+
+    versions = {view.sync_view: view for view in ASYNC_VIEWS}
+    patterns = []
+
+    for pattern in urlpatterns:
+        async_view = versions.get(getattr(pattern.callback, 'view_class', None))
+        if async_view:
+            callback = async_view.as_view()
+        else:
+            callback = threaded(pattern.callback)
+
+        patterns.append(URLPattern(
+            pattern.pattern, callback, pattern.default_args, pattern.name
+        ))
+
+    return patterns
+
+
+"""
+Base
+"""
+
+
+class AsyncAPIView(View):
+    """
+    Async counterpart of a sync API view, for endpoints that spend most of
+    their time waiting on upstreams.
+
+    Authentication, throttling, parsing and error responses behave like the
+    sync API views. Methods without an async handler are served by the sync
+    view (`sync_view`) from a thread pool.
+    """
+
+    sync_view = None
+    sync_handler = None
+    authentication_class = UserAuthentication
+    throttle_scope = 'default'
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        initkwargs.setdefault('sync_handler', threaded(cls.sync_view.as_view()))
+        view = super().as_view(**initkwargs)
+
+        # Let Django await the view (see `django.utils.deprecation`).
+        view._is_coroutine = asyncio.coroutines._is_coroutine
+        view.csrf_exempt = True
+        # Document the endpoint using the sync view.
+        view.cls = cls.sync_view
+        view.initkwargs = {}
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        handler = getattr(self, request.method.lower(), None)
+        if not asyncio.iscoroutinefunction(handler):
+            return await self.sync_handler(request, *args, **kwargs)
+
+        request = self.request = Request(
+            request,
+            parsers=[p() for p in api_settings.DEFAULT_PARSER_CLASSES],
+            authenticators=(),
+            parser_context={'view': self, 'args': args, 'kwargs': kwargs}
+        )
+
+        try:
+            await self.initial(request)
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        return self.finalize_response(response)
+
+    async def initial(self, request):
+        user, token = await self.authentication_class().aauthenticate(
+            request
+        )
+        request.user, request.auth = user, token
+        await sync_to_async(self.check_throttles)(request)
+
+    def check_throttles(self, request):
+        throttle_durations = []
+        for throttle in api_settings.DEFAULT_THROTTLE_CLASSES:
+            throttle = throttle()
+            if not throttle.allow_request(request, self):
+                throttle_durations.append(throttle.wait())
+
+        if throttle_durations:
+            durations = [d for d in throttle_durations if d is not None]
+            raise exceptions.Throttled(max(durations, default=None))
+
+    def handle_exception(self, exc):
+        response = api_settings.EXCEPTION_HANDLER(
+            exc, {'view': self, 'request': self.request}
+        )
+        if response is None:
+            raise exc
+
+        response.exception = True
+        return response
+
+    def finalize_response(self, response):
+        response.accepted_renderer = JSONRenderer()
+        response.accepted_media_type = JSONRenderer.media_type
+        response.renderer_context = {
+            'view': self, 'request': self.request, 'response': response
+        }
+        return response.render()
+
+    def get_serializer_context(self):
+        return {'request': self.request, 'format': None, 'view': self}
+
+    async def get_data(self, serializer_class, instance, **kwargs):
+        """
+        Serialize an instance (which may access the ORM) off the event loop.
+        """
+
+        serializer = serializer_class(
+            instance, context=self.get_serializer_context(), **kwargs
+        )
+        return await sync_to_async(lambda: serializer.data)()
+
+
+"""
+User Endpoints
+"""
+
+
+class UserListCreateSessionView(AsyncAPIView):
+    sync_view = views.UserListCreateSessionView
+    throttle_scope = 'sessions'
+
+    async def post(self, request, *args, **kwargs):
+        serializer = AsyncSessionSerializer(
+            data=request.data, context=self.get_serializer_context()
+        )
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        instance = await serializer.acreate()
+
+        return Response(
+            {
+                'status': 'success',
+                'data': await self.get_data(SessionSerializer, instance)
+            },
+            status=status.HTTP_201_CREATED
+        )
+
+
+class UserListCreatePaymentView(AsyncAPIView):
+    sync_view = views.UserListCreatePaymentView
+    throttle_scope = 'payments'
+
+    async def post(self, request, *args, **kwargs):
+        serializer = AsyncCreatePaymentSerializer(
+            data=request.data, context=self.get_serializer_context()
+        )
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        await serializer.avalidate()
+        instance = await serializer.acreate()
+
+        return Response(
+            {
+                'status': 'success',
+                'data': await self.get_data(PaymentSerializer, instance)
+            },
+            status=status.HTTP_201_CREATED
+        )
+
+
+class UserPaymentWaitView(AsyncAPIView):
+    sync_view = views.UserPaymentWaitView
+    throttle_scope = 'payments'
+
+    async def get(self, request, *args, **kwargs):
+        identifier = kwargs.get('identifier')
+        timeout = self.sync_view.get_timeout(request)
+
+        # Respond immediately when too many clients are already waiting.
+        if (payment_listener.waiting
+                >= django_settings.PAYMENT_WAIT_MAX_WAITERS):
+            timeout = 0
+
+        with payment_listener.subscribe(identifier) as updated:
+            payment = await sync_to_async(self.sync_view.get_payment)(
+                identifier, request.user
+            )
+
+            # Wait in a pool thread so that other requests are not held up.
+            if (payment.status == PaymentStatus.PROCESSING
+                    and await sync_to_async(
+                        updated.wait, thread_sensitive=False)(timeout)):
+                await sync_to_async(payment.refresh_from_db)()
+
+        return Response({
+            'status': 'success',
+            'data': await self.get_data(PaymentSerializer, payment)
+        })
+
+
+class UserListPaymentMethodView(AsyncAPIView):
+    sync_view = views.UserListPaymentMethodView
+    throttle_scope = 'payment_methods'
+
+    async def get(self, request, *args, **kwargs):
+        methods = await request.user.apayment_methods()
+
+        return Response({
+            'status': 'success',
+            'data': PaymentMethodSerializer(
+                methods, many=True, context=self.get_serializer_context()
+            ).data
+        })
+
+
+ASYNC_VIEWS = (
+    UserListCreateSessionView,
+    UserListCreatePaymentView,
+    UserPaymentWaitView,
+    UserListPaymentMethodView,
+)
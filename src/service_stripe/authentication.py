@@ -1,11 +1,22 @@
+import time
 import uuid
+import hashlib
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
 from django.utils.translation import gettext_lazy as _
 from django.utils.encoding import smart_str
 from rest_framework import authentication, exceptions, status
-from rehive import Rehive, APIException
+from rehive import APIException
 
+from . import metrics
+from .exceptions import ServiceUnavailable
 from .models import Company, User
+from .throttling import TokenRateThrottle
+from .utils.breakers import rehive_breaker
+from .utils.aclients import AsyncRehive, rehive_call
+from .utils.clients import get_rehive
 
 
 class ModifiedAPIException(exceptions.APIException):
@@ -50,29 +61,95 @@ class RehiveAuthentication(HeaderAuthentication):
     authorization header belongs to a valid user.
     """
 
-    def authenticate(self, request):
-        token = self.get_auth_header(request)
-        rehive = Rehive(token)
+    @staticmethod
+    def get_cache_key(token):
+        return 'auth:{}'.format(hashlib.sha256(token.encode()).hexdigest())
 
-        if not token:
-            raise exceptions.NotAuthenticated()
+    @staticmethod
+    def get_cached_platform_user(cache_key, exc):
+        """
+        Get the cached Rehive user after the Rehive call failed with `exc`.
+        Re-raises `exc` if Rehive is not unavailable or nothing is cached.
+        """
+
+        if not (isinstance(exc, ServiceUnavailable)
+                or rehive_breaker.is_failure(exc)):
+            raise exc
+
+        cached = cache.get(cache_key)
+        if cached is None:
+            raise exc
+
+        metrics.AUTH_CACHE_FALLBACKS.inc()
+        return cached[0]
+
+    @staticmethod
+    def cache_platform_user(cache_key, platform_user):
+        # Only refresh the cached user every so often to limit cache writes.
+        cached = cache.get(cache_key)
+        if (cached is None or time.time() - cached[1]
+                > settings.AUTH_GRACE_PERIOD / 5):
+            cache.set(
+                cache_key,
+                (platform_user, time.time()),
+                settings.AUTH_GRACE_PERIOD
+            )
+
+    @classmethod
+    def get_platform_user(cls, token):
+        """
+        Get the Rehive user that owns the token.
+
+        While Rehive is unavailable a user cached within the grace period is
+        returned instead.
+        """
+
+        cache_key = cls.get_cache_key(token)
 
         try:
-            platform_user = rehive.auth.get()
-        except APIException as exc:
-            # Try and get a `message` string from the exception data.
-            if (hasattr(exc, 'data')):
-                detail = exc.data['message']
-            else:
-                detail = None
-            # Try and get a `status_code` integer from the exception data.
-            if hasattr(exc, 'status_code'):
-                status_code = exc.status_code
-            else:
-                status_code = None
-
-            raise ModifiedAPIException(detail=detail, status_code=status_code)
+            with rehive_breaker.guard():
+                platform_user = get_rehive(token).auth.get()
+        except Exception as exc:
+            return cls.get_cached_platform_user(cache_key, exc)
+
+        cls.cache_platform_user(cache_key, platform_user)
+        return platform_user
+
+    @classmethod
+    async def aget_platform_user(cls, token):
+        """
+        Async version of `get_platform_user`.
+        """
+
+        cache_key = cls.get_cache_key(token)
 
+        try:
+            platform_user = await rehive_call(AsyncRehive(token).get_auth)
+        except Exception as exc:
+            return await sync_to_async(cls.get_cached_platform_user)(
+                cache_key, exc
+            )
+
+        await sync_to_async(cls.cache_platform_user)(cache_key, platform_user)
+        return platform_user
+
+    @staticmethod
+    def get_rehive_exception(exc):
+        # Try and get a `message` string from the exception data.
+        if (hasattr(exc, 'data')):
+            detail = exc.data['message']
+        else:
+            detail = None
+        # Try and get a `status_code` integer from the exception data.
+        if hasattr(exc, 'status_code'):
+            status_code = exc.status_code
+        else:
+            status_code = None
+
+        return ModifiedAPIException(detail=detail, status_code=status_code)
+
+    @staticmethod
+    def get_user(platform_user):
         try:
             company = Company.objects.get(
                 identifier=platform_user['company'],
@@ -88,9 +165,71 @@ class RehiveAuthentication(HeaderAuthentication):
             company=company
         )
 
+        # Reuse the company instead of loading it again when it is accessed
+        # (async views cannot load it lazily).
+        user.company = company
         # Inject the platform user object into the auth user.
         user._platform_user = platform_user
 
+        return user
+
+    def check_user(self, user):
+        """
+        Hook for subclasses to reject authenticated users.
+        """
+
+        pass
+
+    @staticmethod
+    def check_throttle(request):
+        """
+        Throttle the request by its token before the token is checked with
+        Rehive (the user and company throttles only run after).
+        """
+
+        throttle = TokenRateThrottle()
+        if not throttle.allow_request(
+                request, request.parser_context.get('view')):
+            raise exceptions.Throttled(throttle.wait())
+
+    def authenticate(self, request):
+        token = self.get_auth_header(request)
+
+        if not token:
+            raise exceptions.NotAuthenticated()
+
+        self.check_throttle(request)
+
+        try:
+            platform_user = self.get_platform_user(token)
+        except APIException as exc:
+            raise self.get_rehive_exception(exc)
+
+        user = self.get_user(platform_user)
+        self.check_user(user)
+
+        return user, token
+
+    async def aauthenticate(self, request):
+        """
+        Async version of `authenticate` used by the async views.
+        """
+
+        token = self.get_auth_header(request)
+
+        if not token:
+            raise exceptions.NotAuthenticated()
+
+        await sync_to_async(self.check_throttle)(request)
+
+        try:
+            platform_user = await self.aget_platform_user(token)
+        except APIException as exc:
+            raise self.get_rehive_exception(exc)
+
+        user = await sync_to_async(self.get_user)(platform_user)
+        self.check_user(user)
+
         return user, token
 
 
@@ -99,9 +238,7 @@ class RehiveGroupAuthentication(RehiveAuthentication):
     # An empty list means all user groups are allowed.
     groups = []
 
-    def authenticate(self, request):
-        user, token = super().authenticate(request)
-
+    def check_user(self, user):
         # Get a list of groups the user belongs to.
         groups = [g['name'] for g in user._platform_user['groups']]
         # If a list of groups is defined make sure only those groups are
@@ -110,8 +247,6 @@ class RehiveGroupAuthentication(RehiveAuthentication):
                 and len(set(self.groups).intersection(groups)) <= 0):
             raise exceptions.PermissionDenied()
 
-        return user, token
-
 
 class AdminAuthentication(RehiveGroupAuthentication):
     """
@@ -0,0 +1,97 @@
+"""
+Postgres backend with lifecycle management for persistent connections
+(CONN_MAX_AGE).
+
+Django already closes connections at the start and end of a request once
+they are older than CONN_MAX_AGE or after an error. In addition, this
+backend checks a connection that has been idle for longer than
+POSTGRES_HEALTH_CHECK_IDLE before its first use in a request, since the
+server (or a proxy in between) may have dropped it in the meantime. It also
+records how long it takes to open new connections, the number and duration
+of the queries made during each request, and the requests' slow queries.
+"""
+
+import time
+
+from django.conf import settings
+from django.db.backends import utils
+from django.db.backends.postgresql import base
+
+from service_stripe import metrics
+from service_stripe.utils import queries, timing
+
+
+class CursorWrapper(utils.CursorWrapper):
+
+    def execute(self, sql, params=None):
+        start = time.perf_counter()
+        try:
+            result = super().execute(sql, params)
+        finally:
+            seconds = time.perf_counter() - start
+            timing.record('db', seconds)
+        queries.capture(self.db, sql, params, seconds)
+        return result
+
+    def executemany(self, sql, param_list):
+        start = time.perf_counter()
+        try:
+            result = super().executemany(sql, param_list)
+        finally:
+            seconds = time.perf_counter() - start
+            timing.record('db', seconds)
+        # A batch cannot be explained as a single query.
+        queries.capture(self.db, sql, None, seconds, explain=False)
+        return result
+
+
+class CursorDebugWrapper(CursorWrapper, utils.CursorDebugWrapper):
+    pass
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+        self.last_used = None
+
+    def get_new_connection(self, conn_params):
+        start = time.perf_counter()
+        connection = super().get_new_connection(conn_params)
+        metrics.DB_CONNECT_SECONDS.labels(self.alias).observe(
+            time.perf_counter() - start
+        )
+        return connection
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        # Called at the start and end of each request.
+        self.health_check_done = False
+
+    def close_if_health_check_failed(self):
+        if (self.connection is None
+                or self.health_check_done
+                or self.in_atomic_block
+                or self.last_used is None):
+            return
+
+        self.health_check_done = True
+        if time.monotonic() - self.last_used < settings.POSTGRES_HEALTH_CHECK_IDLE:
+            return
+
+        if not self.is_usable():
+            metrics.DB_HEALTH_CHECK_FAILURES.labels(self.alias).inc()
+            self.close()
+
+    def make_cursor(self, cursor):
+        return CursorWrapper(cursor, self)
+
+    def make_debug_cursor(self, cursor):
+        return CursorDebugWrapper(cursor, self)
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        cursor = super()._cursor(name)
+        self.last_used = time.monotonic()
+        return cursor
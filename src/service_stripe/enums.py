@@ -10,3 +10,8 @@ class PaymentStatus(Enum):
     PROCESSING = 'processing'
     SUCCEEDED = 'succeeded'
     FAILED = 'failed'
+
+
+class RetentionAction(Enum):
+    ARCHIVE = 'archive'
+    EXPORT = 'export'
@@ -0,0 +1,31 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions, status
+
+
+class DeadlineExceeded(exceptions.APIException):
+    """
+    Raised when a request runs out of time before its upstream calls to
+    Stripe or Rehive could complete.
+    """
+
+    status_code = status.HTTP_504_GATEWAY_TIMEOUT
+    default_detail = _('The request could not be completed in time.')
+    default_code = 'deadline_exceeded'
+
+
+class ServiceUnavailable(exceptions.APIException):
+    """
+    Raised when an upstream service is unavailable and the request is
+    rejected without calling it.
+    """
+
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = _(
+        'A service is temporarily unavailable, please try again later.'
+    )
+    default_code = 'service_unavailable'
+
+    def __init__(self, detail=None, code=None, wait=None):
+        super().__init__(detail, code)
+        # Used by the exception handler to set a `Retry-After` header.
+        self.wait = wait
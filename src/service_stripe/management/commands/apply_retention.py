@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from service_stripe.models import Company
+from service_stripe.utils.retention import apply_retention
+
+
+class Command(BaseCommand):
+    help = (
+        'Archive or export old sessions and settled payments according to '
+        'each company\'s retention policy.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--company',
+            action='append',
+            dest='companies',
+            help='Only apply retention to this company (can be repeated).'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.RETENTION_BATCH_SIZE,
+            help='Rows to move per batch.'
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=settings.RETENTION_BATCH_PAUSE,
+            help='Seconds to pause between batches.'
+        )
+
+    def handle(self, *args, **options):
+        companies = Company.objects.filter(
+            purge_requested__isnull=True
+        ).order_by('id')
+        if options['companies']:
+            companies = companies.filter(identifier__in=options['companies'])
+
+        for company in companies.iterator():
+            summary = apply_retention(
+                company, options['batch_size'], options['pause']
+            )
+            self.stdout.write('{}: {}'.format(
+                company.identifier,
+                ', '.join(
+                    '{} {}'.format(total, model._meta.verbose_name_plural)
+                    for model, total in summary.items()
+                )
+            ))
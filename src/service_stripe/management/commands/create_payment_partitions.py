@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from service_stripe.utils.partitions import create_partitions
+
+
+class Command(BaseCommand):
+    help = 'Create the monthly payment partitions for the coming months.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months',
+            type=int,
+            default=settings.PAYMENT_PARTITIONS_AHEAD,
+            help='Number of months ahead to create partitions for.'
+        )
+
+    def handle(self, *args, **options):
+        created = create_partitions(options['months'])
+        if options['verbosity'] < 1:
+            return
+
+        for name in created:
+            self.stdout.write('Created {}.'.format(name))
+        if not created:
+            self.stdout.write('All partitions exist.')
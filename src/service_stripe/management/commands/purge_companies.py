@@ -0,0 +1,56 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from service_stripe.models import Company
+from service_stripe.utils.purge import purge_company
+
+
+class Command(BaseCommand):
+    help = 'Delete the data of companies deactivated with a purge.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.PURGE_BATCH_SIZE,
+            help='Rows to delete per batch.'
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=settings.PURGE_BATCH_PAUSE,
+            help='Seconds to pause between batches.'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=None,
+            help='Keep running and check for companies to purge every '
+                 'interval seconds.'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            companies = Company.objects.filter(
+                purge_requested__isnull=False
+            ).order_by('purge_requested')
+
+            for company in companies:
+                self.stdout.write('Purging {}.'.format(company.identifier))
+                purge_company(
+                    company,
+                    options['batch_size'],
+                    options['pause'],
+                    progress=lambda model, total: self.stdout.write(
+                        '  deleted {} {}'.format(
+                            total, model._meta.verbose_name_plural
+                        )
+                    )
+                )
+                self.stdout.write('Purged {}.'.format(company.identifier))
+
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand
+
+from service_stripe.models import SlowQuery
+
+
+class Command(BaseCommand):
+    help = 'Show the slowest queries made by views, by fingerprint.'
+
+    ORDERING = {
+        'total': '-duration',
+        'max': '-max_duration',
+        'count': '-count',
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sort',
+            choices=sorted(self.ORDERING),
+            default='total',
+            help='Sort by total duration, maximum duration or count.'
+        )
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument(
+            '--view',
+            action='append',
+            dest='views',
+            help='Only show queries made by this view (can be repeated).'
+        )
+        parser.add_argument(
+            '--plans',
+            action='store_true',
+            help='Show the latest captured plan of each query.'
+        )
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Delete the recorded queries (eg. after a fix is deployed).'
+        )
+
+    def handle(self, *args, **options):
+        queries = SlowQuery.objects.all()
+        if options['views']:
+            queries = queries.filter(view__in=options['views'])
+
+        if options['reset']:
+            deleted, _ = queries.delete()
+            self.stdout.write('Deleted {} slow queries.'.format(deleted))
+            return
+
+        queries = queries.order_by(self.ORDERING[options['sort']])
+        for query in queries[:options['limit']]:
+            self.stdout.write(
+                '{} {}: {} queries, {:.3f}s total, {:.3f}s mean, '
+                '{:.3f}s max'.format(
+                    query.fingerprint[:12],
+                    query.view,
+                    query.count,
+                    query.duration,
+                    query.mean_duration,
+                    query.max_duration
+                )
+            )
+            self.stdout.write('  ' + query.sql)
+            if options['plans'] and query.plan:
+                self.stdout.write(
+                    '  Plan ({}):'.format(query.plan_updated.isoformat())
+                )
+                for line in query.plan.splitlines():
+                    self.stdout.write('    ' + line)
+            self.stdout.write('')
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from rehive.api.exception import APIException, Timeout
+
+from service_stripe.exceptions import ServiceUnavailable
+from service_stripe.models import Company
+from service_stripe.utils.currencies import sync_currencies
+
+
+class Command(BaseCommand):
+    help = 'Sync the currencies of active companies from Rehive.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--company',
+            action='append',
+            dest='companies',
+            help='Only sync this company (can be repeated).'
+        )
+
+    def handle(self, *args, **options):
+        companies = Company.objects.filter(
+            active=True
+        ).select_related('admin').order_by('id')
+        if options['companies']:
+            companies = companies.filter(identifier__in=options['companies'])
+
+        failed = 0
+        for company in companies.iterator():
+            try:
+                summary = sync_currencies(company)
+            except (APIException, Timeout, ServiceUnavailable) as exc:
+                failed += 1
+                self.stderr.write(
+                    '{}: failed to sync currencies ({}).'.format(
+                        company.identifier, exc
+                    )
+                )
+                continue
+
+            self.stdout.write(
+                '{}: {} created, {} updated, {} unchanged.'.format(
+                    company.identifier,
+                    len(summary['created']),
+                    len(summary['updated']),
+                    summary['unchanged']
+                )
+            )
+
+        if failed:
+            raise CommandError(
+                '{} companies failed to sync currencies.'.format(failed)
+            )
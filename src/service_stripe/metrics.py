@@ -0,0 +1,215 @@
+import os
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY,
+    CONTENT_TYPE_LATEST, generate_latest
+)
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client import multiprocess
+
+
+"""
+Requests
+"""
+
+# Latency buckets (in seconds) for requests and upstream calls.
+LATENCY_BUCKETS = (
+    .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30
+)
+
+REQUEST_SECONDS = Histogram(
+    'service_stripe_request_seconds',
+    'Time taken to respond to a request, by URL name.',
+    ['endpoint', 'method', 'status'],
+    buckets=LATENCY_BUCKETS
+)
+
+REQUEST_DEPENDENCY_SECONDS = Histogram(
+    'service_stripe_request_dependency_seconds',
+    'Time spent per request waiting on a dependency (db, rehive or stripe).',
+    ['endpoint', 'dependency'],
+    buckets=LATENCY_BUCKETS
+)
+
+REQUEST_DB_QUERIES = Histogram(
+    'service_stripe_request_db_queries',
+    'Database queries made per request.',
+    ['endpoint'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+)
+
+IN_FLIGHT_REQUESTS = Gauge(
+    'service_stripe_in_flight_requests',
+    'Requests currently being processed.',
+    multiprocess_mode='livesum'
+)
+
+SHED_REQUESTS = Counter(
+    'service_stripe_shed_requests_total',
+    'Requests rejected because too many requests were in flight.'
+)
+
+THROTTLED_REQUESTS = Counter(
+    'service_stripe_throttled_requests_total',
+    'Requests rejected by a rate limit.',
+    ['scope']
+)
+
+
+"""
+Upstreams
+"""
+
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    'service_stripe_upstream_request_seconds',
+    'Time taken by HTTP requests to upstreams, by operation.',
+    ['dependency', 'operation', 'status'],
+    buckets=LATENCY_BUCKETS
+)
+
+
+"""
+Payments
+"""
+
+WEBHOOK_LAG_SECONDS = Histogram(
+    'service_stripe_webhook_lag_seconds',
+    'Time between Stripe creating an event and the webhook receiving it.',
+    ['type'],
+    buckets=(1, 5, 15, 30, 60, 300, 900, 3600, 21600, 86400)
+)
+
+PAYMENT_TRANSITIONS = Counter(
+    'service_stripe_payment_transitions_total',
+    'Payment status transitions, by outcome (applied, unchanged or error).',
+    ['status', 'outcome']
+)
+
+
+"""
+Circuit breakers
+"""
+
+CIRCUIT_BREAKER_TRANSITIONS = Counter(
+    'service_stripe_circuit_breaker_transitions_total',
+    'Circuit breaker state transitions.',
+    ['dependency', 'scope', 'state']
+)
+
+CIRCUIT_BREAKER_REJECTIONS = Counter(
+    'service_stripe_circuit_breaker_rejections_total',
+    'Calls rejected by an open circuit breaker.',
+    ['dependency', 'scope']
+)
+
+AUTH_CACHE_FALLBACKS = Counter(
+    'service_stripe_auth_cache_fallbacks_total',
+    'Requests authenticated using a cached user while Rehive was unavailable.'
+)
+
+
+"""
+Bulkheads
+"""
+
+BULKHEAD_QUEUE_DEPTH = Gauge(
+    'service_stripe_bulkhead_queue_depth',
+    'Calls waiting for a free concurrency slot.',
+    ['dependency', 'company'],
+    multiprocess_mode='livesum'
+)
+
+BULKHEAD_IN_FLIGHT = Gauge(
+    'service_stripe_bulkhead_in_flight',
+    'Calls holding a concurrency slot.',
+    ['dependency', 'company'],
+    multiprocess_mode='livesum'
+)
+
+BULKHEAD_REJECTIONS = Counter(
+    'service_stripe_bulkhead_rejections_total',
+    'Calls rejected while waiting for a concurrency slot.',
+    ['dependency', 'company', 'reason']
+)
+
+
+"""
+Database
+"""
+
+DB_CONNECT_SECONDS = Histogram(
+    'service_stripe_db_connect_seconds',
+    'Time taken to open a new database connection.',
+    ['database'],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 25)
+)
+
+DB_HEALTH_CHECK_FAILURES = Counter(
+    'service_stripe_db_health_check_failures_total',
+    'Persistent database connections closed because they were unusable.',
+    ['database']
+)
+
+
+class CircuitBreakerCollector:
+    """
+    Collect the current state of each dependency's circuit breaker from the
+    shared cache at scrape time, so the value is the same on every worker.
+    """
+
+    STATES = {'closed': 0, 'open': 1, 'half_open': 2}
+
+    def _gauge(self):
+        return GaugeMetricFamily(
+            'service_stripe_circuit_breaker_state',
+            'Dependency circuit breaker state (0=closed, 1=open, 2=half-open).',
+            labels=['dependency']
+        )
+
+    def describe(self):
+        return [self._gauge()]
+
+    def collect(self):
+        from service_stripe.utils.breakers import breakers
+
+        gauge = self._gauge()
+        for breaker in breakers:
+            gauge.add_metric([breaker.name], self.STATES[breaker.state()])
+        yield gauge
+
+
+def get_registry():
+    """
+    Get the registry to expose. When running multiple worker processes
+    metrics are aggregated from PROMETHEUS_MULTIPROC_DIR.
+    """
+
+    if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        return REGISTRY
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(CircuitBreakerCollector())
+    return registry
+
+
+if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    REGISTRY.register(CircuitBreakerCollector())
+
+
+def metrics_view(request):
+    """
+    Prometheus exposition endpoint. Requires a `Token <METRICS_TOKEN>`
+    authorization header if METRICS_TOKEN is set.
+    """
+
+    token = settings.METRICS_TOKEN
+    if (token and request.META.get('HTTP_AUTHORIZATION')
+            != 'Token {}'.format(token)):
+        return HttpResponseForbidden()
+
+    return HttpResponse(
+        generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST
+    )
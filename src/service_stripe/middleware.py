@@ -0,0 +1,439 @@
+import asyncio
+import cProfile
+import hmac
+import random
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from opentelemetry.trace import StatusCode
+from rest_framework.permissions import SAFE_METHODS
+
+from service_stripe import metrics, tracing
+from service_stripe.authentication import AdminAuthentication
+from service_stripe.routers import pin
+from service_stripe.utils import deadline, queries, timing
+from service_stripe.utils.profiling import save_profile
+
+
+def mark_async(middleware):
+    """
+    Mark a middleware instance as a coroutine function when the rest of the
+    chain is async, so that Django calls it without a sync adapter under ASGI
+    (see `django.utils.deprecation.MiddlewareMixin`).
+    """
+
+    if asyncio.iscoroutinefunction(middleware.get_response):
+        middleware._is_coroutine = asyncio.coroutines._is_coroutine
+
+
+class SlowQueryMiddleware:
+    """
+    Save the request's slow queries (see `service_stripe.utils.queries`)
+    under its URL name once it has finished.
+
+    Comes before MetricsMiddleware so that saving them is not counted as
+    part of the request.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        mark_async(self)
+
+    @staticmethod
+    def _flush(request):
+        match = request.resolver_match
+        queries.flush((match.url_name if match else None) or 'unmatched')
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        queries.start()
+        try:
+            return self.get_response(request)
+        finally:
+            self._flush(request)
+
+    async def __acall__(self, request):
+        queries.start()
+        try:
+            return await self.get_response(request)
+        finally:
+            await sync_to_async(self._flush)(request)
+
+
+class MetricsMiddleware:
+    """
+    Record the latency of each request by URL name, along with the number of
+    database queries it made and how long it waited on the database and
+    upstreams (Rehive and Stripe).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    DEPENDENCIES = ('db', 'rehive', 'stripe',)
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        mark_async(self)
+
+    def _observe(self, request, status, seconds):
+        match = request.resolver_match
+        endpoint = (match.url_name if match else None) or 'unmatched'
+        # Keep the calls made by the request around (eg. for query budgets).
+        timings = request.timings = timing.get()
+
+        metrics.REQUEST_SECONDS.labels(
+            endpoint, request.method, status
+        ).observe(seconds)
+        metrics.REQUEST_DB_QUERIES.labels(endpoint).observe(
+            timings.get('db', (0, 0))[0]
+        )
+        for dependency in self.DEPENDENCIES:
+            metrics.REQUEST_DEPENDENCY_SECONDS.labels(
+                endpoint, dependency
+            ).observe(timings.get(dependency, (0, 0))[1])
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        timing.start()
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            self._observe(request, status, time.perf_counter() - start)
+            timing.clear()
+
+    async def __acall__(self, request):
+        timing.start()
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            self._observe(request, status, time.perf_counter() - start)
+            timing.clear()
+
+
+class TracingMiddleware:
+    """
+    Record each request as a span, named after its URL name once resolved.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        mark_async(self)
+
+    def _finish(self, request, span, response):
+        match = request.resolver_match
+        if match and match.url_name:
+            span.update_name('{} {}'.format(request.method, match.url_name))
+            span.set_attribute('http.route', match.url_name)
+        span.set_attribute('http.status_code', response.status_code)
+        if response.status_code >= 500:
+            span.set_status(StatusCode.ERROR)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        with tracing.request_span(request) as span:
+            response = self.get_response(request)
+            if span.is_recording():
+                self._finish(request, span, response)
+            return response
+
+    async def __acall__(self, request):
+        with tracing.request_span(request) as span:
+            response = await self.get_response(request)
+            if span.is_recording():
+                self._finish(request, span, response)
+            return response
+
+
+class ProfilingMiddleware:
+    """
+    Profile a request with cProfile when an admin sends an `X-Profile` header
+    set to PROFILING_TOKEN or it is sampled (PROFILING_SAMPLE_RATE). Profiles
+    are stored in PROFILING_DIR and the profile id is returned in an
+    `X-Profile-Id` header.
+
+    Also reports the time the request spent on the database, Rehive and
+    Stripe in a `Server-Timing` header (if SERVER_TIMING is set, or the
+    request is profiled).
+
+    cProfile only sees the thread it runs in, so requests are not profiled
+    when the middleware chain is async (ASGI).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    SERVER_TIMINGS = (
+        ('db', 'Database'), ('rehive', 'Rehive'), ('stripe', 'Stripe'),
+    )
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        mark_async(self)
+
+    def _profile(self, request):
+        """
+        Decide whether to profile the request. Returns `None` (no), "sampled"
+        or "requested" (kept only if the request is made by an admin).
+
+        The admin is only known once the request has been authenticated, so
+        requests must also carry the PROFILING_TOKEN secret to be profiled.
+        """
+
+        token = settings.PROFILING_TOKEN
+        header = request.META.get('HTTP_X_PROFILE')
+        if token and header and hmac.compare_digest(
+                header.encode(), token.encode()):
+            return 'requested'
+        if random.random() < settings.PROFILING_SAMPLE_RATE:
+            return 'sampled'
+
+    @staticmethod
+    def _is_admin(user):
+        platform_user = getattr(user, '_platform_user', None) or {}
+        groups = [g['name'] for g in platform_user.get('groups', [])]
+        return bool(set(AdminAuthentication.groups).intersection(groups))
+
+    def _server_timing(self, response, seconds):
+        timings = timing.get()
+        entries = []
+        spent = 0
+        for name, description in self.SERVER_TIMINGS:
+            count, total = timings.get(name, (0, 0))
+            spent += total
+            entries.append('{};dur={:.1f};desc="{} ({})"'.format(
+                name, total * 1000, description, count
+            ))
+        entries.append('app;dur={:.1f};desc="Service"'.format(
+            max(seconds - spent, 0) * 1000
+        ))
+        entries.append('total;dur={:.1f}'.format(seconds * 1000))
+        response['Server-Timing'] = ', '.join(entries)
+
+    def _save(self, request, response, seconds, profiler, reason):
+        user = getattr(request, 'user', None)
+        if reason == 'requested' and not self._is_admin(user):
+            return
+
+        company = getattr(user, 'company', None)
+        match = request.resolver_match
+        response['X-Profile-Id'] = save_profile(profiler, {
+            'method': request.method,
+            'path': request.path,
+            'endpoint': match.url_name if match else None,
+            'status': response.status_code,
+            'duration': seconds,
+            'company': getattr(company, 'identifier', None),
+            'reason': reason,
+            'timings': timing.get(),
+        })
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        reason = self._profile(request)
+        profiler = cProfile.Profile() if reason else None
+
+        start = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            if profiler:
+                profiler.disable()
+        seconds = time.perf_counter() - start
+
+        if profiler:
+            self._save(request, response, seconds, profiler, reason)
+        if settings.SERVER_TIMING or reason == 'requested':
+            self._server_timing(response, seconds)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        if settings.SERVER_TIMING:
+            self._server_timing(response, time.perf_counter() - start)
+        return response
+
+
+class LoadSheddingMiddleware:
+    """
+    Reject new requests early once too many requests are in flight in this
+    worker process, instead of letting latency grow without limit.
+
+    Requests to paths in LOAD_SHEDDING_EXEMPT_PATHS (eg. metrics) are always
+    served.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        mark_async(self)
+
+    def _enter(self, request):
+        """
+        Count the request as in flight. Returns a response if the request is
+        shed, otherwise `None`.
+        """
+
+        with self.lock:
+            if self.in_flight >= settings.LOAD_SHEDDING_MAX_IN_FLIGHT:
+                shed = True
+            else:
+                shed = False
+                self.in_flight += 1
+
+        if shed:
+            metrics.SHED_REQUESTS.inc()
+            response = JsonResponse(
+                {
+                    'status': 'error',
+                    'message': 'The service is overloaded, please try again later.'
+                },
+                status=503
+            )
+            response['Retry-After'] = '1'
+            return response
+
+        metrics.IN_FLIGHT_REQUESTS.inc()
+
+    def _exit(self):
+        metrics.IN_FLIGHT_REQUESTS.dec()
+        with self.lock:
+            self.in_flight -= 1
+
+    def _exempt(self, request):
+        return (not settings.LOAD_SHEDDING_MAX_IN_FLIGHT
+                or request.path in settings.LOAD_SHEDDING_EXEMPT_PATHS)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        if self._exempt(request):
+            return self.get_response(request)
+
+        response = self._enter(request)
+        if response is not None:
+            return response
+
+        try:
+            return self.get_response(request)
+        finally:
+            self._exit()
+
+    async def __acall__(self, request):
+        if self._exempt(request):
+            return await self.get_response(request)
+
+        response = self._enter(request)
+        if response is not None:
+            return response
+
+        try:
+            return await self.get_response(request)
+        finally:
+            self._exit()
+
+
+class DeadlineMiddleware:
+    """
+    Start a request scoped deadline for upstream (Stripe and Rehive) calls.
+
+    Views can override the default budget (in seconds) by setting a
+    `timeout_budget` attribute. A budget of `None` disables the deadline.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        mark_async(self)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        try:
+            return self.get_response(request)
+        finally:
+            deadline.clear()
+
+    async def __acall__(self, request):
+        try:
+            return await self.get_response(request)
+        finally:
+            deadline.clear()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        deadline.start(
+            getattr(view_class, 'timeout_budget', settings.REQUEST_TIMEOUT_BUDGET)
+        )
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Keep a user's reads on the primary database for a short while after a
+    successful write request, so that they see their own writes on endpoints
+    served from read replicas.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        mark_async(self)
+
+    def _wrote(self, request, response):
+        return (request.method not in SAFE_METHODS
+                and response.status_code < 400
+                and settings.DATABASE_REPLICAS
+                and getattr(request.user, 'identifier', None))
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        response = self.get_response(request)
+        if self._wrote(request, response):
+            pin(request.user)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        if self._wrote(request, response):
+            await sync_to_async(pin)(request.user)
+        return response
@@ -0,0 +1,23 @@
+from django.core.management import call_command
+from django.db import migrations
+
+
+def create_cache_table(apps, schema_editor):
+    """
+    Create the table used by the database cache backend (if configured).
+    """
+
+    call_command(
+        'createcachetable', database=schema_editor.connection.alias
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_stripe', '0005_auto_20210203_1329'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cache_table, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.24 on 2026-10-18 22:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_stripe', '0006_cache_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='purge_requested',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 3.2.24 on 2026-10-18 22:59
+
+from decimal import Decimal
+import django.contrib.postgres.fields
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+import django_rehive_extras.fields
+import enumfields.fields
+import service_stripe.enums
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_stripe', '0007_company_purge_requested'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='payment_retention',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='retention_action',
+            field=enumfields.fields.EnumField(blank=True, enum=service_stripe.enums.RetentionAction, max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='company',
+            name='session_retention',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ArchivedSession',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('identifier', models.CharField(db_index=True, max_length=255, unique=True)),
+                ('mode', enumfields.fields.EnumField(db_index=True, enum=service_stripe.enums.SessionMode, max_length=20)),
+                ('success_url', models.URLField(max_length=250)),
+                ('cancel_url', models.URLField(max_length=250)),
+                ('completed', models.BooleanField(default=False)),
+                ('session_data', django.contrib.postgres.fields.jsonb.JSONField(blank=True, null=True)),
+                ('archived', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='service_stripe.user')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedPayment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('identifier', models.CharField(db_index=True, max_length=255, unique=True)),
+                ('amount', django_rehive_extras.fields.MoneyField(decimal_places=18, default=Decimal('0'), max_digits=30)),
+                ('payment_method', models.CharField(max_length=64)),
+                ('return_url', models.URLField(max_length=250)),
+                ('status', enumfields.fields.EnumField(db_index=True, default='processing', enum=service_stripe.enums.PaymentStatus, max_length=24)),
+                ('error', models.CharField(max_length=250, null=True)),
+                ('collection', models.CharField(max_length=64, null=True)),
+                ('txns', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(blank=True, max_length=64), default=list, size=None)),
+                ('intent_data', django.contrib.postgres.fields.jsonb.JSONField(blank=True, null=True)),
+                ('next_action', django.contrib.postgres.fields.jsonb.JSONField(blank=True, null=True)),
+                ('archived', models.DateTimeField(auto_now_add=True)),
+                ('currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='service_stripe.currency')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='service_stripe.user')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
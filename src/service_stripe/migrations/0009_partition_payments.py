@@ -0,0 +1,205 @@
+from datetime import datetime, timezone
+
+from django.db import NotSupportedError, migrations, models
+
+
+# Number of monthly partitions created after the current month. Later ones
+# are created by the `create_payment_partitions` command.
+PARTITIONS_AHEAD = 3
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def partition_payments(apps, schema_editor):
+    """
+    Replace the payment table with a table partitioned by month on `created`.
+
+    The existing table is attached as the partition for all payments created
+    before next month, so no rows are copied. A check constraint is validated
+    first so that attaching it does not have to scan the table again.
+    """
+
+    # Primary keys, foreign keys, indexes and triggers on partitioned tables,
+    # and default partitions, need Postgres 11.
+    if schema_editor.connection.pg_version < 110000:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute('SHOW server_version')
+            version = cursor.fetchone()[0]
+        raise NotSupportedError(
+            'Partitioning the payment table requires PostgreSQL 11 or newer '
+            '(the server runs {}). Upgrade it before migrating.'.format(version)
+        )
+
+    Payment = apps.get_model('service_stripe', 'Payment')
+    table = Payment._meta.db_table
+    legacy = table + '_legacy'
+    quote = schema_editor.quote_name
+    execute = schema_editor.execute
+
+    now = datetime.now(timezone.utc)
+    boundary = add_months(datetime(now.year, now.month, 1, tzinfo=timezone.utc), 1)
+
+    # Move the existing table and its indexes out of the way.
+    execute('ALTER TABLE {} RENAME TO {}'.format(quote(table), quote(legacy)))
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT indexname FROM pg_indexes WHERE tablename = %s', [legacy]
+        )
+        indexes = [row[0] for row in cursor.fetchall()]
+    for index in indexes:
+        execute('ALTER INDEX {} RENAME TO {}'.format(
+            quote(index), quote(index + '_legacy')
+        ))
+
+    execute(
+        'CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING STORAGE) '
+        'PARTITION BY RANGE (created)'.format(quote(table), quote(legacy))
+    )
+    execute('ALTER SEQUENCE {} OWNED BY {}.id'.format(
+        quote(table + '_id_seq'), quote(table)
+    ))
+
+    # The primary key of a partitioned table must include the partition key.
+    execute('ALTER TABLE {} ADD CONSTRAINT {} PRIMARY KEY (id, created)'.format(
+        quote(table), quote(table + '_pkey')
+    ))
+    for field in ('user', 'currency'):
+        field = Payment._meta.get_field(field)
+        execute(schema_editor._create_fk_sql(
+            Payment, field, '_fk_%(to_table)s_%(to_column)s'
+        ))
+
+    # Unique constraints must include the partition key too, so identifiers
+    # are only indexed (they are Stripe payment intent IDs).
+    for column, like in (
+            ('identifier', True), ('created', False), ('status', True),
+            ('user_id', False), ('currency_id', False)):
+        execute('CREATE INDEX {} ON {} ({})'.format(
+            quote(schema_editor._create_index_name(table, [column])),
+            quote(table), quote(column)
+        ))
+        if like:
+            execute('CREATE INDEX {} ON {} ({} varchar_pattern_ops)'.format(
+                quote(schema_editor._create_index_name(table, [column], '_like')),
+                quote(table), quote(column)
+            ))
+
+    execute(
+        'ALTER TABLE {} ADD CONSTRAINT {} CHECK (created < %s) NOT VALID'.format(
+            quote(legacy), quote(legacy + '_created_check')
+        ),
+        [boundary]
+    )
+    execute('ALTER TABLE {} VALIDATE CONSTRAINT {}'.format(
+        quote(legacy), quote(legacy + '_created_check')
+    ))
+    # Replaced by the (id, created) primary key when attached.
+    execute('ALTER TABLE {} DROP CONSTRAINT {}'.format(
+        quote(legacy), quote(table + '_pkey_legacy')
+    ))
+    execute(
+        'ALTER TABLE {} ATTACH PARTITION {} '
+        'FOR VALUES FROM (MINVALUE) TO (%s)'.format(quote(table), quote(legacy)),
+        [boundary]
+    )
+    execute('ALTER TABLE {} DROP CONSTRAINT {}'.format(
+        quote(legacy), quote(legacy + '_created_check')
+    ))
+
+    # Catch payments that fall outside of the monthly partitions.
+    execute('CREATE TABLE {} PARTITION OF {} DEFAULT'.format(
+        quote(table + '_default'), quote(table)
+    ))
+
+    # Unique constraints must include the partition key, so identifiers are
+    # kept unique by a table of their own that triggers keep in sync with the
+    # payment table (including bulk inserts and changed identifiers). A
+    # duplicate payment intent fails to insert (or update) with an integrity
+    # error.
+    identifiers = table + '_identifier'
+    execute(
+        'CREATE TABLE {} (identifier varchar(255) PRIMARY KEY)'.format(
+            quote(identifiers)
+        )
+    )
+    execute('INSERT INTO {} (identifier) SELECT identifier FROM {}'.format(
+        quote(identifiers), quote(table)
+    ))
+    execute("""
+        CREATE FUNCTION {insert_function}() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO {identifiers} (identifier) VALUES (NEW.identifier);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE FUNCTION {delete_function}() RETURNS trigger AS $$
+        BEGIN
+            DELETE FROM {identifiers} WHERE identifier = OLD.identifier;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE FUNCTION {update_function}() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.identifier IS DISTINCT FROM OLD.identifier THEN
+                DELETE FROM {identifiers} WHERE identifier = OLD.identifier;
+                INSERT INTO {identifiers} (identifier) VALUES (NEW.identifier);
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER {insert_function} AFTER INSERT ON {table}
+        FOR EACH ROW EXECUTE PROCEDURE {insert_function}();
+
+        CREATE TRIGGER {delete_function} AFTER DELETE ON {table}
+        FOR EACH ROW EXECUTE PROCEDURE {delete_function}();
+
+        CREATE TRIGGER {update_function} AFTER UPDATE OF identifier ON {table}
+        FOR EACH ROW EXECUTE PROCEDURE {update_function}();
+    """.format(
+        table=quote(table),
+        identifiers=quote(identifiers),
+        insert_function=quote(identifiers + '_insert'),
+        delete_function=quote(identifiers + '_delete'),
+        update_function=quote(identifiers + '_update'),
+    ))
+
+    # The partitions for the coming months. Created here rather than with the
+    # `create_payment_partitions` command, so that later changes to it do not
+    # affect this migration.
+    start = boundary
+    for _ in range(PARTITIONS_AHEAD):
+        end = add_months(start, 1)
+        execute(
+            'CREATE TABLE {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)'
+            .format(quote('{}_{:%Y%m}'.format(table, start)), quote(table)),
+            [start, end]
+        )
+        start = end
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_stripe', '0008_retention'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(partition_payments),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='payment',
+                    name='identifier',
+                    field=models.CharField(db_index=True, max_length=255),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.24 on 2026-10-18 23:09
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_stripe', '0009_partition_payments'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='archivedpayment',
+            name='collection',
+            field=models.CharField(db_index=True, max_length=64, null=True),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='collection',
+            field=models.CharField(db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['txns'], name='payment_txns_gin'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.24 on 2026-10-18 23:11
+
+from django.db import migrations, models
+import django.db.models.expressions
+import django.db.models.fields.json
+import django.db.models.functions.comparison
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_stripe', '0010_payment_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(django.db.models.functions.comparison.Coalesce(django.db.models.fields.json.KeyTextTransform('latest_charge', 'intent_data'), django.db.models.fields.json.KeyTextTransform('id', django.db.models.fields.json.KeyTransform(0, django.db.models.fields.json.KeyTransform('data', django.db.models.fields.json.KeyTransform('charges', 'intent_data'))))), name='payment_intent_charge'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(django.db.models.expressions.ExpressionWrapper(django.db.models.fields.json.KeyTextTransform('customer', 'intent_data'), output_field=models.TextField()), name='payment_intent_customer'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.24 on 2026-10-18 23:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('service_stripe', '0011_payment_intent_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('fingerprint', models.CharField(max_length=32)),
+                ('view', models.CharField(max_length=255)),
+                ('sql', models.TextField()),
+                ('count', models.BigIntegerField(default=0)),
+                ('duration', models.FloatField(default=0)),
+                ('max_duration', models.FloatField(default=0)),
+                ('plan', models.TextField(blank=True, null=True)),
+                ('plan_updated', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='slowquery',
+            unique_together={('fingerprint', 'view')},
+        ),
+    ]
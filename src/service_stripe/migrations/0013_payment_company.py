@@ -0,0 +1,125 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Number of payments whose company is set per statement (and transaction).
+BACKFILL_BATCH_SIZE = 10000
+
+
+def partitions(cursor, table):
+    cursor.execute(
+        'SELECT inhrelid::regclass::text FROM pg_inherits '
+        'WHERE inhparent = %s::regclass ORDER BY 1',
+        [table]
+    )
+    return [name for name, in cursor.fetchall()]
+
+
+def backfill_companies(apps, schema_editor):
+    """
+    Set the company of the payments that have none from their user, one
+    partition and range of ids at a time. The migration is not atomic, so
+    each batch is committed on its own and rows are not all locked at once.
+    """
+
+    table = apps.get_model('service_stripe', 'Payment')._meta.db_table
+    users = apps.get_model('service_stripe', 'User')._meta.db_table
+    quote = schema_editor.quote_name
+
+    with schema_editor.connection.cursor() as cursor:
+        for partition in partitions(cursor, table):
+            cursor.execute('SELECT min(id), max(id) FROM {}'.format(
+                quote(partition)
+            ))
+            low, high = cursor.fetchone()
+            if low is None:
+                continue
+
+            for start in range(low, high + 1, BACKFILL_BATCH_SIZE):
+                cursor.execute(
+                    """
+                    UPDATE {partition} p SET company_id = u.company_id
+                    FROM {users} u
+                    WHERE u.id = p.user_id AND p.company_id IS NULL
+                    AND p.id >= %s AND p.id < %s
+                    """.format(partition=quote(partition), users=quote(users)),
+                    [start, start + BACKFILL_BATCH_SIZE]
+                )
+
+
+def add_triggers(apps, schema_editor):
+    """
+    Set `updated` to the database's clock, and fill in a missing company,
+    whenever a payment is written. Row triggers that change the row can only
+    be created on the partitions (before Postgres 13), so new partitions get
+    the trigger when they are created (see `create_payment_partitions`).
+
+    `clock_timestamp()` is the time of the write itself, so a change is
+    committed at most the time between its write and the end of its
+    transaction after its `updated` (see PAYMENT_CHANGES_DELAY).
+    """
+
+    table = apps.get_model('service_stripe', 'Payment')._meta.db_table
+    users = apps.get_model('service_stripe', 'User')._meta.db_table
+    quote = schema_editor.quote_name
+    trigger = quote(table + '_write')
+
+    schema_editor.execute("""
+        CREATE FUNCTION {trigger}() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated := clock_timestamp();
+            IF NEW.company_id IS NULL THEN
+                SELECT company_id INTO NEW.company_id
+                FROM {users} WHERE id = NEW.user_id;
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql;
+    """.format(trigger=trigger, users=quote(users)))
+
+    with schema_editor.connection.cursor() as cursor:
+        for partition in partitions(cursor, table):
+            schema_editor.execute(
+                'CREATE TRIGGER {trigger} BEFORE INSERT OR UPDATE ON {partition} '
+                'FOR EACH ROW EXECUTE PROCEDURE {trigger}()'.format(
+                    trigger=trigger, partition=quote(partition)
+                )
+            )
+
+
+def remove_triggers(apps, schema_editor):
+    table = apps.get_model('service_stripe', 'Payment')._meta.db_table
+    # Drops the triggers on the partitions too.
+    schema_editor.execute('DROP FUNCTION {}() CASCADE'.format(
+        schema_editor.quote_name(table + '_write')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    # Backfilled in batches that are committed as they go (see 0014 for the
+    # constraints).
+    atomic = False
+
+    dependencies = [
+        ('service_stripe', '0012_slow_queries'),
+    ]
+
+    operations = [
+        # Without a constraint until every payment has a company.
+        migrations.AddField(
+            model_name='payment',
+            name='company',
+            field=models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='service_stripe.company'),
+        ),
+        # Before the triggers are added, so that `updated` is left as is.
+        migrations.RunPython(backfill_companies, migrations.RunPython.noop),
+        migrations.RunPython(add_triggers, remove_triggers),
+        # Payments created in the meantime by servers still running the
+        # previous release.
+        migrations.RunPython(backfill_companies, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['company', 'updated', 'id'], name='payment_company_updated_id'),
+        ),
+    ]
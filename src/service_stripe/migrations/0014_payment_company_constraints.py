@@ -0,0 +1,19 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    # Every payment has a company once 0013 has been applied (and the
+    # trigger fills it in for new ones), so the constraints can be added.
+    dependencies = [
+        ('service_stripe', '0013_payment_company'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='company',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='service_stripe.company'),
+        ),
+    ]
@@ -1,19 +1,29 @@
 import uuid
 from logging import getLogger
 from decimal import Decimal
+from urllib.parse import quote_plus
 
 import stripe
 from enumfields import EnumField
-from rehive import Rehive, APIException
-from django.db.models import Q
+from rehive import APIException
+from django.db.models import ExpressionWrapper, Q
+from django.db.models.functions import Coalesce
 from django.db import models, transaction
 from django_rehive_extras.models import DateModel
 from django_rehive_extras.fields import MoneyField
 from django.contrib.postgres.fields import ArrayField, JSONField
+from django.db.models.fields.json import KeyTextTransform, KeyTransform
+from django.contrib.postgres.indexes import GinIndex
 from django.core.exceptions import ObjectDoesNotExist
 
+from service_stripe import metrics, tracing
+from service_stripe.routers import pin
+from service_stripe.utils import aclients
 from service_stripe.utils.common import to_cents
-from service_stripe.enums import SessionMode, PaymentStatus
+from service_stripe.utils.clients import get_rehive, stripe_call
+from service_stripe.utils.breakers import rehive_breaker
+from service_stripe.utils.listeners import notify_payment
+from service_stripe.enums import SessionMode, PaymentStatus, RetentionAction
 
 
 logger = getLogger('django')
@@ -35,6 +45,17 @@ class Company(DateModel):
         'service_stripe.Currency', related_name="+"
     )
     active = models.BooleanField(default=True)
+    # Set when the company was deactivated with a purge, its data is then
+    # deleted in the background (see `purge_companies`).
+    purge_requested = models.DateTimeField(null=True, blank=True)
+    # Retention policy, the number of days after which sessions and settled
+    # payments are archived or exported (see `apply_retention`), 0 keeps them
+    # forever. Falls back to the default retention settings if not set.
+    session_retention = models.PositiveIntegerField(null=True, blank=True)
+    payment_retention = models.PositiveIntegerField(null=True, blank=True)
+    retention_action = EnumField(
+        RetentionAction, max_length=20, null=True, blank=True
+    )
 
     def __str__(self):
         return self.identifier
@@ -75,6 +96,10 @@ class User(DateModel):
 
     @property
     def last_payment_method(self):
+        # Annotated by views that list users.
+        if hasattr(self, 'latest_payment_method'):
+            return self.latest_payment_method
+
         try:
             return self.payment_set.latest('created').payment_method
         except Payment.DoesNotExist:
@@ -90,12 +115,13 @@ class User(DateModel):
         if not self.configured:
             return []
 
-        return stripe.PaymentMethod.list(
-            customer=self.stripe_customer_id,
-            type="card",
-            limit=100,
-            api_key=self.company.stripe_api_key
-        )["data"]
+        with stripe_call(self.company.identifier):
+            return stripe.PaymentMethod.list(
+                customer=self.stripe_customer_id,
+                type="card",
+                limit=100,
+                api_key=self.company.stripe_api_key
+            )["data"]
 
     def payment_method(self, stripe_id):
         """
@@ -105,8 +131,44 @@ class User(DateModel):
         if not self.configured:
             raise ObjectDoesNotExist()
 
-        method = stripe.PaymentMethod.retrieve(
-            stripe_id, api_key=self.company.stripe_api_key
+        with stripe_call(self.company.identifier):
+            method = stripe.PaymentMethod.retrieve(
+                stripe_id, api_key=self.company.stripe_api_key
+            )
+
+        if method["customer"] != self.stripe_customer_id:
+            raise ObjectDoesNotExist()
+
+        return method
+
+    async def apayment_methods(self):
+        """
+        Async version of `payment_methods`.
+        """
+
+        if not self.configured:
+            return []
+
+        return (await aclients.stripe_call(
+            self.company.identifier, 'get', '/v1/payment_methods',
+            self.company.stripe_api_key,
+            customer=self.stripe_customer_id,
+            type="card",
+            limit=100
+        ))["data"]
+
+    async def apayment_method(self, stripe_id):
+        """
+        Async version of `payment_method`.
+        """
+
+        if not self.configured:
+            raise ObjectDoesNotExist()
+
+        method = await aclients.stripe_call(
+            self.company.identifier, 'get',
+            '/v1/payment_methods/{}'.format(quote_plus(stripe_id)),
+            self.company.stripe_api_key
         )
 
         if method["customer"] != self.stripe_customer_id:
@@ -134,7 +196,7 @@ class Currency(DateModel):
         return str(self.code)
 
 
-class Session(DateModel):
+class BaseSession(DateModel):
     identifier = models.CharField(max_length=255, unique=True, db_index=True)
     user = models.ForeignKey('service_stripe.User', on_delete=models.CASCADE)
     mode = EnumField(SessionMode, max_length=20, db_index=True)
@@ -145,11 +207,45 @@ class Session(DateModel):
     # This is a point in time snapshot taken at the time of creation.
     session_data = JSONField(null=True, blank=True)
 
+    class Meta:
+        abstract = True
+
     def __str__(self):
         return str(self.identifier)
 
 
-class Payment(DateModel):
+class Session(BaseSession):
+    pass
+
+
+class ArchivedSession(BaseSession):
+    """
+    Session moved out of the session table by the retention policy.
+    """
+
+    archived = models.DateTimeField(auto_now_add=True)
+
+
+# Stripe IDs in the payment intent snapshot (`intent_data`) that payments are
+# looked up by. The charge is `latest_charge` in newer Stripe API versions and
+# the latest entry of `charges` in older ones. Queries must use the same
+# expressions (eg. with `alias()`) to use their indexes.
+# NOTE: `Coalesce` must not be given an `output_field` (it is text already).
+# Fields passed as extra arguments never compare equal to the ones in the
+# migrations, so `makemigrations` would recreate the index every time.
+INTENT_CHARGE = Coalesce(
+    KeyTextTransform('latest_charge', 'intent_data'),
+    KeyTextTransform('id', KeyTransform(0, KeyTransform(
+        'data', KeyTransform('charges', 'intent_data')
+    )))
+)
+INTENT_CUSTOMER = ExpressionWrapper(
+    KeyTextTransform('customer', 'intent_data'),
+    output_field=models.TextField()
+)
+
+
+class BasePayment(DateModel):
     identifier = models.CharField(max_length=255, unique=True, db_index=True)
     user = models.ForeignKey('service_stripe.User', on_delete=models.CASCADE)
     currency = models.ForeignKey(
@@ -165,19 +261,65 @@ class Payment(DateModel):
         db_index=True
     )
     error = models.CharField(max_length=250, null=True)
-    collection = models.CharField(max_length=64, null=True)
+    collection = models.CharField(max_length=64, null=True, db_index=True)
     txns = ArrayField(
         models.CharField(max_length=64, blank=True),
         default=list
     )
     # NOTE: Internal-only Stripe data, should not be accessible via the API.
-    # This is a point in time snapshot taken at the time of creation.
+    # This is a point in time snapshot taken at the time of creation, and
+    # updated when the payment succeeds or fails.
     intent_data = JSONField(null=True, blank=True)
     next_action = JSONField(null=True, blank=True)
 
+    class Meta:
+        abstract = True
+
     def __str__(self):
         return str(self.identifier)
 
+    @property
+    def integer_amount(self):
+        """
+        Get an integer from amount.
+        """
+
+        divisibility = Decimal(self.currency.divisibility)
+        return to_cents(self.amount, divisibility)
+
+
+class Payment(BasePayment):
+    # The payment table is partitioned by month on `created` (see migration
+    # 0009), so identifiers cannot have a unique constraint on it. They are
+    # kept unique by the `service_stripe_payment_identifier` table instead,
+    # which triggers keep in sync on insert, update and delete (a duplicate
+    # raises an `IntegrityError`).
+    identifier = models.CharField(max_length=255, db_index=True)
+    # The company of the user, so that the change feed can be read for one
+    # company from an index (set when saved, see `save`).
+    company = models.ForeignKey(
+        'service_stripe.Company', on_delete=models.CASCADE, db_index=False
+    )
+
+    # NOTE: `updated` is set by a trigger to the database's clock (see
+    # migration 0013), so that the change feed does not depend on the clocks
+    # of the app servers. The value on the instance is the app server's until
+    # it is reloaded.
+
+    class Meta:
+        indexes = [
+            # Lookup of payments by Rehive transaction (`txns__contains`).
+            GinIndex(fields=['txns'], name='payment_txns_gin'),
+            # Lookup of payments by Stripe charge and customer.
+            models.Index(INTENT_CHARGE, name='payment_intent_charge'),
+            models.Index(INTENT_CUSTOMER, name='payment_intent_customer'),
+            # Change feed (`admin/payments/changes/`) and retention.
+            models.Index(
+                fields=['company', 'updated', 'id'],
+                name='payment_company_updated_id'
+            ),
+        ]
+
     def save(self, *args, **kwargs):
         """
         Unset the "next action" field when the status is updated to anything
@@ -186,28 +328,50 @@ class Payment(DateModel):
         if self.status in  (PaymentStatus.SUCCEEDED, PaymentStatus.FAILED,):
             self.next_action = None
 
+        if self.company_id is None and self.user_id is not None:
+            self.company_id = self.user.company_id
+
         return super().save(*args, **kwargs)
 
-    @property
-    def integer_amount(self):
+    def transition(self, status, error=None, intent=None):
         """
-        Get an integer from amount.
+        Transition the payment to a new status, recording the outcome.
         """
 
-        divisibility = Decimal(self.currency.divisibility)
-        return to_cents(self.amount, divisibility)
+        with tracing.span('payment.transition', {
+                'payment.id': self.identifier,
+                'payment.status': status.value}) as span:
+            try:
+                applied = self._transition(status, error=error, intent=intent)
+            except Exception:
+                metrics.PAYMENT_TRANSITIONS.labels(status.value, 'error').inc()
+                raise
+
+            outcome = 'applied' if applied else 'unchanged'
+            span.set_attribute('payment.outcome', outcome)
+            metrics.PAYMENT_TRANSITIONS.labels(status.value, outcome).inc()
 
     @transaction.atomic
-    def transition(self, status, error=None):
-        # Lock on the payment to prevent race conditions.
-        payment = Payment.objects.select_for_update().get(id=self.id)
+    def _transition(self, status, error=None, intent=None):
+        # Lock on the payment to prevent race conditions. Filtering on
+        # `created` limits the lookup to the payment's partition.
+        with tracing.span('payment.lock'):
+            payment = Payment.objects.select_for_update().get(
+                id=self.id, created=self.created
+            )
 
         # Do nothing if the status is already the same.
         if payment.status == status:
-            return
+            return False
 
         # Initiate the Rehive SDK.
-        rehive = Rehive(payment.user.company.admin.token)
+        company = payment.user.company
+        rehive = get_rehive(company.admin.token)
+        tracing.set_attributes({'company.id': company.identifier})
+
+        # Keep the latest state of the intent (eg. its charge) if known.
+        if intent is not None:
+            payment.intent_data = intent
 
         # Handle failed payments.
         if status == PaymentStatus.FAILED:
@@ -217,9 +381,10 @@ class Payment(DateModel):
             # If a transaction collection already exists then we need to
             # transition it to failed as well.
             if payment.collection:
-                rehive.admin.transaction_collections.update(
-                    payment.collection, status="failed"
-                )
+                with rehive_breaker.guard(company.identifier):
+                    rehive.admin.transaction_collections.update(
+                        payment.collection, status="failed"
+                    )
 
         # Handle succeeded payments.
         elif status == PaymentStatus.SUCCEEDED:
@@ -228,9 +393,10 @@ class Payment(DateModel):
             # If a transaction collection already exists then we need to
             # transition it to complete as well.
             if payment.collection:
-                rehive.admin.transaction_collections.update(
-                    payment.collection, status="complete"
-                )
+                with rehive_breaker.guard(company.identifier):
+                    rehive.admin.transaction_collections.update(
+                        payment.collection, status="complete"
+                    )
 
             # If no transaction collection exists then one needs to be created.
             else:
@@ -250,9 +416,10 @@ class Payment(DateModel):
                         }
                     }
                 ]
-                collection = rehive.admin.transaction_collections.post(
-                    transactions=transactions
-                )
+                with rehive_breaker.guard(company.identifier):
+                    collection = rehive.admin.transaction_collections.post(
+                        transactions=transactions
+                    )
                 payment.collection = collection["id"]
                 payment.txns = [
                     txn['id'] for txn in collection["transactions"]
@@ -260,3 +427,45 @@ class Payment(DateModel):
 
         # Save the payment with its new data.
         payment.save()
+
+        # Wake up any clients waiting on this payment (sent on commit).
+        notify_payment(payment)
+        # Let the user see the new status on endpoints served by replicas.
+        pin(payment.user)
+        return True
+
+
+class ArchivedPayment(BasePayment):
+    """
+    Settled payment moved out of the payment table by the retention policy.
+    """
+
+    archived = models.DateTimeField(auto_now_add=True)
+
+
+class SlowQuery(DateModel):
+    """
+    Queries made by a view that were slower than SLOW_QUERY_THRESHOLD,
+    aggregated by their fingerprint (the SQL without its values).
+    """
+
+    fingerprint = models.CharField(max_length=32)
+    view = models.CharField(max_length=255)
+    sql = models.TextField()
+    count = models.BigIntegerField(default=0)
+    # Total and maximum duration in seconds.
+    duration = models.FloatField(default=0)
+    max_duration = models.FloatField(default=0)
+    # Latest sampled `EXPLAIN` output.
+    plan = models.TextField(null=True, blank=True)
+    plan_updated = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('fingerprint', 'view')
+
+    def __str__(self):
+        return str(self.fingerprint)
+
+    @property
+    def mean_duration(self):
+        return self.duration / self.count if self.count else 0
@@ -0,0 +1,72 @@
+import random
+from contextlib import contextmanager
+
+from asgiref.local import Local
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+_state = Local()
+
+
+def _pin_key(user):
+    return 'replica:pin:{}'.format(user.identifier)
+
+
+def pin(user):
+    """
+    Keep a user's reads on the primary for a short while after they write.
+    """
+
+    if settings.DATABASE_REPLICAS and settings.REPLICA_STICKY_SECONDS:
+        cache.set(_pin_key(user), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_pinned(user):
+    return cache.get(_pin_key(user)) is not None
+
+
+@contextmanager
+def read_replica(user=None):
+    """
+    Send the reads in a block to a random replica, unless there are no
+    replicas or the user recently wrote something.
+    """
+
+    if not settings.DATABASE_REPLICAS or (user and is_pinned(user)):
+        yield
+        return
+
+    previous = getattr(_state, 'replica', None)
+    _state.replica = random.choice(settings.DATABASE_REPLICAS)
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+class ReplicaRouter:
+    """
+    Route reads inside `read_replica` blocks to a replica. Everything else,
+    including reads inside transactions (eg. `select_for_update`) and reads
+    of the cache table, goes to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        replica = getattr(_state, 'replica', None)
+        if (replica is None
+                or model._meta.app_label != 'service_stripe'
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return None
+        return replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
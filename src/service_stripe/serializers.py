@@ -1,22 +1,32 @@
 import os
 import decimal
+import time
 import uuid
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
+from functools import partial
 from decimal import Decimal
 
 import stripe
+from asgiref.sync import sync_to_async
 from requests.models import PreparedRequest
-from rehive import Rehive, APIException
+from rehive import APIException
 from rest_framework import serializers
-from django.db import transaction
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models.functions import Upper
+from django.utils import timezone
 from django.core.exceptions import ObjectDoesNotExist
 from drf_rehive_extras.serializers import BaseModelSerializer
 from drf_rehive_extras.fields import TimestampField
 
 from config import settings
+from service_stripe import metrics, tracing
 from service_stripe.models import Company, User, Currency, Session, Payment
-from service_stripe.enums import SessionMode, PaymentStatus
+from service_stripe.enums import SessionMode, PaymentStatus, RetentionAction
+from service_stripe.exceptions import DeadlineExceeded, ServiceUnavailable
 from service_stripe.utils.common import to_cents, from_cents
+from service_stripe.utils import aclients
+from service_stripe.utils.clients import fan_out, get_rehive, stripe_call
+from service_stripe.utils.currencies import apply_currencies, fetch_currencies
 
 from logging import getLogger
 
@@ -25,6 +35,76 @@ stripe.api_version = os.environ.get('STRIPE_API_VERSION')
 
 logger = getLogger('django')
 
+# Intent metadata marking payments created in a batch, whose payments are only
+# saved once every intent in the batch has been created. The metadata must be
+# the same for every attempt with the same idempotency key (Stripe rejects a
+# reused key with different parameters), so it only holds what is needed to
+# save the payment from its webhook if the batch fails to (see
+# `save_batch_payment`).
+BATCH_METADATA_KEY = 'service_stripe_batch'
+BATCH_RETURN_URL_METADATA_KEY = 'service_stripe_return_url'
+
+
+def save_payment(payment):
+    """
+    Save a new payment, or get the payment that was saved with the same
+    identifier in the meantime (eg. by its webhook or a retried batch).
+    """
+
+    try:
+        with transaction.atomic():
+            payment.save()
+    except IntegrityError:
+        return Payment.objects.select_related('user', 'currency').get(
+            identifier=payment.identifier, user=payment.user
+        )
+
+    return payment
+
+
+def save_batch_payment(intent, company):
+    """
+    Save the payment of an intent created in a batch from the intent itself.
+    Payments of a batch are only saved once all of its intents have been
+    created, so a batch that fails (or runs out of time) after its intents
+    were confirmed would otherwise leave charges without payments.
+
+    Returns `None` if the intent was not created in a batch of the company.
+    """
+
+    metadata = intent.get("metadata") or {}
+    if not (metadata.get(BATCH_METADATA_KEY)
+            and metadata.get(BATCH_RETURN_URL_METADATA_KEY)):
+        return None
+
+    try:
+        user = User.objects.get(
+            company=company, stripe_customer_id=intent["customer"]
+        )
+        currency = Currency.objects.get(
+            company=company, code__iexact=intent["currency"]
+        )
+    except (User.DoesNotExist, Currency.DoesNotExist):
+        return None
+
+    logger.warning(
+        "Saving the payment of batch intent {} from its webhook.".format(
+            intent["id"]
+        )
+    )
+    return save_payment(Payment(
+        identifier=intent["id"],
+        intent_data=intent,
+        next_action=intent.get("next_action"),
+        user=user,
+        currency=currency,
+        amount=from_cents(
+            amount=intent["amount"], divisibility=currency.divisibility
+        ),
+        payment_method=intent["payment_method"],
+        return_url=metadata.get(BATCH_RETURN_URL_METADATA_KEY)
+    ))
+
 
 class EnumField(serializers.ChoiceField):
     def __init__(self, enum, **kwargs):
@@ -92,7 +172,7 @@ class ActivateSerializer(serializers.Serializer):
 
     def validate(self, validated_data):
         token = validated_data.get('token')
-        rehive = Rehive(token)
+        rehive = get_rehive(token)
 
         try:
             user = rehive.auth.get()
@@ -103,21 +183,26 @@ class ActivateSerializer(serializers.Serializer):
         except APIException:
             raise serializers.ValidationError({"token": ["Invalid user."]})
 
+        # The remaining calls only depend on the token being valid.
+        company_call, currencies_call, subtypes_call = fan_out(
+            rehive.admin.company.get,
+            partial(fetch_currencies, rehive),
+            rehive.admin.subtypes.get,
+        )
+
         try:
-            company = rehive.admin.company.get()
+            company = company_call.result()
         except APIException:
             raise serializers.ValidationError({"token": ["Invalid company."]})
 
         try:
-            currencies = rehive.admin.currencies.get(
-                filters={"page_size": 50}
-            )
+            currencies = currencies_call.result()
         except APIException:
             raise serializers.ValidationError({"non_field_errors":
                 ["Unable to configure currencies."]})
 
         try:
-            subtypes = rehive.admin.subtypes.get()
+            subtypes = subtypes_call.result()
         except APIException:
             raise serializers.ValidationError(
                 {"non_field_errors": ["Unable to configure subtypes."]})
@@ -137,7 +222,7 @@ class ActivateSerializer(serializers.Serializer):
         currencies = validated_data.get('currencies')
         subtypes = validated_data.get('subtypes')
 
-        rehive = Rehive(token)
+        rehive = get_rehive(token)
 
         # Activate an existing company.
         try:
@@ -158,6 +243,11 @@ class ActivateSerializer(serializers.Serializer):
             user.save()
         # If company existed then reactivate it.
         else:
+            if company.purge_requested:
+                raise serializers.ValidationError(
+                    {"token": ["The company is being purged, try again later."]}
+                )
+
             # If reactivating a company using a different service admin then
             # create a new user and set it as the admin.
             if str(company.admin.identifier) != rehive_user["id"]:
@@ -182,18 +272,7 @@ class ActivateSerializer(serializers.Serializer):
                 company.save()
 
         # Add required currencies to service automatically.
-        for kwargs in currencies:
-            currency = Currency.objects.get_or_create(
-                code=kwargs['code'],
-                company=company,
-                defaults={
-                    "display_code": kwargs['display_code'],
-                    "description": kwargs['description'],
-                    "symbol": kwargs['symbol'],
-                    "unit": kwargs['unit'],
-                    "divisibility": kwargs['divisibility']
-                }
-            )
+        apply_currencies(company, currencies)
 
         # Add required subtypes to rehive automatically.
         required_subtypes = [
@@ -225,7 +304,7 @@ class DeactivateSerializer(serializers.Serializer):
 
     def validate(self, validated_data):
         token = validated_data.get('token')
-        rehive = Rehive(token)
+        rehive = get_rehive(token)
 
         try:
             user = rehive.auth.get()
@@ -249,11 +328,11 @@ class DeactivateSerializer(serializers.Serializer):
     def delete(self):
         company = self.validated_data['company']
         purge = self.validated_data.get('purge', False)
-        if purge is True:
-            company.delete()
-            return
         company.active = False
         company.admin.token = None
+        # The company's data is deleted in batches by a background job.
+        if purge is True:
+            company.purge_requested = timezone.now()
         company.save()
         company.admin.save()
 
@@ -284,12 +363,13 @@ class WebhookSerializer(serializers.Serializer):
         sig_header = self.context['request'].META['HTTP_STRIPE_SIGNATURE']
 
         try:
-            event = stripe.Webhook.construct_event(
-                payload=self.context['request'].raw_body,
-                sig_header=sig_header,
-                secret=company.stripe_secret,
-                api_key=company.stripe_api_key
-            )
+            with tracing.span('webhook.verify_signature'):
+                event = stripe.Webhook.construct_event(
+                    payload=self.context['request'].raw_body,
+                    sig_header=sig_header,
+                    secret=company.stripe_secret,
+                    api_key=company.stripe_api_key
+                )
         except ValueError as e:
             raise serializers.ValidationError(
                 {"non_field_errors": ["Invalid payload."]}
@@ -299,9 +379,43 @@ class WebhookSerializer(serializers.Serializer):
                 {"non_field_errors": ["Invalid signature"]}
             )
 
+        lag = max(time.time() - event['created'], 0)
+        metrics.WEBHOOK_LAG_SECONDS.labels(event['type']).observe(lag)
+        tracing.set_attributes({
+            'stripe.event.id': event['id'],
+            'stripe.event.type': event['type'],
+            'stripe.event.lag': lag,
+        })
+
         validated_data["company"] = company
         return validated_data
 
+    @staticmethod
+    def get_payment(intent, company):
+        """
+        Get the payment for a payment intent. Payments are created after their
+        intent, so only the payment partitions from around the time the intent
+        was created need to be searched.
+
+        The payment of an intent created in a batch is saved from the intent
+        if the batch has not saved it (yet).
+        """
+
+        filters = {"identifier": intent["id"], "user__company": company}
+        if intent.get("created"):
+            filters["created__gte"] = datetime.fromtimestamp(
+                intent["created"], tz=timezone.utc
+            ) - timedelta(days=1)
+
+        with tracing.span('webhook.get_payment', {'payment.id': intent["id"]}):
+            try:
+                return Payment.objects.get(**filters)
+            except Payment.DoesNotExist:
+                payment = save_batch_payment(intent, company)
+                if payment is None:
+                    raise
+                return payment
+
     def create(self, validated_data):
         company = validated_data.get("company")
 
@@ -327,23 +441,19 @@ class WebhookSerializer(serializers.Serializer):
         elif validated_data['type'] == 'payment_intent.succeeded':
             intent = validated_data['data']['object']
             try:
-                payment = Payment.objects.get(
-                    identifier=intent["id"], user__company=company
-                )
+                payment = self.get_payment(intent, company)
             except Payment.DoesNotExist:
                 # Do not throw a response error but include a message.
                 return {"message": "Invalid payment for this service/company."}
 
-            payment.transition(PaymentStatus.SUCCEEDED)
+            payment.transition(PaymentStatus.SUCCEEDED, intent=intent)
 
         # Handle payment_intent.payment_failed.
         # When a payment fails in Stripe.
         elif validated_data['type'] == 'payment_intent.payment_failed':
             intent = validated_data['data']['object']
             try:
-                payment = Payment.objects.get(
-                    identifier=intent["id"], user__company=company
-                )
+                payment = self.get_payment(intent, company)
             except Payment.DoesNotExist:
                 # Do not throw a response error but include a message.
                 return {"message": "Invalid payment for this service/company."}
@@ -351,7 +461,9 @@ class WebhookSerializer(serializers.Serializer):
             error_message = intent['last_payment_error']['message'] \
                 if intent.get('last_payment_error') else None
 
-            payment.transition(PaymentStatus.FAILED, error=error_message)
+            payment.transition(
+                PaymentStatus.FAILED, error=error_message, intent=intent
+            )
 
         return validated_data
 
@@ -360,6 +472,9 @@ class WebhookSerializer(serializers.Serializer):
 class AdminCompanySerializer(BaseModelSerializer):
     id = serializers.CharField(source='identifier', read_only=True)
     stripe_currencies = CurrencySerializer(many=True, read_only=True)
+    retention_action = EnumField(
+        enum=RetentionAction, required=False, allow_null=True
+    )
 
     class Meta:
         model = Company
@@ -368,6 +483,9 @@ class AdminCompanySerializer(BaseModelSerializer):
             'stripe_api_key',
             'stripe_publishable_api_key',
             'stripe_currencies',
+            'session_retention',
+            'payment_retention',
+            'retention_action',
         )
         read_only_fields = ('id',)
 
@@ -388,7 +506,9 @@ class AdminUpdateCompanySerializer(AdminCompanySerializer):
             'stripe_api_key',
             'stripe_publishable_api_key',
             'stripe_currencies',
-
+            'session_retention',
+            'payment_retention',
+            'retention_action',
         )
         read_only_fields = ('id',)
 
@@ -412,9 +532,10 @@ class AdminUpdateCompanySerializer(AdminCompanySerializer):
             stripe_api_key = validated_data["stripe_api_key"]
 
             try:
-                webhooks = stripe.WebhookEndpoint.list(
-                    limit=100, api_key=stripe_api_key
-                )["data"]
+                with stripe_call(user.company.identifier):
+                    webhooks = stripe.WebhookEndpoint.list(
+                        limit=100, api_key=stripe_api_key
+                    )["data"]
             except stripe.error.StripeError:
                 raise serializers.ValidationError(
                     {'stripe_api_key': ["Invalid API key or permissions."]}
@@ -424,15 +545,16 @@ class AdminUpdateCompanySerializer(AdminCompanySerializer):
             matched_webhooks = [w for w in webhooks if w.url == webhook_url]
 
             if len(matched_webhooks) < 1:
-                webhook = stripe.WebhookEndpoint.create(
-                    url=webhook_url,
-                    enabled_events=[
-                        "checkout.session.completed",
-                        "payment_intent.succeeded",
-                        "payment_intent.payment_failed"
-                    ],
-                    api_key=stripe_api_key
-                )
+                with stripe_call(user.company.identifier):
+                    webhook = stripe.WebhookEndpoint.create(
+                        url=webhook_url,
+                        enabled_events=[
+                            "checkout.session.completed",
+                            "payment_intent.succeeded",
+                            "payment_intent.payment_failed"
+                        ],
+                        api_key=stripe_api_key
+                    )
                 # Add the new stripe secret to the validated_data.
                 validated_data["stripe_secret"] = webhook["secret"]
 
@@ -497,6 +619,312 @@ class AdminPaymentSerializer(BaseModelSerializer):
             'created',
             'updated',
         )
+        # Model fields used by fields that are not model fields.
+        query_fields = {
+            'user': ('user.identifier',),
+            'amount': ('amount', 'currency.divisibility',),
+        }
+
+
+class AdminProfileSerializer(serializers.Serializer):
+    id = serializers.CharField(read_only=True)
+    method = serializers.CharField(read_only=True)
+    path = serializers.CharField(read_only=True)
+    endpoint = serializers.CharField(read_only=True)
+    status = serializers.IntegerField(read_only=True)
+    duration = serializers.FloatField(read_only=True)
+    reason = serializers.CharField(read_only=True)
+    timings = serializers.DictField(read_only=True)
+    created = serializers.SerializerMethodField()
+
+    class Meta:
+        fields = (
+            'id',
+            'method',
+            'path',
+            'endpoint',
+            'status',
+            'duration',
+            'reason',
+            'timings',
+            'created',
+        )
+        read_only_fields = (
+            'id',
+            'method',
+            'path',
+            'endpoint',
+            'status',
+            'duration',
+            'reason',
+            'timings',
+            'created',
+        )
+
+    def get_created(self, obj):
+        # Timestamp in milliseconds, like `TimestampField`.
+        return int(obj['created'] * 1000)
+
+
+class AdminProfileDetailSerializer(AdminProfileSerializer):
+    stats = serializers.CharField(read_only=True)
+
+    class Meta:
+        fields = AdminProfileSerializer.Meta.fields + ('stats',)
+        read_only_fields = AdminProfileSerializer.Meta.read_only_fields + (
+            'stats',
+        )
+
+
+class AdminCreatePaymentBatchItemSerializer(serializers.Serializer):
+    user = serializers.UUIDField()
+    currency = serializers.CharField()
+    amount = serializers.IntegerField()
+    payment_method = serializers.CharField(max_length=64)
+    return_url = serializers.URLField(max_length=250)
+    # Sent to Stripe so that a retried batch does not charge twice.
+    idempotency_key = serializers.CharField(max_length=255)
+
+
+class AdminCreatePaymentBatchSerializer(serializers.Serializer):
+    """
+    Create payments for many users of a company at once.
+
+    Every payment is validated (using a query per lookup for the whole batch)
+    before any is sent to Stripe. The payment intents are then created
+    concurrently and the payments saved together. Payments that Stripe
+    rejects are returned as errors without failing the rest of the batch.
+    """
+
+    payments = AdminCreatePaymentBatchItemSerializer(many=True)
+
+    def validate_payments(self, payments):
+        company = self.context['request'].user.company
+
+        if not payments:
+            raise serializers.ValidationError("No payments.")
+        if len(payments) > settings.PAYMENT_BATCH_MAX_SIZE:
+            raise serializers.ValidationError(
+                "A batch can have at most {} payments.".format(
+                    settings.PAYMENT_BATCH_MAX_SIZE
+                )
+            )
+
+        users = {
+            u.identifier: u for u in User.objects.filter(
+                company=company,
+                identifier__in={p["user"] for p in payments}
+            )
+        }
+        # Currency codes are matched regardless of case, like the single
+        # payment flow and webhooks do.
+        codes = {p["currency"].upper() for p in payments}
+        currencies = {
+            c.code.upper(): c for c in Currency.objects.annotate(
+                upper_code=Upper('code')
+            ).filter(company=company, upper_code__in=codes)
+        }
+        supported = set(company.stripe_currencies.annotate(
+            upper_code=Upper('code')
+        ).filter(upper_code__in=codes).values_list('code', flat=True))
+
+        errors = []
+        keys = set()
+        for payment in payments:
+            error = {}
+
+            user = users.get(payment["user"])
+            if user is None:
+                error["user"] = ["Invalid user."]
+            elif not user.configured:
+                error["user"] = ["The user has no saved payment methods."]
+
+            currency = currencies.get(payment["currency"].upper())
+            if currency is None:
+                error["currency"] = ["Invalid currency."]
+            elif currency.code not in supported:
+                error["currency"] = ["Unsupported currency."]
+            else:
+                # Format the amount correctly (as a decimal value).
+                decimal_amount = from_cents(
+                    amount=payment["amount"],
+                    divisibility=currency.divisibility
+                )
+                details = decimal_amount.as_tuple()
+                if abs(details.exponent) > 18 or len(details.digits) > 30:
+                    error["amount"] = ["Invalid amount."]
+
+            if payment["idempotency_key"] in keys:
+                error["idempotency_key"] = ["Duplicate idempotency key."]
+            keys.add(payment["idempotency_key"])
+
+            errors.append(error)
+            if not error:
+                payment["user"] = user
+                payment["currency"] = currency
+                payment["cent_amount"] = payment["amount"]
+                payment["amount"] = decimal_amount
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        return payments
+
+    def validate(self, validated_data):
+        company = self.context['request'].user.company
+
+        if not company.configured:
+            raise serializers.ValidationError(
+                {'non_field_errors': ["The company is improperly configured."]}
+            )
+
+        return validated_data
+
+    @staticmethod
+    def create_intent(company, payment):
+        # Runs in a pool thread (see `fan_out`).
+        with stripe_call(company.identifier):
+            return stripe.PaymentIntent.create(
+                api_key=company.stripe_api_key,
+                idempotency_key=payment["idempotency_key"],
+                amount=payment["cent_amount"],
+                currency=payment["currency"].code.lower(),
+                confirm=True,
+                customer=payment["user"].stripe_customer_id,
+                payment_method=payment["payment_method"],
+                return_url=payment["return_url"],
+                metadata={
+                    BATCH_METADATA_KEY: '1',
+                    BATCH_RETURN_URL_METADATA_KEY: payment["return_url"],
+                }
+            )
+
+    @staticmethod
+    def get_error(exc):
+        if isinstance(exc, stripe.error.StripeError):
+            return exc.user_message or "Unable to create the payment."
+        if isinstance(exc, (ServiceUnavailable, DeadlineExceeded,)):
+            return str(exc.detail)
+        raise exc
+
+    def save_intents(self, intents):
+        """
+        Save the payments for the created intents. Intents that were already
+        saved (by an earlier attempt with the same idempotency keys, or their
+        webhook) are returned as is.
+        """
+
+        filters = {
+            "identifier__in": [intent["id"] for intent, _ in intents],
+            "user__company": self.context['request'].user.company,
+        }
+        # Only search the partitions from around the time of the intents.
+        created = [i["created"] for i, _ in intents if i.get("created")]
+        if created:
+            filters["created__gte"] = datetime.fromtimestamp(
+                min(created), tz=timezone.utc
+            ) - timedelta(days=1)
+
+        existing = {
+            p.identifier: p for p in Payment.objects.filter(
+                **filters
+            ).select_related('user', 'currency')
+        }
+
+        new = {}
+        for intent, payment in intents:
+            if intent["id"] in existing or intent["id"] in new:
+                continue
+
+            new[intent["id"]] = Payment(
+                identifier=intent["id"],
+                intent_data=intent,
+                next_action=intent.get("next_action"),
+                company_id=payment["user"].company_id,
+                user=payment["user"],
+                currency=payment["currency"],
+                amount=payment["amount"],
+                payment_method=payment["payment_method"],
+                return_url=payment["return_url"]
+            )
+
+        try:
+            with transaction.atomic():
+                Payment.objects.bulk_create(new.values())
+        except IntegrityError:
+            # Some were saved in the meantime, save the rest one by one.
+            new = {i: save_payment(p) for i, p in new.items()}
+        except DatabaseError:
+            # The intents are confirmed, so their payments are saved from
+            # their webhooks instead.
+            logger.error(
+                "Failed to save the payments of batch intents: {}".format(
+                    ", ".join(new)
+                )
+            )
+            raise
+
+        return dict(existing, **new)
+
+    def create(self, validated_data):
+        company = self.context['request'].user.company
+        payments = validated_data["payments"]
+
+        calls = fan_out(
+            *[partial(self.create_intent, company, p) for p in payments],
+            limit=settings.PAYMENT_BATCH_CONCURRENCY
+        )
+
+        results = []
+        intents = []
+        for payment, call in zip(payments, calls):
+            result = {"idempotency_key": payment["idempotency_key"]}
+            try:
+                intent = call.result()
+            except (DeadlineExceeded, stripe.error.APIConnectionError,) as exc:
+                # Stripe may still have created (and confirmed) the intent,
+                # in which case its payment is saved from its webhook, or by
+                # retrying with the same idempotency key.
+                logger.warning(
+                    "Batch payment {} may have been created: {}".format(
+                        payment["idempotency_key"], exc
+                    )
+                )
+                result["error"] = self.get_error(exc)
+            except Exception as exc:
+                result["error"] = self.get_error(exc)
+            else:
+                intents.append((intent, payment))
+                result["intent"] = intent["id"]
+            results.append(result)
+
+        saved = self.save_intents(intents) if intents else {}
+        for result in results:
+            if "intent" in result:
+                result["payment"] = saved[result.pop("intent")]
+
+        return results
+
+
+class AdminPaymentBatchResultSerializer(serializers.Serializer):
+    status = serializers.SerializerMethodField()
+    idempotency_key = serializers.CharField(read_only=True)
+    message = serializers.CharField(source='error', read_only=True)
+    data = AdminPaymentSerializer(source='payment', read_only=True)
+
+    class Meta:
+        fields = ('status', 'idempotency_key', 'message', 'data',)
+        read_only_fields = ('status', 'idempotency_key', 'message', 'data',)
+
+    def get_status(self, obj):
+        return 'error' if obj.get('error') else 'success'
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Only include the payment or the error message.
+        data.pop('message' if instance.get('payment') else 'data', None)
+        return data
+
 
 # User
 
@@ -578,46 +1006,89 @@ class SessionSerializer(BaseModelSerializer):
 
         # Ensure the user has a customer ID configured in Stripe.
         if not user.stripe_customer_id:
-            # Call the Stripe SDK to create a user.
+            self.create_customer(user)
+
+        return validated_data
+
+    def create_customer(self, user):
+        # Call the Stripe SDK to create a user.
+        with stripe_call(user.company.identifier):
             customer = stripe.Customer.create(
                 metadata={"rehive_id": str(user.identifier)},
                 api_key=user.company.stripe_api_key
             )
-            user.stripe_customer_id = customer["id"]
-            user.save()
-
-        return validated_data
+        user.stripe_customer_id = customer["id"]
+        user.save()
 
-    def create(self, validated_data):
+    def get_session_data(self, validated_data):
         user = self.context['request'].user
-        company = user.company
-        mode = validated_data.get("mode")
-        success_url = validated_data.get("success_url")
-        cancel_url = validated_data.get("cancel_url")
 
-        data = {
+        return {
             "payment_method_types": ['card'],
-            "mode": mode.value,
+            "mode": validated_data.get("mode").value,
             "customer": user.stripe_customer_id,
-            "success_url": success_url,
-            "cancel_url": cancel_url
+            "success_url": validated_data.get("success_url"),
+            "cancel_url": validated_data.get("cancel_url")
         }
 
-        # Call the Stripe SDK to create a session.
-        session = stripe.checkout.Session.create(
-            api_key=user.company.stripe_api_key, **data,
-        )
-
-        # Return the session details.
+    def save_session(self, session, validated_data):
         return Session.objects.create(
             identifier=session["id"],
-            user=user,
-            mode=mode,
-            success_url=success_url,
-            cancel_url=cancel_url,
+            user=self.context['request'].user,
+            mode=validated_data.get("mode"),
+            success_url=validated_data.get("success_url"),
+            cancel_url=validated_data.get("cancel_url"),
             session_data=session
         )
 
+    def create(self, validated_data):
+        user = self.context['request'].user
+        company = user.company
+
+        # Call the Stripe SDK to create a session.
+        with stripe_call(company.identifier):
+            session = stripe.checkout.Session.create(
+                api_key=user.company.stripe_api_key,
+                **self.get_session_data(validated_data),
+            )
+
+        # Return the session details.
+        return self.save_session(session, validated_data)
+
+
+class AsyncSessionSerializer(SessionSerializer):
+    """
+    Session serializer used by the async views. Stripe is called without
+    blocking from `acreate` instead of during validation and `save()`.
+    """
+
+    def create_customer(self, user):
+        pass
+
+    async def acreate(self):
+        user = self.context['request'].user
+        company = user.company
+
+        if not user.stripe_customer_id:
+            customer = await aclients.stripe_call(
+                company.identifier, 'post', '/v1/customers',
+                company.stripe_api_key,
+                metadata={"rehive_id": str(user.identifier)}
+            )
+            user.stripe_customer_id = customer["id"]
+            await sync_to_async(user.save)()
+
+        session = await aclients.stripe_call(
+            company.identifier, 'post', '/v1/checkout/sessions',
+            company.stripe_api_key,
+            **self.get_session_data(self.validated_data)
+        )
+
+        self.instance = await sync_to_async(self.save_session)(
+            session, self.validated_data
+        )
+        return self.instance
+
 
 class PaymentSerializer(BaseModelSerializer):
     id = serializers.CharField(source='identifier', read_only=True)
@@ -655,6 +1126,10 @@ class PaymentSerializer(BaseModelSerializer):
             'created',
             'updated',
         )
+        # Model fields used by fields that are not model fields.
+        query_fields = {
+            'amount': ('amount', 'currency.divisibility',),
+        }
 
 
 class CreatePaymentSerializer(PaymentSerializer):
@@ -690,7 +1165,9 @@ class CreatePaymentSerializer(PaymentSerializer):
         user = self.context['request'].user
 
         try:
-            currency = Currency.objects.get(code=currency, company=user.company)
+            currency = Currency.objects.get(
+                code__iexact=currency, company=user.company
+            )
         except Currency.DoesNotExist:
             raise serializers.ValidationError("Invalid currency.")
 
@@ -740,29 +1217,82 @@ class CreatePaymentSerializer(PaymentSerializer):
         validated_data["amount"] = decimal_amount
         return validated_data
 
-    def create(self, validated_data):
+    def get_intent_data(self, validated_data):
         user = self.context['request'].user
+
+        return {
+            "amount": validated_data["cent_amount"],
+            "currency": validated_data["currency"].code.lower(),
+            "confirm": True,
+            "customer": user.stripe_customer_id,
+            "payment_method": validated_data["payment_method"],
+            "return_url": validated_data["return_url"]
+        }
+
+    def save_intent(self, intent, validated_data):
+        validated_data = dict(validated_data)
         # Remove this from validated_data as we don't need it on the model.
-        cent_amount = validated_data.pop("cent_amount")
+        validated_data.pop("cent_amount")
+
+        return Payment.objects.create(
+            identifier=intent["id"],
+            intent_data=intent,
+            next_action=intent.get("next_action"),
+            **validated_data
+        )
+
+    def create(self, validated_data):
+        user = self.context['request'].user
 
         try:
-            intent = stripe.PaymentIntent.create(
-                amount=cent_amount,
-                currency=validated_data["currency"].code.lower(),
-                confirm=True,
-                customer=user.stripe_customer_id,
-                payment_method=validated_data["payment_method"],
-                api_key=user.company.stripe_api_key,
-                return_url=validated_data["return_url"]
+            with stripe_call(user.company.identifier):
+                intent = stripe.PaymentIntent.create(
+                    api_key=user.company.stripe_api_key,
+                    **self.get_intent_data(validated_data)
+                )
+        except stripe.error.CardError as exc:
+            raise serializers.ValidationError(
+                {'non_field_errors': [exc.error.message]}
+            )
+
+        return self.save_intent(intent, validated_data)
+
+
+class AsyncCreatePaymentSerializer(CreatePaymentSerializer):
+    """
+    Create payment serializer used by the async views. Stripe is called
+    without blocking from `avalidate` and `acreate` instead of during
+    validation and `save()`.
+    """
+
+    def validate_payment_method(self, payment_method):
+        return payment_method
+
+    async def avalidate(self):
+        user = self.context['request'].user
+
+        try:
+            await user.apayment_method(self.validated_data["payment_method"])
+        except ObjectDoesNotExist:
+            raise serializers.ValidationError(
+                {"payment_method": ["Invalid payment method."]}
+            )
+
+    async def acreate(self):
+        company = self.context['request'].user.company
+
+        try:
+            intent = await aclients.stripe_call(
+                company.identifier, 'post', '/v1/payment_intents',
+                company.stripe_api_key,
+                **self.get_intent_data(self.validated_data)
             )
         except stripe.error.CardError as exc:
             raise serializers.ValidationError(
                 {'non_field_errors': [exc.error.message]}
             )
 
-        return Payment.objects.create(
-            identifier=intent["id"],
-            intent_data=intent,
-            next_action=intent.get("next_action"),
-            **validated_data
+        self.instance = await sync_to_async(self.save_intent)(
+            intent, self.validated_data
         )
+        return self.instance
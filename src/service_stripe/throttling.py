@@ -0,0 +1,123 @@
+import hashlib
+
+from rest_framework.throttling import SimpleRateThrottle
+
+from service_stripe import metrics
+
+
+class WindowRateThrottle(SimpleRateThrottle):
+    """
+    Sliding window throttle with counts stored in the shared cache.
+
+    Requests are counted per fixed window of `duration` seconds using the
+    cache's atomic `incr`, so concurrent workers cannot both take the last
+    request of a window. The count of the previous window is weighted by how
+    much of it still overlaps the sliding window, so bursts at the edge of
+    two windows cannot double the rate. Rejected requests are counted too.
+    Requests are let through while the cache is unavailable.
+
+    The rate is looked up using the view's `throttle_scope` and the
+    throttle's `ident_scope`, eg. `payments_user`, falling back to
+    `default_user`.
+    """
+
+    ident_scope = None
+
+    def __init__(self):
+        # The rate can only be determined once the view is known.
+        self._wait = None
+
+    def get_scope_ident(self, request):
+        """
+        Identify who the request is throttled for, `None` to not throttle.
+        """
+
+        raise NotImplementedError('.get_scope_ident() must be overridden')
+
+    def increment(self, key):
+        # Counts are kept long enough to be the previous window's.
+        self.cache.add(key, 0, self.duration * 2)
+        try:
+            count = self.cache.incr(key)
+        except ValueError:
+            # The count expired between adding and incrementing it.
+            self.cache.set(key, 1, self.duration * 2)
+            return 1
+
+        # Nothing is counted (eg. `False`) if the cache is unavailable.
+        return count or 0
+
+    def allow_request(self, request, view):
+        ident = self.get_scope_ident(request)
+        if ident is None:
+            return True
+
+        self.scope = '{}_{}'.format(
+            getattr(view, 'throttle_scope', 'default'), self.ident_scope
+        )
+        self.rate = self.THROTTLE_RATES.get(
+            self.scope,
+            self.THROTTLE_RATES.get('default_{}'.format(self.ident_scope))
+        )
+        if self.rate is None:
+            return True
+
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+
+        key = self.cache_format % {'scope': self.scope, 'ident': ident}
+        now = self.timer()
+        window, elapsed = divmod(now, self.duration)
+
+        count = self.increment('{}:{}'.format(key, int(window)))
+        previous = self.cache.get('{}:{}'.format(key, int(window) - 1)) or 0
+        overlap = 1 - elapsed / self.duration
+
+        if previous * overlap + count > self.num_requests:
+            self._wait = self.duration - elapsed
+            metrics.THROTTLED_REQUESTS.labels(self.scope).inc()
+            return False
+
+        return True
+
+    def wait(self):
+        return self._wait
+
+
+class TokenRateThrottle(WindowRateThrottle):
+    """
+    Throttle requests per authorization token. Used by the authentication
+    classes before the token is checked with Rehive, so that requests over
+    the limit are not passed on to Rehive.
+    """
+
+    ident_scope = 'token'
+
+    def get_scope_ident(self, request):
+        token = request.META.get('HTTP_AUTHORIZATION')
+        if not token:
+            return None
+
+        return hashlib.sha256(token.encode()).hexdigest()
+
+
+class UserRateThrottle(WindowRateThrottle):
+    """
+    Throttle requests per authenticated user.
+    """
+
+    ident_scope = 'user'
+
+    def get_scope_ident(self, request):
+        return getattr(request.user, 'identifier', None)
+
+
+class CompanyRateThrottle(WindowRateThrottle):
+    """
+    Throttle requests per company of the authenticated user.
+    """
+
+    ident_scope = 'company'
+
+    def get_scope_ident(self, request):
+        company = getattr(request.user, 'company', None)
+        return company.identifier if company else None
@@ -0,0 +1,136 @@
+from contextlib import contextmanager
+from functools import wraps
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from opentelemetry import context, trace
+from opentelemetry.propagate import extract
+
+
+tracer = trace.get_tracer('service_stripe')
+
+
+def configure_tracing():
+    """
+    Export sampled spans to the collector at TRACING_EXPORT_ENDPOINT. Spans
+    are not recorded if TRACING_SAMPLE_RATE is 0.
+    """
+
+    if not settings.TRACING_SAMPLE_RATE:
+        return
+
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+        OTLPSpanExporter
+    )
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.sdk.trace.sampling import (
+        ParentBased, TraceIdRatioBased
+    )
+
+    provider = TracerProvider(
+        resource=Resource.create(
+            {'service.name': settings.TRACING_SERVICE_NAME}
+        ),
+        sampler=ParentBased(TraceIdRatioBased(settings.TRACING_SAMPLE_RATE))
+    )
+    provider.add_span_processor(BatchSpanProcessor(
+        OTLPSpanExporter(endpoint=settings.TRACING_EXPORT_ENDPOINT)
+    ))
+    trace.set_tracer_provider(provider)
+
+
+def _attributes(attributes):
+    # Span attributes cannot be `None` and must be primitive types.
+    return {
+        key: value if isinstance(value, (bool, int, float, str)) else str(value)
+        for key, value in attributes.items() if value is not None
+    }
+
+
+@contextmanager
+def span(name, attributes=None):
+    """
+    Record a block of code as a span of the current trace. Exceptions raised
+    in the block are recorded on the span.
+    """
+
+    with tracer.start_as_current_span(name) as current:
+        if attributes and current.is_recording():
+            current.set_attributes(_attributes(attributes))
+        yield current
+
+
+def set_attributes(attributes):
+    """
+    Set attributes on the current span.
+    """
+
+    current = trace.get_current_span()
+    if current.is_recording():
+        current.set_attributes(_attributes(attributes))
+
+
+@contextmanager
+def request_span(request):
+    """
+    Record a request as the root span of a trace (or a child of the caller's
+    trace if a `traceparent` header was sent).
+    """
+
+    parent = extract({
+        'traceparent': request.META.get('HTTP_TRACEPARENT', ''),
+        'tracestate': request.META.get('HTTP_TRACESTATE', ''),
+    })
+    with tracer.start_as_current_span(
+            '{} {}'.format(request.method, request.path),
+            context=parent,
+            kind=trace.SpanKind.SERVER) as current:
+        if current.is_recording():
+            current.set_attributes({
+                'http.method': request.method,
+                'http.target': request.path,
+            })
+        yield current
+
+
+@contextmanager
+def upstream_span(dependency, method, url, operation):
+    """
+    Record an HTTP request to an upstream (Rehive or Stripe).
+    """
+
+    with tracer.start_as_current_span(
+            '{} {}'.format(dependency, operation),
+            kind=trace.SpanKind.CLIENT) as current:
+        if current.is_recording():
+            parts = urlsplit(url)
+            current.set_attributes({
+                'peer.service': dependency,
+                'http.method': method.upper(),
+                # Leave out the query, it may contain customer data.
+                'http.url': '{}://{}{}'.format(
+                    parts.scheme, parts.netloc, parts.path
+                ),
+            })
+        yield current
+
+
+def bind(func):
+    """
+    Wrap `func` so that its spans belong to the current trace when it is
+    called from another thread (eg. a thread pool).
+    """
+
+    ctx = context.get_current()
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        token = context.attach(ctx)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            context.detach(token)
+
+    return wrapper
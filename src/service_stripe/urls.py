@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import include, path, re_path
 from rest_framework.urlpatterns import format_suffix_patterns
 
@@ -14,10 +15,13 @@ urlpatterns = (
     re_path(r'^user/$', views.UserView.as_view(), name='user-view'),
     re_path(r'^user/company/$', views.UserCompanyView.as_view(), name='user-company-view'),
     re_path(r'^user/sessions/$', views.UserListCreateSessionView.as_view(), name='user-sessions-list'),
+    re_path(r'^user/sessions/batch/$', views.UserBatchSessionView.as_view(), name='user-sessions-batch'),
     re_path(r'^user/sessions/(?P<identifier>\w+)/?$', views.UserSessionView.as_view(), name='user-sessions-view'),
     re_path(r'^user/payments/$', views.UserListCreatePaymentView.as_view(), name='user-payments-list'),
+    re_path(r'^user/payments/batch/$', views.UserBatchPaymentView.as_view(), name='user-payments-batch'),
     re_path(r'^user/payments/(?P<identifier>\w+)/?$', views.UserPaymentView.as_view(), name='user-payments-view'),
-    re_path(r'^user/payment-methods/$', views.UserListPaymentMethodView.as_view(), name='user-payments-list'),
+    re_path(r'^user/payments/(?P<identifier>\w+)/wait/$', views.UserPaymentWaitView.as_view(), name='user-payments-wait'),
+    re_path(r'^user/payment-methods/$', views.UserListPaymentMethodView.as_view(), name='user-payment-methods-list'),
     re_path(r'^user/payment-methods/(?P<id>\w+)/?$', views.UserPaymentMethodView.as_view(), name='user-payment-methods-view'),
 
     # Admin
@@ -29,7 +33,16 @@ urlpatterns = (
     re_path(r'^admin/currencies/$', views.AdminListCurrencyView.as_view(), name='admin-currencies-list'),
     re_path(r'^admin/currencies/(?P<code>(\w+))/$', views.AdminCurrencyView.as_view(), name='admin-currencies-view'),
     re_path(r'^admin/payments/$', views.AdminListPaymentView.as_view(), name='admin-payments-list'),
+    re_path(r'^admin/payments/changes/$', views.AdminPaymentChangesView.as_view(), name='admin-payments-changes'),
+    re_path(r'^admin/payments/batch/$', views.AdminPaymentBatchView.as_view(), name='admin-payments-batch'),
     re_path(r'^admin/payments/(?P<id>\w+)/?$', views.AdminPaymentView.as_view(), name='admin-payments-view'),
+    re_path(r'^admin/profiles/$', views.AdminListProfileView.as_view(), name='admin-profiles-list'),
+    re_path(r'^admin/profiles/(?P<id>[0-9a-f]{32})/$', views.AdminProfileView.as_view(), name='admin-profiles-view'),
 )
 
+# Under ASGI serve the async versions of views that wait on upstreams.
+if settings.ASYNC_VIEWS:
+    from .async_views import async_patterns
+    urlpatterns = async_patterns(urlpatterns)
+
 urlpatterns = format_suffix_patterns(urlpatterns)
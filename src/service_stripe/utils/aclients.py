@@ -0,0 +1,187 @@
+"""
+Non-blocking versions of the upstream (Rehive and Stripe) clients used by the
+async views. They raise the same exceptions as the Rehive and Stripe SDKs so
+that breakers, bulkheads and error handling work the same in both modes.
+"""
+
+import asyncio
+from urllib.parse import urlencode
+
+import httpx
+import stripe
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rehive.api.client import API_ENDPOINT
+from rehive.api.exception import APIException, Timeout
+from stripe.api_requestor import APIRequestor, _api_encode, _build_api_url
+
+from service_stripe.exceptions import DeadlineExceeded
+from service_stripe.utils import deadline, timing
+from service_stripe.utils.breakers import rehive_breaker, stripe_breaker
+from service_stripe.utils.bulkheads import stripe_bulkhead
+
+
+_clients = {}
+
+
+def get_client():
+    """
+    Get the HTTP client shared by all requests on the running event loop, so
+    that connections to upstreams are kept alive between requests.
+    """
+
+    loop = asyncio.get_event_loop()
+    try:
+        return _clients[loop]
+    except KeyError:
+        client = _clients[loop] = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.ASYNC_MAX_CONNECTIONS
+            )
+        )
+        return client
+
+
+async def _send(dependency, method, url, timeout, **kwargs):
+    """
+    Send a request to an upstream, capping the timeout at the time left
+    before the current deadline.
+    """
+
+    timeout = deadline.get_timeout(timeout)
+
+    with timing.upstream(dependency, method, url) as call:
+        try:
+            response = await get_client().request(
+                method, url, timeout=timeout, **kwargs
+            )
+        except httpx.TimeoutException:
+            if deadline.expired():
+                raise DeadlineExceeded()
+            raise
+        call.status = response.status_code
+        return response
+
+
+class AsyncRehive:
+    """
+    Minimal async Rehive client. Only covers the endpoints that the async
+    views need.
+    """
+
+    def __init__(self, token):
+        self.token = token
+
+    async def request(self, method, path, data=None):
+        url = API_ENDPOINT + path
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': 'Token {}'.format(self.token)
+        }
+
+        try:
+            result = await _send(
+                'rehive', method, url, settings.REHIVE_TIMEOUT,
+                headers=headers, json=data
+            )
+        except httpx.TimeoutException as exc:
+            raise Timeout(str(exc))
+        except httpx.HTTPError as exc:
+            raise APIException(str(exc))
+
+        if result.is_error:
+            if result.status_code == 404:
+                raise APIException('Not found: ' + url, result.status_code)
+            if result.status_code == 500:
+                raise APIException(
+                    'Internal server error: ' + url, result.status_code
+                )
+            try:
+                error_data = result.json()
+            except ValueError:
+                raise APIException('General error', result.status_code)
+            raise APIException(
+                error_data.get('message', 'General error'),
+                result.status_code,
+                error_data
+            )
+
+        return result.json()['data']
+
+    async def get_auth(self):
+        return await self.request('get', 'auth/')
+
+
+async def stripe_request(method, path, api_key, **params):
+    """
+    Make a request to the Stripe API. Returns a Stripe object or raises the
+    same errors as the Stripe SDK.
+    """
+
+    requestor = APIRequestor(key=api_key)
+    url = stripe.api_base + path
+
+    encoded = urlencode(list(_api_encode(params)))
+    encoded = encoded.replace('%5B', '[').replace('%5D', ']')
+    if method == 'get':
+        url = _build_api_url(url, encoded) if params else url
+        data = None
+    else:
+        data = encoded
+
+    try:
+        result = await _send(
+            'stripe', method, url, settings.STRIPE_TIMEOUT,
+            headers=requestor.request_headers(api_key, method),
+            content=data
+        )
+    except httpx.HTTPError as exc:
+        raise stripe.error.APIConnectionError(
+            'Unexpected error communicating with Stripe. ({})'.format(exc),
+            should_retry=False
+        )
+
+    response = requestor.interpret_response(
+        result.text, result.status_code, result.headers
+    )
+    return stripe.util.convert_to_stripe_object(
+        response, api_key, stripe.api_version, None
+    )
+
+
+async def rehive_call(func, *args, scope=None):
+    """
+    Await a Rehive call guarded by its circuit breaker.
+    """
+
+    states = await sync_to_async(rehive_breaker.check)(scope)
+    try:
+        result = await func(*args)
+    except Exception as exc:
+        await sync_to_async(rehive_breaker.record)(states, exc)
+        raise
+    await sync_to_async(rehive_breaker.record)(states)
+    return result
+
+
+async def stripe_call(company_id, method, path, api_key, **params):
+    """
+    Make a Stripe request on behalf of a company, guarded by its circuit
+    breaker and concurrency bulkhead.
+    """
+
+    states = await sync_to_async(stripe_breaker.check)(company_id)
+    try:
+        lease = await stripe_bulkhead.aenter(company_id)
+        try:
+            result = await stripe_request(method, path, api_key, **params)
+        except Exception as exc:
+            await sync_to_async(stripe_bulkhead.exit)(company_id, lease, exc)
+            raise
+        await sync_to_async(stripe_bulkhead.exit)(company_id, lease)
+    except Exception as exc:
+        await sync_to_async(stripe_breaker.record)(states, exc)
+        raise
+    await sync_to_async(stripe_breaker.record)(states)
+    return result
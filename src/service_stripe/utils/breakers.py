@@ -0,0 +1,173 @@
+import time
+from contextlib import contextmanager
+from logging import getLogger
+
+import stripe
+from django.conf import settings
+from django.core.cache import cache
+from rehive.api.exception import (
+    APIException as RehiveAPIException, Timeout as RehiveTimeout
+)
+
+from service_stripe import metrics
+from service_stripe.exceptions import DeadlineExceeded, ServiceUnavailable
+
+
+logger = getLogger('django')
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker around calls to an upstream dependency.
+
+    Failures are tracked per dependency and per company (scope) in the shared
+    cache so that all workers see the same state. Once a scope has too many
+    failures within the failure window the breaker opens and calls are
+    rejected immediately. After the recovery timeout a single trial call is
+    let through (half-open): success closes the breaker, failure re-opens it.
+    The breaker stays closed while the cache is unavailable.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, is_failure):
+        self.name = name
+        # Callable that decides whether an exception counts as a failure.
+        self.is_failure = is_failure
+
+    def _key(self, scope, suffix):
+        return 'breaker:{}:{}:{}'.format(self.name, scope or '', suffix)
+
+    def _threshold(self, scope):
+        if scope:
+            return settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD
+        return settings.CIRCUIT_BREAKER_DEPENDENCY_FAILURE_THRESHOLD
+
+    def _state(self, opened):
+        if opened is None:
+            return self.CLOSED
+        if time.time() - opened < settings.CIRCUIT_BREAKER_RECOVERY_TIMEOUT:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def _transition(self, scope, state):
+        logger.warning(
+            'Circuit breaker %s (%s) is %s.', self.name, scope or '*', state
+        )
+        metrics.CIRCUIT_BREAKER_TRANSITIONS.labels(
+            self.name, scope or '', state
+        ).inc()
+
+    def state(self, scope=None):
+        return self._state(cache.get(self._key(scope, 'opened')))
+
+    def _record_success(self, scope, state):
+        if state == self.CLOSED:
+            return
+
+        cache.delete_many([
+            self._key(scope, 'opened'),
+            self._key(scope, 'trial'),
+            self._key(scope, 'failures'),
+        ])
+        self._transition(scope, self.CLOSED)
+
+    def _record_failure(self, scope, state):
+        key = self._key(scope, 'failures')
+        cache.add(key, 0, settings.CIRCUIT_BREAKER_FAILURE_WINDOW)
+        try:
+            # Nothing is counted (eg. `False`) if the cache is unavailable,
+            # so that the breaker stays closed.
+            failures = cache.incr(key) or 0
+        except ValueError:
+            # The failure window expired in between.
+            failures = 1
+            cache.set(key, failures, settings.CIRCUIT_BREAKER_FAILURE_WINDOW)
+
+        if state == self.HALF_OPEN or (
+                state == self.CLOSED and failures >= self._threshold(scope)):
+            cache.set(self._key(scope, 'opened'), time.time(), None)
+            cache.delete(self._key(scope, 'trial'))
+            self._transition(scope, self.OPEN)
+
+    def check(self, scope=None):
+        """
+        Check that a call to the dependency is allowed. Raises
+        `ServiceUnavailable` if the breaker for the dependency or the scope
+        (company) is open. Returns the states to pass to `record`.
+        """
+
+        scopes = [None, scope] if scope else [None]
+        opened = cache.get_many([self._key(s, 'opened') for s in scopes])
+        states = {
+            s: self._state(opened.get(self._key(s, 'opened'))) for s in scopes
+        }
+
+        for s, state in states.items():
+            # Only a single trial call is let through a half-open breaker.
+            if state == self.OPEN or (state == self.HALF_OPEN and not cache.add(
+                    self._key(s, 'trial'), True,
+                    settings.CIRCUIT_BREAKER_RECOVERY_TIMEOUT)):
+                metrics.CIRCUIT_BREAKER_REJECTIONS.labels(
+                    self.name, s or ''
+                ).inc()
+                raise ServiceUnavailable(
+                    wait=settings.CIRCUIT_BREAKER_RECOVERY_TIMEOUT
+                )
+
+        return states
+
+    def record(self, states, exc=None):
+        """
+        Record the outcome of a call allowed by `check`.
+        """
+
+        # Rejected before reaching the dependency (eg. by a bulkhead).
+        if isinstance(exc, ServiceUnavailable):
+            return
+
+        # Any error that is not a failure still means the dependency responded.
+        if exc is not None and self.is_failure(exc):
+            for s, state in states.items():
+                self._record_failure(s, state)
+        else:
+            for s, state in states.items():
+                self._record_success(s, state)
+
+    @contextmanager
+    def guard(self, scope=None):
+        """
+        Guard a call to the dependency.
+        """
+
+        states = self.check(scope)
+        try:
+            yield
+        except Exception as exc:
+            self.record(states, exc)
+            raise
+        else:
+            self.record(states)
+
+
+def is_rehive_failure(exc):
+    # Rehive connection errors have no status code.
+    if isinstance(exc, RehiveAPIException):
+        return exc.status_code is None or exc.status_code >= 500
+    return isinstance(exc, (RehiveTimeout, DeadlineExceeded))
+
+
+def is_stripe_failure(exc):
+    return isinstance(exc, (
+        stripe.error.APIConnectionError,
+        stripe.error.APIError,
+        DeadlineExceeded,
+    ))
+
+
+rehive_breaker = CircuitBreaker('rehive', is_rehive_failure)
+stripe_breaker = CircuitBreaker('stripe', is_stripe_failure)
+
+breakers = (rehive_breaker, stripe_breaker,)
@@ -0,0 +1,217 @@
+import asyncio
+import math
+import random
+import time
+from contextlib import contextmanager
+from logging import getLogger
+
+import stripe
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from service_stripe import metrics
+from service_stripe.exceptions import ServiceUnavailable
+from service_stripe.utils import deadline
+
+
+logger = getLogger('django')
+
+
+class Bulkhead:
+    """
+    Limit the number of concurrent calls to a dependency per company (scope).
+
+    Slots are leased in the shared cache so that the limit applies across all
+    workers, and a crashed worker cannot hold on to a slot for longer than
+    the lease. Callers queue for a free slot until the queue timeout (or the
+    request deadline) passes.
+
+    When the dependency rate limits a company, further calls for that company
+    are held back for the time it asked for, or an exponentially growing
+    delay if it did not say.
+    """
+
+    def __init__(self, name, get_retry_after):
+        self.name = name
+        # Callable that returns the seconds to back off for (0 if unknown) when
+        # an exception is a rate limit error, otherwise `None`.
+        self.get_retry_after = get_retry_after
+
+    def _key(self, scope, suffix):
+        return 'bulkhead:{}:{}:{}'.format(self.name, scope, suffix)
+
+    def _reject(self, scope, reason, wait):
+        metrics.BULKHEAD_REJECTIONS.labels(self.name, scope, reason).inc()
+        raise ServiceUnavailable(wait=math.ceil(wait))
+
+    def _wait_until(self):
+        timeout = settings.BULKHEAD_QUEUE_TIMEOUT
+        left = deadline.remaining()
+        if left is not None:
+            timeout = min(timeout, max(left, 0))
+        return time.monotonic() + timeout
+
+    def _try_acquire(self, scope, wait_until):
+        """
+        Try to lease a free slot. Returns the leased slot key and the current
+        backoff state, or the seconds to wait before trying again.
+        """
+
+        slots = [
+            self._key(scope, 'slot:{}'.format(i))
+            for i in range(settings.BULKHEAD_SLOTS)
+        ]
+        backoff_key = self._key(scope, 'backoff')
+
+        values = cache.get_many(slots + [backoff_key])
+        backoff = values.get(backoff_key)
+
+        # Hold back calls while the company is being rate limited.
+        if backoff and backoff[0] > time.time():
+            wait = backoff[0] - time.time()
+            if time.monotonic() + wait > wait_until:
+                self._reject(scope, 'rate_limited', wait)
+            return None, wait
+
+        for slot in slots:
+            if slot not in values and cache.add(
+                    slot, True, settings.BULKHEAD_SLOT_LEASE):
+                return (slot, backoff), None
+
+        # Every slot was free but none could be leased, the cache is
+        # unavailable (or every slot was just taken). Let the call through
+        # rather than reject every call until the cache is back.
+        if not any(slot in values for slot in slots):
+            logger.warning(
+                'Bulkhead %s (%s) could not lease a slot, letting the call '
+                'through.', self.name, scope
+            )
+            return (None, backoff), None
+
+        if time.monotonic() >= wait_until:
+            self._reject(scope, 'queue_timeout', 1)
+
+        return None, random.uniform(0.5, 1) * settings.BULKHEAD_POLL_INTERVAL
+
+    def _acquire(self, scope):
+        """
+        Wait for a free slot. Returns the leased slot key and the current
+        backoff state.
+        """
+
+        wait_until = self._wait_until()
+        while True:
+            lease, wait = self._try_acquire(scope, wait_until)
+            if lease:
+                return lease
+            time.sleep(wait)
+
+    def _backoff(self, scope, backoff, retry_after):
+        level = backoff[1] + 1 if backoff else 1
+
+        if not retry_after:
+            retry_after = min(
+                settings.BULKHEAD_BACKOFF_BASE * 2 ** (level - 1),
+                settings.BULKHEAD_BACKOFF_MAX
+            ) * random.uniform(0.5, 1)
+
+        logger.warning(
+            'Rate limited by %s (%s), backing off for %.2f seconds.',
+            self.name, scope, retry_after
+        )
+        # Keep the backoff level around for a while so that repeated rate
+        # limiting backs off further each time.
+        cache.set(
+            self._key(scope, 'backoff'),
+            (time.time() + retry_after, level),
+            settings.BULKHEAD_BACKOFF_MAX * 4
+        )
+        return retry_after
+
+    def enter(self, scope):
+        """
+        Wait for a free slot. Raises `ServiceUnavailable` if no slot becomes
+        free in time or the scope is being rate limited. Returns the lease to
+        pass to `exit`.
+        """
+
+        queue_depth = metrics.BULKHEAD_QUEUE_DEPTH.labels(self.name, scope)
+        queue_depth.inc()
+        try:
+            lease = self._acquire(scope)
+        finally:
+            queue_depth.dec()
+
+        metrics.BULKHEAD_IN_FLIGHT.labels(self.name, scope).inc()
+        return lease
+
+    async def aenter(self, scope):
+        """
+        Async version of `enter`, waits without blocking the event loop.
+        """
+
+        queue_depth = metrics.BULKHEAD_QUEUE_DEPTH.labels(self.name, scope)
+        queue_depth.inc()
+        try:
+            wait_until = self._wait_until()
+            while True:
+                lease, wait = await sync_to_async(self._try_acquire)(
+                    scope, wait_until
+                )
+                if lease:
+                    break
+                await asyncio.sleep(wait)
+        finally:
+            queue_depth.dec()
+
+        metrics.BULKHEAD_IN_FLIGHT.labels(self.name, scope).inc()
+        return lease
+
+    def exit(self, scope, lease, exc=None):
+        """
+        Release the slot held by a call. Raises `ServiceUnavailable` if the
+        call was rate limited.
+        """
+
+        slot, backoff = lease
+        if slot:
+            cache.delete(slot)
+        metrics.BULKHEAD_IN_FLIGHT.labels(self.name, scope).dec()
+
+        retry_after = self.get_retry_after(exc) if exc is not None else None
+        if retry_after is not None:
+            wait = self._backoff(scope, backoff, retry_after)
+            self._reject(scope, 'rate_limited', wait)
+
+        # Reset the backoff level once calls succeed again.
+        if exc is None and backoff:
+            cache.delete(self._key(scope, 'backoff'))
+
+    @contextmanager
+    def acquire(self, scope):
+        """
+        Hold a slot for the duration of a call.
+        """
+
+        lease = self.enter(scope)
+        try:
+            yield
+        except Exception as exc:
+            self.exit(scope, lease, exc)
+            raise
+        else:
+            self.exit(scope, lease)
+
+
+def get_stripe_retry_after(exc):
+    if not isinstance(exc, stripe.error.RateLimitError):
+        return None
+
+    try:
+        return int((exc.headers or {}).get('retry-after'))
+    except (TypeError, ValueError):
+        return 0
+
+
+stripe_bulkhead = Bulkhead('stripe', get_stripe_retry_after)
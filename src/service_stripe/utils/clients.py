@@ -0,0 +1,149 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from functools import wraps
+
+import requests
+import stripe
+from django.conf import settings
+from django.db import connections
+from rehive import Rehive
+
+from service_stripe import tracing
+from service_stripe.exceptions import DeadlineExceeded
+from service_stripe.utils import deadline, timing
+from service_stripe.utils.breakers import stripe_breaker
+from service_stripe.utils.bulkheads import stripe_bulkhead
+
+
+class DeadlineSession(requests.Session):
+    """
+    Requests session that caps the timeout of each request at the time left
+    before the current deadline, and times and traces each request.
+    """
+
+    def request(self, method, url, **kwargs):
+        kwargs['timeout'] = deadline.get_timeout(kwargs.get('timeout'))
+
+        with timing.upstream('rehive', method, url) as call:
+            try:
+                response = super().request(method, url, **kwargs)
+            except requests.exceptions.Timeout:
+                if deadline.expired():
+                    raise DeadlineExceeded()
+                raise
+            call.status = response.status_code
+            return response
+
+
+class DeadlineStripeClient(stripe.http_client.RequestsClient):
+    """
+    Stripe HTTP client that caps the timeout of each request at the time left
+    before the current deadline, and times and traces each request.
+    """
+
+    def request(self, method, url, headers, post_data=None):
+        with timing.upstream('stripe', method, url) as call:
+            content, call.status, headers = super().request(
+                method, url, headers, post_data
+            )
+            return content, call.status, headers
+
+    @property
+    def _timeout(self):
+        return deadline.get_timeout(self._default_timeout)
+
+    @_timeout.setter
+    def _timeout(self, value):
+        self._default_timeout = value
+
+    def _handle_request_error(self, e):
+        # The deadline may expire before the request is sent.
+        if isinstance(e, DeadlineExceeded):
+            raise e
+
+        if (isinstance(e, requests.exceptions.Timeout)
+                and deadline.expired()):
+            raise DeadlineExceeded()
+
+        super()._handle_request_error(e)
+
+
+# Process wide pool used to make independent upstream calls concurrently.
+_executor = ThreadPoolExecutor(
+    max_workers=settings.UPSTREAM_FAN_OUT_WORKERS,
+    thread_name_prefix='upstream'
+)
+
+
+def closing(call):
+    """
+    Wrap `call` so that the database connections it opens in a pool thread
+    are closed once it returns, rather than kept open by every pool thread
+    (see CONN_MAX_AGE).
+    """
+
+    @wraps(call)
+    def wrapper():
+        try:
+            return call()
+        finally:
+            connections.close_all()
+
+    return wrapper
+
+
+def fan_out(*calls, limit=None):
+    """
+    Make independent upstream calls concurrently, each call is a callable
+    without arguments. Waits for all calls to finish and returns their
+    futures in the same order, so that errors can be handled per call.
+
+    At most `limit` of the calls run at once, so that a large number of calls
+    does not take up the whole pool.
+    """
+
+    futures = []
+    running = set()
+    for call in calls:
+        if limit and len(running) >= limit:
+            _, running = wait(running, return_when=FIRST_COMPLETED)
+
+        future = _executor.submit(
+            tracing.bind(timing.bind(deadline.bind(closing(call))))
+        )
+        futures.append(future)
+        running.add(future)
+
+    wait(futures)
+    return futures
+
+
+def get_rehive(token):
+    """
+    Get a Rehive SDK instance whose requests respect the current deadline.
+    """
+
+    rehive = Rehive(token, timeout=settings.REHIVE_TIMEOUT)
+    rehive.client._session = DeadlineSession()
+    return rehive
+
+
+def configure_stripe():
+    """
+    Route all Stripe SDK requests through the deadline aware client.
+    """
+
+    stripe.default_http_client = DeadlineStripeClient(
+        timeout=settings.STRIPE_TIMEOUT
+    )
+
+
+@contextmanager
+def stripe_call(company_id):
+    """
+    Guard a Stripe call made on behalf of a company with its circuit breaker
+    and concurrency bulkhead.
+    """
+
+    with stripe_breaker.guard(company_id), stripe_bulkhead.acquire(company_id):
+        yield
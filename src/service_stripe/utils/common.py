@@ -11,3 +11,23 @@ def to_cents(amount: Decimal, divisibility: int) -> int:
 
 def from_cents(amount: int, divisibility: int) -> Decimal:
     return Decimal(amount) / Decimal('10')**divisibility
+
+
+def pk_batches(queryset, batch_size):
+    """
+    Iterate over the primary keys of a queryset in batches of consecutive
+    keys, without using offsets.
+    """
+
+    last = 0
+    while True:
+        ids = list(
+            queryset.filter(pk__gt=last).order_by('pk').values_list(
+                'pk', flat=True
+            )[:batch_size]
+        )
+        if not ids:
+            return
+
+        last = ids[-1]
+        yield ids
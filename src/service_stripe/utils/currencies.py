@@ -0,0 +1,93 @@
+from django.db import connection
+from django.utils import timezone
+
+from service_stripe.models import Currency
+from service_stripe.utils.breakers import rehive_breaker
+from service_stripe.utils.clients import get_rehive
+
+
+# Currency fields that are copied from Rehive.
+SYNC_FIELDS = ('display_code', 'description', 'symbol', 'unit', 'divisibility',)
+
+
+def fetch_currencies(rehive, page_size=100):
+    """
+    Get every currency of the Rehive company, following all pages.
+    """
+
+    resource = rehive.admin.currencies
+    currencies = list(resource.get(filters={"page_size": page_size}))
+
+    while resource.next is not None:
+        currencies.extend(resource.get_next())
+
+    return currencies
+
+
+def apply_currencies(company, currencies):
+    """
+    Create or update the company's currencies using a single upsert on
+    `(company, code)`. Rows are only written if a field changed.
+
+    Returns a summary of the codes that were created and updated and the
+    number of currencies that were unchanged.
+    """
+
+    # The same row cannot be upserted twice in one statement.
+    currencies = {c['code']: c for c in currencies}
+    summary = {'created': [], 'updated': [], 'unchanged': 0}
+    if not currencies:
+        return summary
+
+    table = Currency._meta.db_table
+    columns = ('company_id', 'code',) + SYNC_FIELDS + (
+        'enabled', 'created', 'updated',
+    )
+    now = timezone.now()
+
+    params = []
+    for code, currency in currencies.items():
+        params.extend(
+            [company.id, code]
+            + [currency.get(f) for f in SYNC_FIELDS]
+            + [True, now, now]
+        )
+
+    sql = """
+        INSERT INTO {table} ({columns})
+        VALUES {values}
+        ON CONFLICT (company_id, code) DO UPDATE SET {updates}, updated = EXCLUDED.updated
+        WHERE ({current}) IS DISTINCT FROM ({excluded})
+        RETURNING code, xmax = 0
+    """.format(
+        table=table,
+        columns=', '.join(columns),
+        values=', '.join(
+            ['({})'.format(', '.join(['%s'] * len(columns)))] * len(currencies)
+        ),
+        updates=', '.join('{0} = EXCLUDED.{0}'.format(f) for f in SYNC_FIELDS),
+        current=', '.join('{}.{}'.format(table, f) for f in SYNC_FIELDS),
+        excluded=', '.join('EXCLUDED.{}'.format(f) for f in SYNC_FIELDS),
+    )
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        # Only inserted and changed rows are returned.
+        for code, created in cursor.fetchall():
+            summary['created' if created else 'updated'].append(code)
+
+    summary['unchanged'] = (
+        len(currencies) - len(summary['created']) - len(summary['updated'])
+    )
+    return summary
+
+
+def sync_currencies(company):
+    """
+    Sync a company's currencies from Rehive using its admin token.
+    """
+
+    with rehive_breaker.guard(company.identifier):
+        currencies = fetch_currencies(get_rehive(company.admin.token))
+
+    return apply_currencies(company, currencies)
@@ -0,0 +1,95 @@
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.local import Local
+
+from service_stripe.exceptions import DeadlineExceeded
+
+
+# Request scoped storage, safe for both threaded and async workers.
+_local = Local()
+
+
+def start(budget):
+    """
+    Start a deadline `budget` seconds from now. A budget of `None` clears
+    the deadline.
+    """
+
+    _local.deadline = time.monotonic() + budget if budget is not None else None
+
+
+def clear():
+    _local.deadline = None
+
+
+@contextmanager
+def budget(seconds):
+    """
+    Run a block of code with a deadline, restoring the previous deadline
+    afterwards.
+    """
+
+    previous = getattr(_local, 'deadline', None)
+    start(seconds)
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def bind(func):
+    """
+    Wrap `func` so that it runs with the current deadline when it is called
+    from another thread (eg. a thread pool).
+    """
+
+    deadline = getattr(_local, 'deadline', None)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        previous = getattr(_local, 'deadline', None)
+        _local.deadline = deadline
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.deadline = previous
+
+    return wrapper
+
+
+def remaining():
+    """
+    Get the seconds left before the current deadline or `None` if no deadline
+    is set.
+    """
+
+    deadline = getattr(_local, 'deadline', None)
+    if deadline is None:
+        return None
+
+    return deadline - time.monotonic()
+
+
+def expired():
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def get_timeout(default=None):
+    """
+    Get the timeout to use for the next upstream call. This is the `default`
+    timeout capped at the time remaining before the deadline.
+
+    Raises `DeadlineExceeded` if there is no time left.
+    """
+
+    left = remaining()
+    if left is None:
+        return default
+
+    if left <= 0:
+        raise DeadlineExceeded()
+
+    return min(default, left) if default is not None else left
@@ -0,0 +1,137 @@
+import select
+import threading
+import time
+from contextlib import contextmanager
+from logging import getLogger
+
+import psycopg2
+import psycopg2.extensions
+from django.conf import settings
+from django.db import connection, connections
+
+
+logger = getLogger('django')
+
+
+# Postgres channel used to broadcast payment updates.
+PAYMENT_CHANNEL = 'service_stripe_payment'
+
+
+def notify_payment(payment):
+    """
+    Broadcast that a payment has been updated.
+
+    NOTIFY is transactional so listeners only receive the notification once
+    the surrounding transaction has been committed.
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_notify(%s, %s)", [PAYMENT_CHANNEL, payment.identifier]
+        )
+
+
+class PaymentListener:
+    """
+    Process wide listener on the payment channel.
+
+    A single dedicated database connection is held per worker process and
+    waiting request threads are woken via events, so an idle waiter only
+    costs a thread.
+    """
+
+    def __init__(self, using='default', poll_interval=30):
+        self.using = using
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._waiters = {}
+        self._thread = None
+
+    def _connect(self):
+        params = connections[self.using].get_connection_params()
+        conn = psycopg2.connect(**params)
+        conn.set_isolation_level(
+            psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT
+        )
+        with conn.cursor() as cursor:
+            cursor.execute('LISTEN {};'.format(PAYMENT_CHANNEL))
+        return conn
+
+    def _run(self):
+        while True:
+            conn = None
+            try:
+                conn = self._connect()
+                while True:
+                    readable, _, _ = select.select(
+                        [conn], [], [], self.poll_interval
+                    )
+                    if not readable:
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._wake(conn.notifies.pop(0).payload)
+            except (psycopg2.Error, OSError):
+                logger.exception('Payment listener connection lost.')
+                # Notifications may have been missed, wake all waiters so that
+                # they can re-check the database themselves.
+                self._wake_all()
+                time.sleep(1)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name='payment-listener',
+                    daemon=True
+                )
+                self._thread.start()
+
+    def _wake(self, identifier):
+        with self._lock:
+            events = list(self._waiters.get(identifier, ()))
+        for event in events:
+            event.set()
+
+    def _wake_all(self):
+        with self._lock:
+            events = [e for events in self._waiters.values() for e in events]
+        for event in events:
+            event.set()
+
+    @property
+    def waiting(self):
+        with self._lock:
+            return sum(len(events) for events in self._waiters.values())
+
+    @contextmanager
+    def subscribe(self, identifier):
+        """
+        Subscribe to updates for a payment identifier. Yields an event that
+        is set when the payment is updated.
+
+        Subscribe before reading the payment from the database so that an
+        update committed in between is not missed.
+        """
+
+        self._ensure_started()
+        event = threading.Event()
+
+        with self._lock:
+            self._waiters.setdefault(identifier, set()).add(event)
+
+        try:
+            yield event
+        finally:
+            with self._lock:
+                events = self._waiters.get(identifier)
+                events.discard(event)
+                if not events:
+                    del self._waiters[identifier]
+
+
+payment_listener = PaymentListener(using=settings.PAYMENT_LISTENER_DATABASE)
@@ -0,0 +1,110 @@
+"""
+Monthly range partitions of the payment table (on `created`).
+
+Partitions are created ahead of time so that new payments never end up in
+the default partition. Rows in the default partition block the creation of
+a partition covering them until they are moved out by hand.
+"""
+
+from datetime import datetime, timezone
+from logging import getLogger
+
+from django.db import connection, transaction
+
+from service_stripe.models import Payment
+
+
+logger = getLogger('django')
+
+
+def month_start(value):
+    return datetime(value.year, value.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return value.replace(year=value.year + month // 12, month=month % 12 + 1)
+
+
+def partition_name(start):
+    return '{}_{:%Y%m}'.format(Payment._meta.db_table, start)
+
+
+def add_trigger(cursor, name):
+    """
+    Add the row trigger of the payment table (created by migration 0013) to
+    the partition `name`. It sets `updated` to the database's clock and fills
+    in a missing `company` whenever a row is written. Row triggers that
+    change the row can only be created on the partitions (before Postgres
+    13).
+    """
+
+    table = Payment._meta.db_table
+    cursor.execute(
+        'CREATE TRIGGER {trigger} BEFORE INSERT OR UPDATE ON {partition} '
+        'FOR EACH ROW EXECUTE PROCEDURE {trigger}()'.format(
+            trigger=connection.ops.quote_name(table + '_write'),
+            partition=connection.ops.quote_name(name)
+        )
+    )
+
+
+def covered_until(cursor):
+    """
+    Get the upper bound of the latest (non-default) partition.
+    """
+
+    cursor.execute("""
+        SELECT max(
+            (regexp_match(
+                pg_get_expr(c.relpartbound, c.oid), 'TO \\(''(.+)''\\)'
+            ))[1]::timestamptz
+        )
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+    """, [Payment._meta.db_table])
+    return cursor.fetchone()[0]
+
+
+@transaction.atomic
+def create_partitions(months_ahead, now=None):
+    """
+    Create the missing monthly partitions up to and including the month
+    `months_ahead` months from now. Returns the names of the created
+    partitions.
+    """
+
+    current = month_start(now or datetime.now(timezone.utc))
+    until = add_months(current, months_ahead + 1)
+    created = []
+
+    with connection.cursor() as cursor:
+        # Nothing to do until the payment table has been partitioned.
+        cursor.execute(
+            'SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)',
+            [Payment._meta.db_table]
+        )
+        if cursor.fetchone() != ('p',):
+            return created
+
+        start = covered_until(cursor)
+        start = max(start, current) if start else current
+
+        while start < until:
+            end = add_months(start, 1)
+            name = partition_name(start)
+            cursor.execute(
+                'CREATE TABLE {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)'
+                .format(
+                    connection.ops.quote_name(name),
+                    connection.ops.quote_name(Payment._meta.db_table)
+                ),
+                [start, end]
+            )
+            add_trigger(cursor, name)
+            logger.info('Created payment partition %s.', name)
+            created.append(name)
+            start = end
+
+    return created
@@ -0,0 +1,108 @@
+"""
+On-disk ring buffer of request profiles, shared by all worker processes.
+
+Each profile is stored as a cProfile dump (`<id>.prof`) with its metadata
+(`<id>.json`). Once there are more than PROFILING_MAX_PROFILES the oldest
+are deleted.
+"""
+
+import io
+import json
+import os
+import pstats
+import time
+import uuid
+
+from django.conf import settings
+
+
+def _path(identifier, extension):
+    return os.path.join(
+        settings.PROFILING_DIR, '{}.{}'.format(identifier, extension)
+    )
+
+
+def _remove(identifier):
+    for extension in ('json', 'prof',):
+        try:
+            os.remove(_path(identifier, extension))
+        except FileNotFoundError:
+            # Already removed by another worker.
+            pass
+
+
+def _identifiers():
+    """
+    Get the identifiers of the stored profiles, newest first.
+    """
+
+    try:
+        entries = list(os.scandir(settings.PROFILING_DIR))
+    except FileNotFoundError:
+        return []
+
+    profiles = []
+    for entry in entries:
+        if entry.name.endswith('.json'):
+            try:
+                profiles.append((entry.stat().st_mtime, entry.name[:-5]))
+            except FileNotFoundError:
+                pass
+
+    return [identifier for _, identifier in sorted(profiles, reverse=True)]
+
+
+def save_profile(profiler, metadata):
+    """
+    Store a profile with its metadata and drop the oldest profiles beyond
+    PROFILING_MAX_PROFILES. Returns the profile's identifier.
+    """
+
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+
+    identifier = uuid.uuid4().hex
+    profiler.dump_stats(_path(identifier, 'prof'))
+    # The metadata is written last, a profile is only listed once complete.
+    with open(_path(identifier, 'json'), 'w') as f:
+        json.dump(dict(metadata, id=identifier, created=time.time()), f)
+
+    for old in _identifiers()[settings.PROFILING_MAX_PROFILES:]:
+        _remove(old)
+
+    return identifier
+
+
+def get_metadata(identifier):
+    try:
+        with open(_path(identifier, 'json')) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def list_profiles(company=None):
+    """
+    Get the metadata of the stored profiles (of a company), newest first.
+    """
+
+    profiles = (get_metadata(i) for i in _identifiers())
+    return [
+        p for p in profiles
+        if p is not None and (company is None or p.get('company') == company)
+    ]
+
+
+def get_profile_path(identifier):
+    return _path(identifier, 'prof')
+
+
+def format_profile(identifier, sort='cumulative', limit=50):
+    """
+    Get a profile as text, with the `limit` most expensive functions by
+    `sort`.
+    """
+
+    stream = io.StringIO()
+    stats = pstats.Stats(get_profile_path(identifier), stream=stream)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
@@ -0,0 +1,57 @@
+import time
+from logging import getLogger
+
+from service_stripe.models import (
+    ArchivedPayment, ArchivedSession, Company, Currency, Payment, Session, User
+)
+from service_stripe.utils.common import pk_batches
+
+
+logger = getLogger('django')
+
+
+def delete_in_batches(queryset, batch_size):
+    """
+    Delete the rows of a queryset in batches of consecutive primary keys, so
+    that each delete only touches a bounded range of rows. Yields the number
+    of rows deleted by each batch.
+    """
+
+    for ids in pk_batches(queryset, batch_size):
+        deleted, _ = queryset.filter(pk__gte=ids[0], pk__lte=ids[-1]).delete()
+        yield deleted
+
+
+def purge_company(company, batch_size, pause, progress=None):
+    """
+    Delete a company and all its data in batches, pausing between batches.
+
+    Tables are emptied from the leaves up so that no batch has to cascade
+    into other tables. `progress` is called with the model and the number
+    of rows deleted so far after each batch.
+    """
+
+    steps = (
+        Payment.objects.filter(user__company=company),
+        Session.objects.filter(user__company=company),
+        ArchivedPayment.objects.filter(user__company=company),
+        ArchivedSession.objects.filter(user__company=company),
+        Currency.objects.filter(company=company),
+        User.objects.filter(company=company).exclude(pk=company.admin_id),
+    )
+
+    for queryset in steps:
+        total = 0
+        for deleted in delete_in_batches(queryset, batch_size):
+            total += deleted
+            logger.info(
+                'Purging %s: deleted %s %s.',
+                company.identifier, total, queryset.model._meta.verbose_name_plural
+            )
+            if progress:
+                progress(queryset.model, total)
+            time.sleep(pause)
+
+    # Only the company and its admin user are left.
+    Company.objects.filter(pk=company.pk).delete()
+    User.objects.filter(pk=company.admin_id).delete()
@@ -0,0 +1,180 @@
+"""
+Capture of slow database queries.
+
+Queries made during a request that take longer than SLOW_QUERY_THRESHOLD
+are kept with the request and saved once it has finished (`flush`), summed
+up by their fingerprint and the view that made them. A sample of them
+(SLOW_QUERY_EXPLAIN_RATE) also has its plan captured.
+"""
+
+import hashlib
+import random
+import re
+import threading
+from logging import getLogger
+
+import psycopg2
+from asgiref.local import Local
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+
+
+logger = getLogger('django')
+
+# Request scoped storage, safe for both threaded and async workers.
+_local = Local()
+_lock = threading.Lock()
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_VALUES_LIST = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+_SPACE = re.compile(r'\s+')
+_LOCKING = re.compile(
+    r'\bFOR\s+(?:NO\s+KEY\s+UPDATE|UPDATE|KEY\s+SHARE|SHARE)\b', re.I
+)
+# Functions with side effects that a rollback does not (fully) undo, or that
+# should not be repeated, eg. `SELECT pg_notify(...)` or `SELECT nextval(...)`.
+_VOLATILE = re.compile(
+    r'\b(?:pg_notify|nextval|setval|pg_advisory\w*|pg_try_advisory\w*|'
+    r'pg_sleep\w*|pg_cancel_backend|pg_terminate_backend|lo_\w+|dblink\w*)'
+    r'\s*\(',
+    re.I
+)
+
+
+def start():
+    _local.queries = []
+
+
+def clear():
+    _local.queries = None
+
+
+def normalize(sql):
+    """
+    Get the SQL of a query without its values, so that the same query made
+    with different values (or a different number of them) is the same. eg.
+    `WHERE id IN (%s, %s)` becomes `WHERE id IN (...)`.
+    """
+
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql.replace('%s', '?'))
+    sql = _PLACEHOLDER_LIST.sub('(...)', sql)
+    sql = _VALUES_LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    return hashlib.md5(sql.encode()).hexdigest()
+
+
+def get_plan(connection, sql, params):
+    """
+    Get the plan of a query. Since analyzing a query runs it again, only
+    plain reads (a SELECT without locking or functions with side effects) are
+    analyzed, and always in a savepoint (or transaction) that is rolled back.
+    Anything else, including WITH queries which may modify data, is only
+    planned. Runs on its own cursor so that the results of the query are
+    left alone.
+    """
+
+    statement = sql.lstrip().split(None, 1)[0].upper()
+    if statement != 'SELECT' or _LOCKING.search(sql) or _VOLATILE.search(sql):
+        options = ''
+    else:
+        options = '(ANALYZE, BUFFERS) '
+
+    if connection.in_atomic_block:
+        begin = 'SAVEPOINT slow_query_explain'
+        rollback = 'ROLLBACK TO SAVEPOINT slow_query_explain'
+    else:
+        begin, rollback = 'BEGIN', 'ROLLBACK'
+
+    with connection.connection.cursor() as cursor:
+        cursor.execute(begin)
+        try:
+            cursor.execute('EXPLAIN ' + options + sql, params)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+        except psycopg2.Error as exc:
+            logger.warning('Failed to explain a slow query: {}'.format(exc))
+        finally:
+            cursor.execute(rollback)
+
+
+def capture(connection, sql, params, seconds, explain=True):
+    """
+    Keep a query that took `seconds` if it was slow. Nothing is kept outside
+    of a request.
+    """
+
+    queries = getattr(_local, 'queries', None)
+    if queries is None or seconds < settings.SLOW_QUERY_THRESHOLD:
+        return
+
+    plan = None
+    if explain and random.random() < settings.SLOW_QUERY_EXPLAIN_RATE:
+        plan = get_plan(connection, sql, params)
+
+    with _lock:
+        queries.append((normalize(sql), seconds, plan))
+
+
+def flush(view):
+    """
+    Save the slow queries kept for the current request under `view`.
+    """
+
+    queries = getattr(_local, 'queries', None)
+    _local.queries = None
+    if not queries:
+        return
+
+    # Imported here, the database backend imports this module.
+    from django.db import connection
+    from service_stripe.models import SlowQuery
+
+    now = timezone.now()
+    rows = {}
+    for sql, seconds, plan in queries:
+        key = fingerprint(sql)
+        row = rows.setdefault(key, [key, view, sql, 0, 0, 0, None, None])
+        row[3] += 1
+        row[4] += seconds
+        row[5] = max(row[5], seconds)
+        if plan:
+            row[6], row[7] = plan, now
+
+    table = SlowQuery._meta.db_table
+    columns = (
+        'fingerprint', 'view', 'sql', 'count', 'duration', 'max_duration',
+        'plan', 'plan_updated', 'created', 'updated',
+    )
+    sql = """
+        INSERT INTO {table} ({columns})
+        VALUES {values}
+        ON CONFLICT (fingerprint, view) DO UPDATE SET
+            count = {table}.count + EXCLUDED.count,
+            duration = {table}.duration + EXCLUDED.duration,
+            max_duration = GREATEST({table}.max_duration, EXCLUDED.max_duration),
+            plan = COALESCE(EXCLUDED.plan, {table}.plan),
+            plan_updated = COALESCE(EXCLUDED.plan_updated, {table}.plan_updated),
+            updated = EXCLUDED.updated
+    """.format(
+        table=table,
+        columns=', '.join(columns),
+        values=', '.join(
+            ['({})'.format(', '.join(['%s'] * len(columns)))] * len(rows)
+        ),
+    )
+
+    params = []
+    for row in rows.values():
+        params.extend(row + [now, now])
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+    except DatabaseError as exc:
+        logger.warning('Failed to save slow queries: {}'.format(exc))
@@ -0,0 +1,188 @@
+import gzip
+import json
+import os
+import time
+from datetime import timedelta
+from enum import Enum
+from logging import getLogger
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+
+from service_stripe.enums import PaymentStatus, RetentionAction
+from service_stripe.models import (
+    ArchivedPayment, ArchivedSession, Payment, Session
+)
+from service_stripe.utils.common import pk_batches
+
+
+logger = getLogger('django')
+
+
+class ExportEncoder(DjangoJSONEncoder):
+
+    def default(self, o):
+        if isinstance(o, Enum):
+            return o.value
+        return super().default(o)
+
+
+def get_policy(company):
+    """
+    Get the session retention days, payment retention days and retention
+    action of a company, using the defaults for anything it did not set.
+    """
+
+    session_days = company.session_retention
+    if session_days is None:
+        session_days = settings.RETENTION_SESSION_DAYS
+
+    payment_days = company.payment_retention
+    if payment_days is None:
+        payment_days = settings.RETENTION_PAYMENT_DAYS
+
+    action = company.retention_action or RetentionAction(
+        settings.RETENTION_ACTION
+    )
+    return session_days, payment_days, action
+
+
+def expired_sessions(company, days):
+    return Session.objects.filter(
+        user__company=company,
+        created__lt=timezone.now() - timedelta(days=days)
+    )
+
+
+def expired_payments(company, days):
+    """
+    Payments that were settled (succeeded or failed) more than `days` ago.
+    """
+
+    return Payment.objects.filter(
+        company=company,
+        status__in=(PaymentStatus.SUCCEEDED, PaymentStatus.FAILED,),
+        updated__lt=timezone.now() - timedelta(days=days)
+    )
+
+
+def archive(model, archive_model, ids):
+    """
+    Move rows to the archive table in one transaction. Rows that were already
+    archived are left as they are. Returns the number of rows moved.
+    """
+
+    # Only the columns the archive has (eg. not `Payment.company`).
+    archived = {f.column for f in archive_model._meta.concrete_fields}
+    columns = ', '.join(
+        f.column for f in model._meta.concrete_fields
+        if not f.primary_key and f.column in archived
+    )
+    sql = """
+        INSERT INTO {archive} ({columns}, archived)
+        SELECT {columns}, %s FROM {table} WHERE id = ANY(%s)
+        ON CONFLICT (identifier) DO NOTHING
+    """.format(
+        archive=archive_model._meta.db_table,
+        table=model._meta.db_table,
+        columns=columns
+    )
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [timezone.now(), ids])
+        deleted, _ = model.objects.filter(pk__in=ids).delete()
+
+    return deleted
+
+
+def export(model, ids, path):
+    """
+    Append rows to a compressed file as JSON lines and delete them once the
+    file is on disk. Returns the number of rows exported.
+
+    Each batch is written as a complete gzip member (which `gzip` reads as
+    one file), so a crash can only leave behind a partial batch whose rows
+    were not deleted yet.
+    """
+
+    created = not os.path.exists(path)
+    with open(path, 'ab') as file:
+        with gzip.GzipFile(fileobj=file, mode='wb') as stream:
+            for row in model.objects.filter(
+                    pk__in=ids).order_by('pk').values():
+                stream.write(
+                    (json.dumps(row, cls=ExportEncoder) + '\n').encode()
+                )
+        file.flush()
+        os.fsync(file.fileno())
+
+    if created:
+        # Make sure the new file itself is not lost.
+        directory = os.open(os.path.dirname(path), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+    deleted, _ = model.objects.filter(pk__in=ids).delete()
+    return deleted
+
+
+def get_export_path(company, model):
+    return os.path.join(
+        settings.RETENTION_EXPORT_DIR,
+        company.identifier,
+        '{}-{}.jsonl.gz'.format(
+            model._meta.db_table, timezone.now().strftime('%Y%m%d%H%M%S')
+        )
+    )
+
+
+def apply_retention(company, batch_size, pause, progress=None):
+    """
+    Archive or export a company's old sessions and settled payments in
+    batches, pausing between batches.
+
+    `progress` is called with the model and the number of rows moved so far
+    after each batch. Returns the number of rows moved per model.
+    """
+
+    session_days, payment_days, action = get_policy(company)
+    steps = (
+        (Session, ArchivedSession, session_days, expired_sessions),
+        (Payment, ArchivedPayment, payment_days, expired_payments),
+    )
+    summary = {}
+
+    for model, archive_model, days, get_expired in steps:
+        total = summary[model] = 0
+        # A retention of 0 days keeps rows forever.
+        if not days:
+            continue
+
+        batches = pk_batches(get_expired(company, days), batch_size)
+        path = None
+
+        for ids in batches:
+            if action == RetentionAction.EXPORT:
+                if path is None:
+                    path = get_export_path(company, model)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                total += export(model, ids, path)
+            else:
+                total += archive(model, archive_model, ids)
+
+            summary[model] = total
+            logger.info(
+                'Retention for %s: %s %s moved (%s).',
+                company.identifier, total,
+                model._meta.verbose_name_plural, action.value
+            )
+            if progress:
+                progress(model, total)
+            time.sleep(pause)
+
+    return summary
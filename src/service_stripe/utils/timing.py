@@ -0,0 +1,125 @@
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+from asgiref.local import Local
+from opentelemetry.trace import StatusCode
+
+from service_stripe import metrics, tracing
+
+
+# Request scoped storage, safe for both threaded and async workers.
+_local = Local()
+# Calls made concurrently (eg. by `fan_out`) record into the same timings.
+_lock = threading.Lock()
+
+# Path segments that identify an object (Stripe ids, UUIDs, numbers) rather
+# than an operation, apart from a leading API version.
+_ID_SEGMENT = re.compile(r'\d')
+_VERSION_SEGMENT = re.compile(r'^v?\d+$')
+
+
+def start():
+    """
+    Start recording the time spent on the database and upstreams.
+    """
+
+    _local.timings = {}
+
+
+def clear():
+    _local.timings = None
+
+
+def get():
+    """
+    Get the calls recorded since `start` as a dictionary of name to
+    `(count, seconds)`.
+    """
+
+    with _lock:
+        return dict(getattr(_local, 'timings', None) or {})
+
+
+def record(name, seconds):
+    """
+    Record a call to `name` (eg. "db" or "stripe") that took `seconds`.
+    Nothing is recorded outside of a request.
+    """
+
+    timings = getattr(_local, 'timings', None)
+    if timings is None:
+        return
+
+    with _lock:
+        count, total = timings.get(name, (0, 0.0))
+        timings[name] = (count + 1, total + seconds)
+
+
+def bind(func):
+    """
+    Wrap `func` so that its calls are recorded with the current request when
+    it is called from another thread (eg. a thread pool).
+    """
+
+    timings = getattr(_local, 'timings', None)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        previous = getattr(_local, 'timings', None)
+        _local.timings = timings
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.timings = previous
+
+    return wrapper
+
+
+def get_operation(method, url):
+    """
+    Get the operation of an upstream request as its method and path, with
+    object identifiers replaced so that the number of operations stays small.
+    eg. "POST /v1/payment_intents/:id/confirm".
+    """
+
+    segments = [s for s in urlsplit(url).path.split('/') if s]
+    path = '/'.join(
+        ':id' if _ID_SEGMENT.search(s) and not (
+            i == 0 and _VERSION_SEGMENT.match(s)) else s
+        for i, s in enumerate(segments)
+    )
+    return '{} /{}'.format(method.upper(), path)
+
+
+@contextmanager
+def upstream(dependency, method, url):
+    """
+    Time and trace an HTTP request to an upstream (Rehive or Stripe). Set the
+    response status code on the yielded call once a response is received.
+    """
+
+    operation = get_operation(method, url)
+    call = SimpleNamespace(status=None)
+
+    start = time.perf_counter()
+    with tracing.upstream_span(dependency, method, url, operation) as span:
+        try:
+            yield call
+        finally:
+            seconds = time.perf_counter() - start
+            if call.status:
+                span.set_attribute('http.status_code', call.status)
+                if call.status >= 400:
+                    span.set_status(StatusCode.ERROR)
+
+            metrics.UPSTREAM_REQUEST_SECONDS.labels(
+                dependency,
+                operation,
+                '{}xx'.format(call.status // 100) if call.status else 'error'
+            ).observe(seconds)
+            record(dependency, seconds)
@@ -1,22 +1,35 @@
 import os
 import json
+import base64
+import binascii
 import six
 from logging import getLogger
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 
 import stripe
-from rest_framework import exceptions
+from rest_framework import exceptions, status
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from drf_rehive_extras.generics import *
 from rest_framework.parsers import BaseParser, ParseError
 from rest_framework.renderers import JSONRenderer
 from django.conf import settings as django_settings
-from django.core.exceptions import ObjectDoesNotExist
-
+from django.http import FileResponse
+from django.db.models import (
+    DateTimeField, ExpressionWrapper, OuterRef, Q, Subquery
+)
+from django.db.models.functions import Now
+from django.utils import timezone
+from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist
+from rest_flex_fields.utils import is_included
+
+from service_stripe import tracing
 from service_stripe.authentication import *
 from service_stripe.serializers import *
 from service_stripe.models import *
+from service_stripe.routers import read_replica
+from service_stripe.utils import profiling
+from service_stripe.utils.listeners import payment_listener
 
 
 stripe.api_key = os.environ.get('STRIPE_SECRET_KEY')
@@ -24,6 +37,8 @@ stripe.api_version = os.environ.get('STRIPE_API_VERSION')
 
 logger = getLogger('django')
 
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
 
 """
 Parsers
@@ -49,6 +64,247 @@ class RawJSONParser(BaseParser):
             raise ParseError('JSON parse error - %s' % six.text_type(exc))
 
 
+"""
+Helpers
+"""
+
+
+def get_query_fields(serializer_class, model, request):
+    """
+    Get the model fields needed to serialize an object with the fields that
+    are included in the response (see the `fields` and `omit` query params),
+    as a list of fields and a list of relations to join.
+
+    Fields whose source is not a model field can list the model fields they
+    use in the serializer's `Meta.query_fields`. Returns `None` if a field's
+    model fields are not known.
+    """
+
+    serializer = serializer_class(context={'request': request})
+    query_fields = getattr(serializer_class.Meta, 'query_fields', {})
+    fields, related = [], set()
+
+    for name, field in serializer.fields.items():
+        if not is_included(request, name):
+            continue
+
+        if name in query_fields:
+            sources = query_fields[name]
+        elif isinstance(field, serializers.BaseSerializer):
+            sources = [
+                '{}.{}'.format(field.source, f.source)
+                for f in field.fields.values()
+            ]
+        else:
+            sources = [field.source]
+
+        for source in sources:
+            path = source.split('.')
+            opts = model._meta
+            try:
+                for relation in path[:-1]:
+                    opts = opts.get_field(relation).related_model._meta
+                model_field = opts.get_field(path[-1])
+            except (FieldDoesNotExist, AttributeError):
+                return None
+
+            # A relation would be loaded separately for each object.
+            if model_field.is_relation:
+                return None
+
+            fields.append('__'.join(path))
+            if len(path) > 1:
+                related.add('__'.join(path[:-1]))
+
+    return fields, sorted(related)
+
+
+def only_serialized(queryset, serializer_class, request, *required):
+    """
+    Only load the columns (and join the relations) needed for the fields
+    included in the response, along with the `required` fields.
+    """
+
+    query_fields = get_query_fields(
+        serializer_class, queryset.model, request
+    )
+    if query_fields is None:
+        return queryset
+
+    fields, related = query_fields
+    queryset = queryset.select_related(None)
+    # Without any relations `select_related()` would join all of them.
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.only(*fields, *required)
+
+
+def get_retained(request, model, archive_model, serializer_class=None,
+                 **filters):
+    """
+    Get an object. Objects moved to `archive_model` by the retention policy
+    are only looked up if the `archived` query param is set. Only the fields
+    used by `serializer_class` are loaded if it is set.
+    """
+
+    def get(model):
+        queryset = model.objects.all()
+        if serializer_class:
+            queryset = only_serialized(queryset, serializer_class, request)
+        return queryset.get(**filters)
+
+    try:
+        return get(model)
+    except model.DoesNotExist:
+        if request.query_params.get('archived') not in ('true', 'True', '1'):
+            raise exceptions.NotFound()
+
+    try:
+        return get(archive_model)
+    except archive_model.DoesNotExist:
+        raise exceptions.NotFound()
+
+
+def get_payment(request, serializer_class=None, **filters):
+    """
+    Get a payment, see `get_retained`.
+    """
+
+    return get_retained(
+        request, Payment, ArchivedPayment, serializer_class, **filters
+    )
+
+
+class ReplicaMixin:
+    """
+    Serve GET requests from a read replica. Authentication and throttling
+    still happen on the primary.
+    """
+
+    def get(self, request, *args, **kwargs):
+        with read_replica(request.user):
+            return super().get(request, *args, **kwargs)
+
+
+def get_payments(request, identifiers, serializer_class, **filters):
+    """
+    Get the payments with any of the `identifiers`, see `get_payment`.
+    """
+
+    def get(model, identifiers):
+        return only_serialized(
+            model.objects.filter(identifier__in=identifiers, **filters),
+            serializer_class,
+            request,
+            'identifier'
+        )
+
+    payments = list(get(Payment, identifiers))
+
+    if request.query_params.get('archived') in ('true', 'True', '1'):
+        found = {p.identifier for p in payments}
+        missing = [i for i in identifiers if i not in found]
+        if missing:
+            payments.extend(get(ArchivedPayment, missing))
+
+    return payments
+
+
+def encode_change_cursor(payment):
+    """
+    Encode the position of a payment in the change feed (its `updated` and
+    `id`) as an opaque cursor.
+    """
+
+    updated = (payment.updated - EPOCH) // timedelta(microseconds=1)
+    return base64.urlsafe_b64encode(
+        '{}:{}'.format(updated, payment.id).encode()
+    ).decode()
+
+
+def decode_change_cursor(cursor):
+    try:
+        updated, pk = base64.urlsafe_b64decode(
+            cursor.encode()
+        ).decode().split(':')
+        return EPOCH + timedelta(microseconds=int(updated)), int(pk)
+    except (ValueError, OverflowError, binascii.Error):
+        raise exceptions.ValidationError({"cursor": ["Invalid cursor."]})
+
+
+class BatchRetrieveAPIView(ReplicaMixin, RetrieveAPIView):
+    """
+    Retrieve up to BATCH_RETRIEVE_MAX_SIZE objects at once using a comma
+    separated list of identifiers (the `ids` query param). Objects are
+    returned by identifier, along with the identifiers that were not found.
+    """
+
+    def get_identifiers(self):
+        identifiers = []
+        for identifier in self.request.query_params.get('ids', '').split(','):
+            identifier = identifier.strip()
+            if identifier and identifier not in identifiers:
+                identifiers.append(identifier)
+
+        if not identifiers:
+            raise exceptions.ValidationError(
+                {"ids": ["At least one identifier is required."]}
+            )
+        if len(identifiers) > django_settings.BATCH_RETRIEVE_MAX_SIZE:
+            raise exceptions.ValidationError(
+                {"ids": ["At most {} identifiers are allowed.".format(
+                    django_settings.BATCH_RETRIEVE_MAX_SIZE
+                )]}
+            )
+
+        return identifiers
+
+    def get_objects(self, identifiers):
+        raise NotImplementedError('.get_objects() must be overridden')
+
+    def retrieve(self, request, *args, **kwargs):
+        identifiers = self.get_identifiers()
+        objects = self.get_objects(identifiers)
+        serializer = self.get_serializer(objects, many=True)
+        # The `id` may be left out of the response (using `fields`).
+        results = {
+            obj.identifier: data for obj, data in zip(objects, serializer.data)
+        }
+
+        return Response({
+            'status': 'success',
+            'data': {
+                'results': results,
+                'missing': [i for i in identifiers if i not in results],
+            }
+        })
+
+
+def get_created_filters(request):
+    """
+    Get filters from the `created__gt` and `created__lt` query params
+    (timestamps in milliseconds). Payments are partitioned by `created`, so
+    these limit the partitions a listing has to search.
+    """
+
+    filters = {}
+    for lookup in ('created__gt', 'created__lt',):
+        value = request.query_params.get(lookup)
+        if value is None:
+            continue
+
+        try:
+            filters[lookup] = datetime.fromtimestamp(
+                int(value) / 1000, tz=timezone.utc
+            )
+        except (ValueError, OverflowError, OSError):
+            raise exceptions.ValidationError(
+                {lookup: ["A valid timestamp in milliseconds is required."]}
+            )
+
+    return filters
+
+
 """
 Activation Endpoints
 """
@@ -57,6 +313,7 @@ Activation Endpoints
 class ActivateView(CreateAPIView):
     permission_classes = (AllowAny, )
     serializer_class = ActivateSerializer
+    timeout_budget = django_settings.ACTIVATE_TIMEOUT_BUDGET
 
 
 class DeactivateView(CreateAPIView):
@@ -79,6 +336,14 @@ class WebhookView(CreateAPIView):
     serializer_class = WebhookSerializer
     parser_classes = (RawJSONParser,)
 
+    def post(self, request, *args, **kwargs):
+        with tracing.span('webhook', {'company.id': kwargs.get('company_id')}):
+            return super().post(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        with tracing.span('webhook.process'):
+            super().perform_create(serializer)
+
 
 """
 Admin Endpoints
@@ -92,6 +357,7 @@ class AdminCompanyView(RetrieveUpdateAPIView):
         'PUT': AdminUpdateCompanySerializer,
     }
     authentication_classes = (AdminAuthentication,)
+    throttle_scope = 'admin'
 
     def get_object(self):
         return self.request.user.company
@@ -101,9 +367,10 @@ class AdminCompanyView(RetrieveUpdateAPIView):
         return super().update(request, *args, **kwargs)
 
 
-class AdminListUserView(ListAPIView):
+class AdminListUserView(ReplicaMixin, ListAPIView):
     serializer_class = AdminUserSerializer
     authentication_classes = (AdminAuthentication,)
+    throttle_scope = 'admin'
 
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):
@@ -111,12 +378,20 @@ class AdminListUserView(ListAPIView):
 
         return User.objects.filter(
             company=self.request.user.company
+        ).annotate(
+            # Avoid a query per user for `last_payment_method`.
+            latest_payment_method=Subquery(
+                Payment.objects.filter(
+                    user=OuterRef('pk')
+                ).order_by('-created').values('payment_method')[:1]
+            )
         ).order_by('-created')
 
 
-class AdminUserView(RetrieveAPIView):
+class AdminUserView(ReplicaMixin, RetrieveAPIView):
     serializer_class = AdminUserSerializer
     authentication_classes = (AdminAuthentication,)
+    throttle_scope = 'admin'
 
     def get_object(self):
         try:
@@ -131,6 +406,7 @@ class AdminUserView(RetrieveAPIView):
 class AdminListUserPaymentMethodView(ListAPIView):
     serializer_class = PaymentMethodSerializer
     authentication_classes = (AdminAuthentication,)
+    throttle_scope = 'admin'
     pagination_class = None
 
     def get_queryset(self):
@@ -151,6 +427,7 @@ class AdminListUserPaymentMethodView(ListAPIView):
 class AdminUserPaymentMethodView(RetrieveAPIView):
     serializer_class = PaymentMethodSerializer
     authentication_classes = (AdminAuthentication,)
+    throttle_scope = 'admin'
 
     def get_object(self):
         try:
@@ -167,9 +444,10 @@ class AdminUserPaymentMethodView(RetrieveAPIView):
             raise exceptions.NotFound()
 
 
-class AdminListCurrencyView(ListAPIView):
+class AdminListCurrencyView(ReplicaMixin, ListAPIView):
     serializer_class = CurrencySerializer
     authentication_classes = (AdminAuthentication,)
+    throttle_scope = 'admin'
     filter_fields = ('code',)
 
     def get_queryset(self):
@@ -181,9 +459,10 @@ class AdminListCurrencyView(ListAPIView):
         ).order_by('-created')
 
 
-class AdminCurrencyView(RetrieveAPIView):
+class AdminCurrencyView(ReplicaMixin, RetrieveAPIView):
     serializer_class = CurrencySerializer
     authentication_classes = (AdminAuthentication,)
+    throttle_scope = 'admin'
 
     def get_object(self):
         try:
@@ -195,31 +474,244 @@ class AdminCurrencyView(RetrieveAPIView):
             raise exceptions.NotFound()
 
 
-class AdminListPaymentView(ListAPIView):
+class AdminListPaymentView(ReplicaMixin, ListAPIView):
+    """
+    List the company's payments. Payments can be looked up by Rehive
+    transaction (`txn`), transaction collection (`collection`), Stripe charge
+    (`charge`) or Stripe customer (`customer`) using query params.
+    """
+
     serializer_class = AdminPaymentSerializer
     authentication_classes = (AdminAuthentication,)
+    throttle_scope = 'admin'
+
+    def get_lookup_filters(self):
+        params = self.request.query_params
+        filters = {}
+
+        if params.get('txn'):
+            # Array containment (@>) can use the GIN index on txns.
+            filters['txns__contains'] = [params['txn']]
+        if params.get('collection'):
+            filters['collection'] = params['collection']
+        # Match the expression indexes on the intent snapshot.
+        if params.get('charge'):
+            filters['intent_charge'] = params['charge']
+        if params.get('customer'):
+            filters['intent_customer'] = params['customer']
+
+        return filters
 
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):
             return Payment.objects.none()
 
-        return Payment.objects.filter(
-            user__company=self.request.user.company
-        ).order_by('-created')
+        return only_serialized(
+            Payment.objects.alias(
+                intent_charge=INTENT_CHARGE, intent_customer=INTENT_CUSTOMER
+            ).filter(
+                user__company=self.request.user.company,
+                **get_created_filters(self.request),
+                **self.get_lookup_filters()
+            ).order_by('-created'),
+            self.serializer_class,
+            self.request
+        )
+
+
+class AdminPaymentBatchView(BatchRetrieveAPIView):
+    """
+    Get (GET) or create (POST) many payments at once.
+    """
+
+    serializer_class = AdminPaymentSerializer
+    serializer_classes = {
+        'POST': AdminCreatePaymentBatchSerializer,
+    }
+    authentication_classes = (AdminAuthentication,)
+    timeout_budget = django_settings.PAYMENT_BATCH_TIMEOUT_BUDGET
+
+    @property
+    def throttle_scope(self):
+        # Creating payments is throttled separately from other admin requests.
+        return 'payment_batches' if self.request.method == 'POST' else 'admin'
+
+    def get_objects(self, identifiers):
+        return get_payments(
+            self.request,
+            identifiers,
+            self.serializer_class,
+            user__company=self.request.user.company,
+            **get_created_filters(self.request)
+        )
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = serializer.save()
+
+        # Each payment has its own result, some may have failed.
+        return Response(
+            {
+                'status': 'success',
+                'data': AdminPaymentBatchResultSerializer(
+                    results, many=True, context={'request': request}
+                ).data
+            },
+            status=status.HTTP_201_CREATED
+        )
+
 
+class AdminPaymentChangesView(ListAPIView):
+    """
+    Feed of the company's payments in the order they were last updated, to
+    keep a copy of them in sync. Pass the returned `cursor` to get the
+    payments updated since. Served from the primary, so that replica lag
+    cannot cause changes to be skipped.
+    """
 
-class AdminPaymentView(RetrieveAPIView):
     serializer_class = AdminPaymentSerializer
     authentication_classes = (AdminAuthentication,)
+    throttle_scope = 'admin'
+    pagination_class = None
+
+    DEFAULT_PAGE_SIZE = 100
+    MAX_PAGE_SIZE = 250
+
+    def get_page_size(self):
+        try:
+            page_size = int(self.request.query_params.get(
+                'page_size', self.DEFAULT_PAGE_SIZE
+            ))
+        except ValueError:
+            raise exceptions.ValidationError(
+                {"page_size": ["A valid integer is required."]}
+            )
+
+        return max(1, min(page_size, self.MAX_PAGE_SIZE))
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return Payment.objects.none()
+
+        # Leave out recent changes, a transaction that updated a payment
+        # slightly earlier may not have committed yet. `updated` is set from
+        # the database's clock, so it is compared to the database's time.
+        queryset = Payment.objects.filter(
+            company=self.request.user.company,
+            updated__lt=ExpressionWrapper(
+                Now() - timedelta(
+                    seconds=django_settings.PAYMENT_CHANGES_DELAY
+                ),
+                output_field=DateTimeField()
+            )
+        )
+
+        cursor = self.request.query_params.get('cursor')
+        if cursor:
+            updated, pk = decode_change_cursor(cursor)
+            queryset = queryset.filter(
+                Q(updated__gt=updated) | Q(id__gt=pk), updated__gte=updated
+            )
+
+        # Uses the `(company, updated, id)` index.
+        return only_serialized(
+            queryset.order_by('updated', 'id'),
+            self.serializer_class,
+            self.request,
+            'updated'
+        )
+
+    def list(self, request, *args, **kwargs):
+        page_size = self.get_page_size()
+        payments = list(self.get_queryset()[:page_size + 1])
+        has_more = len(payments) > page_size
+        payments = payments[:page_size]
+
+        return Response({
+            'status': 'success',
+            'data': {
+                'results': self.get_serializer(payments, many=True).data,
+                # Stays the same when there are no new changes.
+                'cursor': encode_change_cursor(payments[-1]) if payments
+                else request.query_params.get('cursor'),
+                'has_more': has_more,
+            }
+        })
+
+
+class AdminPaymentView(ReplicaMixin, RetrieveAPIView):
+    serializer_class = AdminPaymentSerializer
+    authentication_classes = (AdminAuthentication,)
+    throttle_scope = 'admin'
 
     def get_object(self):
+        return get_payment(
+            self.request,
+            self.serializer_class,
+            identifier=self.kwargs.get('id'),
+            user__company=self.request.user.company
+        )
+
+
+class AdminListProfileView(ListAPIView):
+    serializer_class = AdminProfileSerializer
+    authentication_classes = (AdminAuthentication,)
+    throttle_scope = 'admin'
+    pagination_class = None
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return []
+
+        return profiling.list_profiles(
+            company=self.request.user.company.identifier
+        )
+
+
+class AdminProfileView(RetrieveAPIView):
+    serializer_class = AdminProfileDetailSerializer
+    authentication_classes = (AdminAuthentication,)
+    throttle_scope = 'admin'
+
+    def get_object(self):
+        identifier = self.kwargs.get('id')
+        metadata = profiling.get_metadata(identifier)
+        if (metadata is None
+                or metadata.get('company')
+                != self.request.user.company.identifier):
+            raise exceptions.NotFound()
+
+        return metadata
+
+    def retrieve(self, request, *args, **kwargs):
+        metadata = self.get_object()
+
+        # Download the raw cProfile dump (eg. for snakeviz).
+        if request.query_params.get('download') in ('true', '1',):
+            try:
+                return FileResponse(
+                    open(profiling.get_profile_path(metadata['id']), 'rb'),
+                    as_attachment=True,
+                    filename='{}.prof'.format(metadata['id'])
+                )
+            except FileNotFoundError:
+                raise exceptions.NotFound()
+
         try:
-            return Payment.objects.get(
-                identifier=self.kwargs.get('identifier'),
-                user__company=self.request.user.company
+            stats = profiling.format_profile(
+                metadata['id'],
+                sort=request.query_params.get('sort', 'cumulative'),
             )
-        except Payment.DoesNotExist:
+        except FileNotFoundError:
             raise exceptions.NotFound()
+        except KeyError:
+            raise exceptions.ValidationError(
+                {"sort": ["Invalid sort key."]}
+            )
+
+        serializer = self.get_serializer(dict(metadata, stats=stats))
+        return Response({'status': 'success', 'data': serializer.data})
 
 
 """
@@ -243,70 +735,162 @@ class UserCompanyView(RetrieveAPIView):
         return self.request.user.company
 
 
-class UserListCreateSessionView(ListCreateAPIView):
+class UserListCreateSessionView(ReplicaMixin, ListCreateAPIView):
     serializer_class = SessionSerializer
     authentication_classes = (UserAuthentication,)
+    throttle_scope = 'sessions'
 
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):
             return Session.objects.none()
 
-        return Session.objects.filter(
-            user=self.request.user
-        ).order_by('-created')
+        return only_serialized(
+            Session.objects.filter(user=self.request.user).order_by('-created'),
+            self.serializer_class,
+            self.request
+        )
 
 
-class UserSessionView(RetrieveAPIView):
+class UserBatchSessionView(BatchRetrieveAPIView):
     serializer_class = SessionSerializer
     authentication_classes = (UserAuthentication,)
+    throttle_scope = 'sessions'
+
+    def get_objects(self, identifiers):
+        return only_serialized(
+            Session.objects.filter(
+                identifier__in=identifiers, user=self.request.user
+            ),
+            self.serializer_class,
+            self.request,
+            'identifier'
+        )
+
+
+class UserSessionView(ReplicaMixin, RetrieveAPIView):
+    serializer_class = SessionSerializer
+    authentication_classes = (UserAuthentication,)
+    throttle_scope = 'sessions'
 
     def get_object(self):
-        try:
-            return Session.objects.get(
-                identifier=self.kwargs.get('identifier'),
-                user=self.request.user
-            )
-        except Session.DoesNotExist:
-            raise exceptions.NotFound()
+        return get_retained(
+            self.request,
+            Session,
+            ArchivedSession,
+            self.serializer_class,
+            identifier=self.kwargs.get('identifier'),
+            user=self.request.user
+        )
 
 
-class UserListCreatePaymentView(ListCreateAPIView):
+class UserListCreatePaymentView(ReplicaMixin, ListCreateAPIView):
     serializer_class = PaymentSerializer
     serializer_classes = {
         'POST': CreatePaymentSerializer,
     }
     authentication_classes = (UserAuthentication,)
+    throttle_scope = 'payments'
 
     def get_queryset(self):
         if getattr(self, 'swagger_fake_view', False):
             return Payment.objects.none()
 
-        return Payment.objects.filter(
-            user=self.request.user
-        ).order_by('-created')
+        return only_serialized(
+            Payment.objects.filter(
+                user=self.request.user,
+                **get_created_filters(self.request)
+            ).order_by('-created'),
+            self.serializer_class,
+            self.request
+        )
 
     def create(self, request, *args, **kwargs):
         kwargs['return_serializer'] = self.serializer_class
         return super().create(request, *args, **kwargs)
 
 
-class UserPaymentView(RetrieveAPIView):
+class UserBatchPaymentView(BatchRetrieveAPIView):
+    serializer_class = PaymentSerializer
+    authentication_classes = (UserAuthentication,)
+    throttle_scope = 'payments'
+
+    def get_objects(self, identifiers):
+        return get_payments(
+            self.request,
+            identifiers,
+            self.serializer_class,
+            user=self.request.user,
+            **get_created_filters(self.request)
+        )
+
+
+class UserPaymentView(ReplicaMixin, RetrieveAPIView):
     serializer_class = PaymentSerializer
     authentication_classes = (UserAuthentication,)
+    throttle_scope = 'payments'
 
     def get_object(self):
+        return get_payment(
+            self.request,
+            self.serializer_class,
+            identifier=self.kwargs.get('identifier'),
+            user=self.request.user
+        )
+
+
+class UserPaymentWaitView(RetrieveAPIView):
+    """
+    Long-poll a payment until it leaves the processing status or the timeout
+    passes. The timeout (in seconds) can be set using the `timeout` query
+    param.
+    """
+
+    serializer_class = PaymentSerializer
+    authentication_classes = (UserAuthentication,)
+    throttle_scope = 'payments'
+
+    @staticmethod
+    def get_timeout(request):
         try:
-            return Payment.objects.get(
-                identifier=self.kwargs.get('identifier'),
-                user=self.request.user
+            timeout = int(request.query_params.get(
+                'timeout', django_settings.PAYMENT_WAIT_TIMEOUT
+            ))
+        except ValueError:
+            raise exceptions.ValidationError(
+                {"timeout": ["A valid integer is required."]}
             )
+
+        return max(0, min(timeout, django_settings.PAYMENT_WAIT_MAX_TIMEOUT))
+
+    @staticmethod
+    def get_payment(identifier, user):
+        try:
+            return Payment.objects.get(identifier=identifier, user=user)
         except Payment.DoesNotExist:
             raise exceptions.NotFound()
 
+    def get_object(self):
+        identifier = self.kwargs.get('identifier')
+        timeout = self.get_timeout(self.request)
+
+        # Respond immediately when too many clients are already waiting.
+        if payment_listener.waiting >= django_settings.PAYMENT_WAIT_MAX_WAITERS:
+            timeout = 0
+
+        with payment_listener.subscribe(identifier) as updated:
+            payment = self.get_payment(identifier, self.request.user)
+
+            if (payment.status == PaymentStatus.PROCESSING
+                    and updated.wait(timeout)):
+                payment.refresh_from_db()
+
+        return payment
+
 
 class UserListPaymentMethodView(ListAPIView):
     serializer_class = PaymentMethodSerializer
     authentication_classes = (UserAuthentication,)
+    throttle_scope = 'payment_methods'
     pagination_class = None
 
     def get_queryset(self):
@@ -319,6 +903,7 @@ class UserListPaymentMethodView(ListAPIView):
 class UserPaymentMethodView(RetrieveAPIView):
     serializer_class = PaymentMethodSerializer
     authentication_classes = (UserAuthentication,)
+    throttle_scope = 'payment_methods'
 
     def get_object(self):
         try: